@@ -0,0 +1,74 @@
+""" Micro-benchmark of the BLP.bdp response parser on synthetic responses. """
+import argparse
+import time
+import pandas as pd
+from blpd import blp
+from blpd.fake import FakeElement
+
+
+def _synthetic(nSecs: int, nFlds: int) -> list:
+    """ Build a list of securityData elements, half numeric, half strings. """
+    output = []
+    for s in range(nSecs):
+        fields = []
+        for f in range(nFlds):
+            if f % 2 == 0:
+                fields.append(FakeElement(f'FLD{f}', f'{s * 0.25 + f}'))
+            else:
+                fields.append(FakeElement(f'FLD{f}', f'NAME {s} {f}'))
+        output.append(FakeElement(None, elements=[
+                      FakeElement('security', f'SEC{s} Equity'),
+                      FakeElement('fieldExceptions', values=[]),
+                      FakeElement('fieldData', elements=fields)]))
+    return(output)
+
+
+def _legacy(securitiesData: list) -> pd.DataFrame:
+    """ Per-cell DataFrame.loc writes, as in the original bdp. """
+    data = pd.DataFrame()
+    for secData in securitiesData:
+        name = secData.getElementAsString('security')
+        for field in secData.getElement('fieldData').elements():
+            value = field.getValueAsString()
+            try:
+                value = pd.to_numeric(value)
+            except ValueError:
+                pass
+            data.loc[name, str(field.name())] = value
+    return(data)
+
+
+def _columnar(securitiesData: list) -> pd.DataFrame:
+    """ Columnar accumulation, as in the current bdp. """
+    table = blp._Table()
+    exceptions = {}
+    for secData in securitiesData:
+        blp._parseReferenceData(secData, table, exceptions)
+    return(table.frame())
+
+
+def _timeit(func, securitiesData: list) -> tuple:
+    """ Time a parser and return elapsed seconds and its output. """
+    start = time.perf_counter()
+    output = func(securitiesData)
+    return(time.perf_counter() - start, output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--secs', type=int, nargs='+', default=[50, 200, 500])
+    parser.add_argument('--flds', type=int, default=20)
+    args = parser.parse_args()
+    print(f'{"secs":>6} {"flds":>6} {"legacy s":>10} {"columnar s":>11} '
+          f'{"speedup":>8}')
+    for nSecs in args.secs:
+        securitiesData = _synthetic(nSecs, args.flds)
+        tLegacy, legacy = _timeit(_legacy, securitiesData)
+        tColumnar, columnar = _timeit(_columnar, securitiesData)
+        pd.testing.assert_frame_equal(legacy, columnar, check_dtype=False)
+        print(f'{nSecs:>6} {args.flds:>6} {tLegacy:>10.3f} {tColumnar:>11.3f} '
+              f'{tLegacy / tColumnar:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
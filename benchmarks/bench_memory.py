@@ -0,0 +1,57 @@
+""" Memory benchmark of the compact layouts of BLP.bdp / BLP.bdh on a local
+FakeSession: deep memory usage of the result frames against the default
+layout, on dense and gappy histories. """
+import argparse
+from blpd import blp, fake
+
+
+CASES = {
+    'bdp_2000x40': ('bdp', 2000, 40, None, 0.),
+    'bdh_100x5_10y': ('bdh', 100, 5, ('20100101', '20191231'), 0.),
+    'bdh_100x5_10y_gaps50': ('bdh', 100, 5, ('20100101', '20191231'), 0.5),
+    'bdh_100x5_10y_gaps80': ('bdh', 100, 5, ('20100101', '20191231'), 0.8),
+}
+LAYOUTS = {
+    'default': {},
+    'compact': {'compact': True},
+    'lossy': {'compact': True, 'lossyFloats': True},
+    'sparse': {'compact': 'sparse'},
+    'long': {'long': True},
+    'long compact': {'long': True, 'compact': True},
+}
+
+
+def run(case: tuple) -> dict:
+    """ Measure the memory of a case in every layout, in MB. """
+    function, nSecs, nFlds, dates, missing = case
+    conn = blp.BLP(session=fake.FakeSession(partialSize=100, missing=missing,
+                   fixtures={'fields': {'FLD1': 'Float32'}}))
+    securities = [f'SEC{i} Equity' for i in range(nSecs)]
+    fields = ['NAME'] + [f'FLD{i}' for i in range(nFlds - 1)]
+    results = {}
+    for layout, options in LAYOUTS.items():
+        if function == 'bdp':
+            if 'long' in options:
+                continue
+            data = conn.bdp(securities, fields, **options)
+        else:
+            data = conn.bdh(securities, fields[1:], *dates, **options)
+        results[layout] = data.memory_usage(deep=True).sum() / 2 ** 20
+    conn.close()
+    return(results)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', nargs='+', default=list(CASES))
+    args = parser.parse_args()
+    print(f'{"case":<22} {"layout":<13} {"MB":>8} {"ratio":>6}')
+    for name in args.cases:
+        results = run(CASES[name])
+        for layout, mb in results.items():
+            print(f'{name:<22} {layout:<13} {mb:>8.2f} '
+                  f'{mb / results["default"]:>6.2f}')
+
+
+if __name__ == '__main__':
+    main()
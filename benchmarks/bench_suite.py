@@ -0,0 +1,88 @@
+""" Benchmark suite of BLP.bdp / BLP.bdh on a local FakeSession: latency,
+throughput and peak memory across universe sizes and date ranges, with an
+optional comparison to a saved baseline. """
+import argparse
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from blpd import blp, fake
+
+
+CASES = {
+    'bdp_100x20': ('bdp', 100, 20, None),
+    'bdp_1000x20': ('bdp', 1000, 20, None),
+    'bdp_2000x40': ('bdp', 2000, 40, None),
+    'bdh_50x5_1y': ('bdh', 50, 5, ('20190101', '20191231')),
+    'bdh_50x5_10y': ('bdh', 50, 5, ('20100101', '20191231')),
+    'bdh_500x2_1y': ('bdh', 500, 2, ('20190101', '20191231')),
+}
+
+
+def _call(conn: blp.BLP, case: tuple):
+    """ Run a benchmark case once. """
+    function, nSecs, nFlds, dates = case
+    securities = [f'SEC{i} Equity' for i in range(nSecs)]
+    fields = ['NAME'] + [f'FLD{i}' for i in range(nFlds - 1)]
+    if function == 'bdp':
+        return(conn.bdp(securities, fields))
+    else:
+        return(conn.bdh(securities, fields[1:] + ['PX_LAST'], *dates))
+
+
+def run(case: tuple, repeat: int) -> dict:
+    """ Measure latency, throughput and peak memory of a case. """
+    conn = blp.BLP(session=fake.FakeSession(partialSize=100))
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = _call(conn, case)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    _call(conn, case)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    latency = statistics.median(timings)
+    cells = int(data.notna().sum().sum())
+    return({'latency': latency, 'cells': cells,
+            'throughput': cells / latency, 'peakMB': peak / 2 ** 20})
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--cases', nargs='+', default=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save', help='save the results as a baseline')
+    parser.add_argument('--baseline', help='compare with a saved baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='relative slowdown / memory growth allowed')
+    args = parser.parse_args()
+    baseline = {}
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = {}
+    regressions = []
+    print(f'{"case":<14} {"latency s":>10} {"cells/s":>12} {"peak MB":>9}')
+    for name in args.cases:
+        results[name] = r = run(CASES[name], args.repeat)
+        flag = ''
+        if name in baseline:
+            for metric in ('latency', 'peakMB'):
+                if r[metric] > baseline[name][metric] * (1 + args.tolerance):
+                    regressions.append((name, metric))
+                    flag = '  REGRESSION'
+        print(f'{name:<14} {r["latency"]:>10.3f} {r["throughput"]:>12,.0f} '
+              f'{r["peakMB"]:>9.1f}{flag}')
+    if args.save is not None:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+    for name, metric in regressions:
+        print(f'{name}: {metric} {results[name][metric]:.3f} vs baseline '
+              f'{baseline[name][metric]:.3f}')
+    sys.exit(1 if len(regressions) > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,285 @@
+import asyncio
+import itertools
+import threading
+import blpapi as blp
+import pandas as pd
+from typing import TYPE_CHECKING, Callable, Union
+from blpd.blp import (BLP, FIELD_DATA, SECURITY_DATA, SESSION_DOWN,
+                      _addHistoricalOptions,
+                      _addOverrides, _createRequests, _fieldTypes, _hits,
+                      _historicalResult, _historicalState,
+                      _parseFieldInfoMessage, _parseHistoricalMessage,
+                      _parseReferenceMessage, _referenceResult,
+                      _referenceState)
+if TYPE_CHECKING:
+    from blpd.cache import FieldCache
+    from blpd.scheduler import Scheduler
+
+
+def _notAsync(name: str) -> Callable:
+    """ Build a method refusing a call that AsyncBLP does not implement. """
+    def method(self, *args, **kwargs):
+        raise NotImplementedError(f'{name} is not available on AsyncBLP, '
+                                  'use a BLP session')
+    method.__name__ = name
+    method.__doc__ = f""" Not available: use BLP.{name}. """
+    return(method)
+
+
+class AsyncBLP(BLP):
+    """ Asynchronous version of BLP: a background dispatcher drains the session
+    events and resolves the pending requests by correlation ID, so that many
+    bdp / bdh calls can share a single session. """
+
+    def __init__(self, host: str='localhost', port: int=8194,
+    verbose: bool=False, start: bool=True, session: blp.Session=None,
+    typed: bool=True, fieldCache: 'FieldCache'=None,
+    scheduler: 'Scheduler'=None, priority: int=1, caller: str=None) -> None:
+        """ Initialize an asynchronous BLP session. """
+        self._pending = {}
+        self._cids = itertools.count(1)
+        self._dispatcher = None
+        super().__init__(host, port, verbose, start, session=session,
+                         typed=typed, fieldCache=fieldCache,
+                         scheduler=scheduler, priority=priority,
+                         caller=caller)
+
+
+    def open(self) -> None:
+        """ Start a BLP session and its event dispatcher. """
+        super().open()
+        if self.active is True and self._dispatcher is None:
+            self._dispatcher = threading.Thread(target=self._dispatch,
+                                                name='AsyncBLP', daemon=True)
+            self._dispatcher.start()
+
+
+    def close(self) -> None:
+        """ End a BLP session, cancelling the pending requests. """
+        if self.active is True:
+            self.active = False
+            if self._dispatcher is not None:
+                self._dispatcher.join()
+                self._dispatcher = None
+            try:
+                for cid in list(self._pending):
+                    call = self._pending.pop(cid, None)
+                    if call is not None:
+                        self._release()
+                        _resolve(call[0], _setCancelled, None)
+            finally:
+                self.session.stop()
+            if self.verbose is True:
+                print('Closing the session...')
+
+
+    def _dispatch(self) -> None:
+        """ Drain the session events, parse each message in the state of its
+        request and resolve the request when its response is complete. """
+        while(self.active is True):
+            ev = self.session.nextEvent(500)
+            if ev.eventType() == blp.Event.SESSION_STATUS:
+                for msg in ev:
+                    if str(msg.messageType()) in SESSION_DOWN:
+                        self._failAll(ConnectionError(str(msg.messageType())))
+                continue
+            done = ev.eventType() in (blp.Event.RESPONSE,
+                                      blp.Event.REQUEST_STATUS)
+            for msg in ev:
+                for cid in msg.correlationIds():
+                    call = self._pending.get(cid)
+                    if call is None:
+                        continue
+                    future, parse, state, element = call
+                    try:
+                        if msg.hasElement(element):
+                            if self.verbose is True:
+                                print(f'{element}: {msg.getElement(element)}')
+                            parse(msg, state)
+                    except Exception as e:
+                        if self._pending.pop(cid, None) is not None:
+                            self._release()
+                            _resolve(future, _setException, e)
+                        continue
+                    if done is True:
+                        if self._pending.pop(cid, None) is not None:
+                            self._release()
+                            _resolve(future, _setResult, state)
+
+
+    def _failAll(self, exception: Exception) -> None:
+        """ Fail all the pending requests, e.g. when the session is down. """
+        for cid in list(self._pending):
+            call = self._pending.pop(cid, None)
+            if call is not None:
+                self._release()
+                _resolve(call[0], _setException, exception)
+
+
+    def _release(self) -> None:
+        """ Tell the scheduler, if any, that a request has ended. """
+        if self.scheduler is not None:
+            self.scheduler.release()
+
+
+    async def _acquire(self, request: blp.Request) -> None:
+        """ Wait for the scheduler in an executor thread; if the call is
+        cancelled meanwhile, the slot is given back once it is taken. """
+        lock = threading.Lock()
+        state = {'cancelled': False, 'acquired': False}
+        def acquire():
+            self.scheduler.acquire(_hits(request), self.priority,
+                                   self.caller)
+            with lock:
+                if state['cancelled'] is True:
+                    self._release()
+                else:
+                    state['acquired'] = True
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, acquire)
+        except asyncio.CancelledError:
+            with lock:
+                state['cancelled'] = True
+                if state['acquired'] is True:
+                    self._release()
+            raise
+
+
+    async def _sendRequest(self, request: blp.Request, parse: Callable,
+    newState: Callable, semaphore: asyncio.Semaphore,
+    element: blp.Name=SECURITY_DATA):
+        """ Send a request and wait for its parsed state. """
+        async with semaphore:
+            if self.scheduler is not None:
+                await self._acquire(request)
+            future = asyncio.get_running_loop().create_future()
+            cid = blp.CorrelationId(next(self._cids))
+            self._pending[cid] = (future, parse, newState(), element)
+            if self.verbose is True:
+                print(f'Sending request: {request}')
+            try:
+                self.session.sendRequest(request, correlationId=cid)
+            except Exception:
+                if self._pending.pop(cid, None) is not None:
+                    self._release()
+                raise
+            if self.verbose is True:
+                print(f'Correlation ID is: {cid}')
+            try:
+                return(await future)
+            finally:
+                if self._pending.pop(cid, None) is not None:
+                    self._release()
+                    self.session.cancel(cid)
+
+
+    async def _sendRequests(self, requests: list, parse: Callable,
+    newState: Callable, maxPending: int=None,
+    element: blp.Name=SECURITY_DATA) -> list:
+        """ Send a list of requests, keeping up to maxPending of them in flight.
+        Return the states in the same order as the requests. """
+        if maxPending is None:
+            maxPending = len(requests)
+        semaphore = asyncio.Semaphore(maxPending)
+        return(list(await asyncio.gather(
+            *[self._sendRequest(r, parse, newState, semaphore, element)
+              for r in requests])))
+
+
+    async def fieldInfo(self, fields: Union['str', 'list']) -> dict:
+        """ Return the datatype of each field (None if invalid), asking
+        //blp/apiflds only for the fields never seen before. """
+        fields, missing = self._missingFields(fields)
+        if len(missing) > 0:
+            request = self._fieldRequest(missing)
+            if request is not None:
+                states = await self._sendRequests([request],
+                                                  _parseFieldInfoMessage, dict,
+                                                  None, FIELD_DATA)
+                self._storeFields(missing, states[0])
+        return({f: self._datatypes.get(f) for f in fields})
+
+
+    async def _types(self, fields: Union['str', 'list']) -> dict:
+        """ Return the dtypes of the fields, empty if typed is False. """
+        if self.typed is False:
+            return({})
+        return(_fieldTypes(await self.fieldInfo(fields)))
+
+
+    async def bdp(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], prefix: Union['str', 'list']='ticker',
+    overrides: dict=None, swap: bool=False, errors: Union[bool, str]=False,
+    chunkSecs: int=None, chunkFlds: int=None,
+    maxPending: int=4) -> pd.DataFrame:
+        """ Send a reference request to Bloomberg (mimicking Excel function
+        BDP). """
+        requests = _createRequests(self.refDataService, 'ReferenceDataRequest',
+                                   securities, fields, prefix,
+                                   lambda r: _addOverrides(r, overrides),
+                                   chunkSecs, chunkFlds)
+        types = await self._types(fields)
+        states = await self._sendRequests(requests, _parseReferenceMessage,
+                                          lambda: _referenceState(types),
+                                          maxPending)
+        return(_referenceResult(states, swap, errors))
+
+
+    async def bdh(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], startDate: str, endDate: str='',
+    prefix: Union['str', 'list']='ticker', cdr: str=None, fx: str=None,
+    dtFmt: bool=False, days: str='W', fill: str='P', per: str='CD',
+    points: int=None, qtTyp: str='Y', quote: str='C', useDPDF: bool=True,
+    cshAdjAbnormal: bool=None, capChg: bool=None, cshAdjNormal: bool=None,
+    overrides: dict=None, swap: bool=False, errors: Union[bool, str]=False,
+    chunkSecs: int=None, chunkFlds: int=None,
+    maxPending: int=4) -> pd.DataFrame:
+        """ Send a historical request to Bloomberg (mimicking Excel function
+        BDH). """
+        options = {'startDate': startDate, 'endDate': endDate, 'cdr': cdr,
+                   'fx': fx, 'dtFmt': dtFmt, 'days': days, 'fill': fill,
+                   'per': per, 'points': points, 'qtTyp': qtTyp,
+                   'quote': quote, 'useDPDF': useDPDF,
+                   'cshAdjAbnormal': cshAdjAbnormal, 'capChg': capChg,
+                   'cshAdjNormal': cshAdjNormal, 'overrides': overrides}
+        requests = _createRequests(self.refDataService, 'HistoricalDataRequest',
+                                   securities, fields, prefix,
+                                   lambda r: _addHistoricalOptions(r, options),
+                                   chunkSecs, chunkFlds)
+        types = await self._types(fields)
+        states = await self._sendRequests(requests, _parseHistoricalMessage,
+                                          lambda: _historicalState(types),
+                                          maxPending)
+        return(_historicalResult(states, swap, errors))
+
+
+    bds = _notAsync('bds')
+    bdib = _notAsync('bdib')
+    bdit = _notAsync('bdit')
+    bdhIter = _notAsync('bdhIter')
+
+
+def _resolve(future: asyncio.Future, setter: Callable, value) -> None:
+    """ Resolve a future from another thread, unless its loop is already
+    closed. """
+    try:
+        future.get_loop().call_soon_threadsafe(setter, future, value)
+    except RuntimeError:
+        pass
+
+
+def _setResult(future: asyncio.Future, state: tuple) -> None:
+    """ Resolve a future unless it was cancelled. """
+    if future.done() is False:
+        future.set_result(state)
+
+
+def _setCancelled(future: asyncio.Future, _) -> None:
+    """ Cancel a future unless it is done. """
+    future.cancel()
+
+
+def _setException(future: asyncio.Future, exception: Exception) -> None:
+    """ Fail a future unless it was cancelled. """
+    if future.done() is False:
+        future.set_exception(exception)
@@ -0,0 +1,108 @@
+""" Arrow output of BLP.bdp / BLP.bdh (output='arrow', 'polars' or 'parquet'):
+the decoded columns are handed to pyarrow as they are, without building a
+pandas frame first. Requires pyarrow (and polars for output='polars'). """
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from blpd.blp import _Table, _column, _exceptionsFrame
+
+
+OUTPUTS = ['arrow', 'polars', 'parquet']
+
+
+def _array(cells: np.ndarray) -> pa.Array:
+    """ Convert a decoded column to Arrow, with nulls for the missing cells;
+    columns mixing strings and numbers become strings. """
+    if cells.dtype == object:
+        mask = np.asarray(pd.isna(cells), dtype=bool)
+        return(pa.array(cells.astype(str), mask=mask, type=pa.string()))
+    return(pa.array(cells, from_pandas=True))
+
+
+def _arrays(table: _Table) -> dict:
+    """ Convert the columns of a table to Arrow. """
+    return({column: _array(_column(values, positions, len(table.rows),
+            table.types.get(column)))
+            for column, (positions, values) in table.columns.items()})
+
+
+def _securities(name: str, n: int) -> pa.DictionaryArray:
+    """ Build a dictionary-encoded column repeating a security n times. """
+    return(pa.DictionaryArray.from_arrays(pa.array(np.zeros(n, np.int32)),
+                                          pa.array([name])))
+
+
+def _convert(table: pa.Table, output: str, path: str):
+    """ Return an Arrow table as asked: as it is, as a Polars frame or
+    written to a Parquet file (returning its path). """
+    if output == 'arrow':
+        return(table)
+    elif output == 'polars':
+        import polars as pl
+        return(pl.from_arrow(table))
+    else:
+        import pyarrow.parquet as pq
+        pq.write_table(table, path)
+        return(path)
+
+
+def referenceArrow(table: _Table, exceptions: dict, output: str, path: str,
+errors: bool):
+    """ Build the output of a merged reference response: a security column
+    and a column per field. """
+    columns = {'security': pa.array(list(table.rows), pa.string())}
+    columns.update(_arrays(table))
+    data = _convert(pa.table(columns), output, path)
+    if errors is False:
+        return(data)
+    else:
+        return(data, _exceptionsFrame(exceptions, errors))
+
+
+def _historicalBatch(name: str, table: _Table, long: bool) -> list:
+    """ Build the Arrow tables of a security, sorted by date: one with date,
+    security and a column per field, or one per field with date, security,
+    field and value columns if long. """
+    dates = np.array(list(table.rows), dtype='datetime64[D]')
+    order = np.argsort(dates, kind='stable')
+    dates = pa.array(dates[order])
+    arrays = {k: v.take(pa.array(order)) for k, v in _arrays(table).items()}
+    if long is False:
+        columns = {'date': dates, 'security': _securities(name, len(dates))}
+        columns.update(arrays)
+        return([pa.table(columns)])
+    batches = []
+    for field, values in arrays.items():
+        valid = values.is_valid()
+        n = valid.true_count
+        batches.append(pa.table({'date': dates.filter(valid),
+                       'security': _securities(name, n),
+                       'field': pa.DictionaryArray.from_arrays(
+                       pa.array(np.zeros(n, np.int32)), pa.array([field])),
+                       'value': values.filter(valid)}))
+    return(batches)
+
+
+def historicalArrow(tables: dict, exceptions: dict, output: str, path: str,
+errors: bool, long: bool):
+    """ Build the output of merged historical responses, in tidy-wide (date,
+    security, fields) or long (date, security, field, value) layout. """
+    batches = [batch for name, table in tables.items()
+               for batch in _historicalBatch(name, table, long)]
+    if long is True and len(batches) > 0:
+        numeric = all(pa.types.is_integer(b['value'].type) or
+                      pa.types.is_floating(b['value'].type) or
+                      pa.types.is_null(b['value'].type) for b in batches)
+        kind = pa.float64() if numeric else pa.string()
+        batches = [b.set_column(3, 'value', b['value'].cast(kind))
+                   for b in batches]
+    if len(batches) == 0:
+        data = pa.table({'date': pa.array([], pa.date32()),
+                         'security': pa.array([], pa.string())})
+    else:
+        data = pa.concat_tables(batches, promote_options='default')
+    data = _convert(data, output, path)
+    if errors is False:
+        return(data)
+    else:
+        return(data, _exceptionsFrame(exceptions, errors))
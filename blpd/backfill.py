@@ -0,0 +1,247 @@
+""" Multi-process backfill of long histories: the securities x dates space is
+split in work units run by a pool of processes, each with its own BLP
+session; every unit is written to its own file in a partitioned store as
+soon as it is done, and a manifest records the finished and failed units so
+that an interrupted backfill resumes where it stopped. """
+import hashlib
+import json
+import os
+import time
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Union
+from blpd.blp import BLP, basestring, _chunks, _formatSecsList
+
+
+_conn = None
+
+
+def _initWorker(host: str, port: int, session: Callable, options: dict) -> None:
+    """ Open the BLP session of a worker process. """
+    global _conn
+    _conn = BLP(host, port, session=None if session is None else session(),
+                **options)
+
+
+def _runUnit(unit: dict, fields: list, path: str, fmt: str,
+bdhOptions: dict) -> tuple:
+    """ Fetch a work unit in long layout and write it to its partition file;
+    return the unit ID, the number of rows, the exceptions and the time. """
+    start = time.perf_counter()
+    folder = os.path.join(path, f'start={unit["start"]}')
+    os.makedirs(folder, exist_ok=True)
+    target = os.path.join(folder, f'part-{unit["id"]}.{fmt}')
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        data, exceptions = _conn.bdh(unit['securities'], fields, unit['start'],
+                                     unit['end'], long=True, errors='fields',
+                                     output='arrow', **bdhOptions)
+        rows = data.num_rows
+        pq.write_table(data, target + '.tmp')
+    else:
+        data, exceptions = _conn.bdh(unit['securities'], fields, unit['start'],
+                                     unit['end'], long=True, errors='fields',
+                                     **bdhOptions)
+        rows = len(data)
+        data.to_pickle(target + '.tmp', compression=None)
+    os.replace(target + '.tmp', target)
+    errors = [] if len(exceptions) == 0 else \
+        [[s, *r] for s, r in exceptions.astype(object).where(
+         exceptions.notna(), None).iterrows()]
+    return((unit['id'], rows, errors, time.perf_counter() - start))
+
+
+def _dateChunks(startDate: str, endDate: str, years: int) -> list:
+    """ Split a YYYYMMDD date range in ranges of some years. """
+    start = pd.Timestamp(startDate)
+    end = pd.Timestamp(endDate)
+    ranges = []
+    while(start <= end):
+        last = min(end, start + pd.DateOffset(years=years) -
+                   pd.Timedelta(days=1))
+        ranges.append((start.strftime('%Y%m%d'), last.strftime('%Y%m%d')))
+        start = last + pd.Timedelta(days=1)
+    return(ranges)
+
+
+class Backfill():
+    """ Driver of a historical backfill over a process pool. """
+
+    def __init__(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], startDate: str, endDate: str, path: str,
+    prefix: Union['str', 'list']='ticker', chunkSecs: int=100,
+    chunkYears: int=5, processes: int=4, host: str='localhost',
+    port: int=8194, session: Callable=None, fmt: str='parquet',
+    progress: Callable=None, options: dict=None, **bdhOptions) -> None:
+        """ Define a backfill of fields between startDate and endDate (as
+        YYYYMMDD) into the store at path, in work units of chunkSecs
+        securities and chunkYears years. Each of the processes workers (0 to
+        run in this process) opens a BLP on host:port, or on session() if a
+        session factory (e.g. fake.FakeSession) is given, with the BLP
+        options; bdhOptions are passed to every BLP.bdh call. fmt is
+        'parquet' (requires pyarrow) or 'pickle'; progress(stats) is called
+        after every unit. """
+        if isinstance(securities, basestring):
+            securities = [securities]
+        if isinstance(fields, basestring):
+            fields = [fields]
+        self.securities = _formatSecsList(securities, prefix)
+        self.fields = fields
+        self.path = path
+        self.processes = processes
+        self.host = host
+        self.port = port
+        self.session = session
+        self.fmt = fmt
+        self.progress = progress
+        self.options = {} if options is None else options
+        self.bdhOptions = bdhOptions
+        self.units = [{'id': f'{i:05d}', 'securities': secs, 'start': start,
+                       'end': end} for i, (secs, (start, end)) in enumerate(
+                      (secs, dates) for dates in _dateChunks(startDate,
+                      endDate, chunkYears) for secs in _chunks(
+                      self.securities, chunkSecs))]
+        self.key = hashlib.sha1(json.dumps([self.units, fields, fmt,
+                                sorted(bdhOptions.items())], default=str)
+                                .encode()).hexdigest()
+        self.manifest = self._loadManifest()
+        self.stats = {}
+
+
+    def _loadManifest(self) -> Union[dict, None]:
+        """ Read the manifest of the store, or start a new one; None if the
+        store holds another backfill. """
+        manifest = {'key': self.key, 'done': {}, 'failed': {}, 'errors': []}
+        try:
+            with open(os.path.join(self.path, 'manifest.json')) as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return(manifest)
+        if saved['key'] != self.key:
+            return(None)
+        saved.setdefault('failed', {})
+        return(saved)
+
+
+    def _saveManifest(self) -> None:
+        """ Write the manifest atomically. """
+        target = os.path.join(self.path, 'manifest.json')
+        with open(target + '.tmp', 'w') as f:
+            json.dump(self.manifest, f)
+        os.replace(target + '.tmp', target)
+
+
+    def pending(self) -> list:
+        """ Return the units not done yet. """
+        return([u for u in self.units if u['id'] not in self.manifest['done']])
+
+
+    def _update(self, result: tuple, start: float) -> None:
+        """ Record a finished unit and report the progress. """
+        unitId, rows, errors, seconds = result
+        self.manifest['done'][unitId] = {'rows': rows, 'seconds': seconds}
+        self.manifest['failed'].pop(unitId, None)
+        self.manifest['errors'].extend(errors)
+        self._saveManifest()
+        self.stats['done'] += 1
+        self.stats['rows'] += rows
+        self._report(start)
+
+
+    def _fail(self, unitId: str, error: Exception, start: float) -> None:
+        """ Record a failed unit, left pending for the next run, and report
+        the progress. """
+        self.manifest['failed'][unitId] = f'{type(error).__name__}: {error}'
+        self._saveManifest()
+        self.stats['failed'] += 1
+        self._report(start)
+
+
+    def _report(self, start: float) -> None:
+        """ Update the rates and the ETA and pass them to progress. """
+        elapsed = time.perf_counter() - start
+        finished = self.stats['done'] + self.stats['failed']
+        self.stats['elapsed'] = elapsed
+        self.stats['rowsPerSecond'] = self.stats['rows'] / elapsed
+        self.stats['unitsPerSecond'] = finished / elapsed
+        left = self.stats['total'] - finished - self.stats['skipped']
+        self.stats['eta'] = left / self.stats['unitsPerSecond']
+        if self.progress is not None:
+            self.progress(dict(self.stats))
+
+
+    def run(self) -> dict:
+        """ Run the pending units and return the statistics. A unit that
+        raises is recorded in the failed units of the manifest and retried by
+        the next run; if the process pool itself breaks, the units not
+        started are cancelled and the error is raised. """
+        if self.manifest is None:
+            print('The store holds a different backfill.') # Raise error
+            return({})
+        os.makedirs(self.path, exist_ok=True)
+        pending = self.pending()
+        self.stats = {'total': len(self.units), 'skipped': len(self.units) -
+                      len(pending), 'done': 0, 'failed': 0, 'rows': 0,
+                      'elapsed': 0.,
+                      'rowsPerSecond': 0., 'unitsPerSecond': 0., 'eta': None}
+        start = time.perf_counter()
+        args = (self.fields, self.path, self.fmt, self.bdhOptions)
+        initargs = (self.host, self.port, self.session, self.options)
+        if self.processes == 0:
+            _initWorker(*initargs)
+            try:
+                for unit in pending:
+                    try:
+                        result = _runUnit(unit, *args)
+                    except Exception as e:
+                        self._fail(unit['id'], e, start)
+                    else:
+                        self._update(result, start)
+            finally:
+                _conn.close()
+        else:
+            with ProcessPoolExecutor(self.processes, initializer=_initWorker,
+                                     initargs=initargs) as executor:
+                futures = {executor.submit(_runUnit, unit, *args): unit['id']
+                           for unit in pending}
+                try:
+                    for future in as_completed(futures):
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool:
+                            raise
+                        except Exception as e:
+                            self._fail(futures[future], e, start)
+                        else:
+                            self._update(result, start)
+                except BaseException:
+                    for future in futures:
+                        future.cancel()
+                    raise
+        return(self.stats)
+
+
+    def read(self) -> pd.DataFrame:
+        """ Read the finished units in one long frame (date, security, field
+        and value) sorted by security, field and date. """
+        frames = []
+        for unit in self.units:
+            if unit['id'] not in self.manifest['done']:
+                continue
+            target = os.path.join(self.path, f'start={unit["start"]}',
+                                  f'part-{unit["id"]}.{self.fmt}')
+            if self.fmt == 'parquet':
+                import pyarrow.parquet as pq
+                frames.append(pq.read_table(target).to_pandas())
+            else:
+                frames.append(pd.read_pickle(target, compression=None))
+        if len(frames) == 0:
+            return(pd.DataFrame(columns=['date', 'security', 'field',
+                                         'value']))
+        data = pd.concat(frames, ignore_index=True)
+        for column in ('security', 'field'):
+            data[column] = data[column].astype(str)
+        data['date'] = pd.to_datetime(data['date'])
+        return(data.sort_values(['security', 'field', 'date'],
+                                ignore_index=True))
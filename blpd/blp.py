@@ -1,6 +1,31 @@
+from __future__ import annotations
+import datetime
+import importlib.util
+import sys
+import time
 import blpapi as blp
-import pandas as pd
-from typing import Union
+from typing import TYPE_CHECKING, Callable, Union
+if TYPE_CHECKING:
+    from blpd.cache import FieldCache, ReferenceCache
+    from blpd.scheduler import Scheduler
+
+
+def _lazyImport(name: str):
+    """ Import a module on the first access to one of its attributes, so that
+    the scripts that never build a DataFrame do not pay for it. """
+    module = sys.modules.get(name)
+    if module is not None:
+        return(module)
+    spec = importlib.util.find_spec(name)
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return(module)
+
+
+np = _lazyImport('numpy')
+pd = _lazyImport('pandas')
 
 
 basestring = (str, bytes)
@@ -8,6 +33,8 @@ basestring = (str, bytes)
 
 SECURITY_DATA = blp.Name('securityData')
 SECURITY = blp.Name('security')
+SECURITIES = blp.Name('securities')
+FIELDS = blp.Name('fields')
 FIELD_DATA = blp.Name('fieldData')
 FIELD_EXCEPTIONS = blp.Name('fieldExceptions')
 FIELD_ID = blp.Name('fieldId')
@@ -17,6 +44,30 @@ OVERRIDES = blp.Name('overrides')
 CATEGORY = blp.Name('category')
 MESSAGE = blp.Name('message')
 SUBCATEGORY = blp.Name('subcategory')
+RESPONSE_ERROR = blp.Name('responseError')
+BAR_DATA = blp.Name('barData')
+BAR_TICK_DATA = blp.Name('barTickData')
+TICK_DATA = blp.Name('tickData')
+TIME = blp.Name('time')
+ID = blp.Name('id')
+FIELD_INFO = blp.Name('fieldInfo')
+MNEMONIC = blp.Name('mnemonic')
+DATATYPE = blp.Name('datatype')
+BAR_FIELDS = [('open', float), ('high', float), ('low', float),
+              ('close', float), ('volume', int), ('numEvents', int),
+              ('value', float)]
+TICK_FIELDS = [('type', object), ('value', float), ('size', int),
+               ('conditionCodes', object), ('exchangeCode', object)]
+SESSION_DOWN = ('SessionTerminated', 'SessionConnectionDown')
+DATATYPES = {'Float32': float, 'Float64': float, 'Double': float,
+             'Int32': int, 'Int64': int, 'Date': 'datetime64[ns]',
+             'Datetime': 'datetime64[ns]', 'String': object, 'Char': object,
+             'Enumeration': object, 'Time': object}
+ELEMENT_TYPES = {blp.DataType.FLOAT32: float, blp.DataType.FLOAT64: float,
+                 blp.DataType.INT32: int, blp.DataType.INT64: int,
+                 blp.DataType.DATE: 'datetime64[ns]',
+                 blp.DataType.DATETIME: 'datetime64[ns]'}
+EXCEPTION_COLUMNS = ['Field', 'Category', 'Subcategory', 'Message']
 
 
 def _formatSecurity(security: str, prefix: str) -> str:
@@ -48,16 +99,759 @@ def _formatSecsList(securities: list, prefix: Union[str, list]) -> list:
     return(output)
 
 
+def _chunks(items: list, size: Union[int, None]) -> list:
+    """ Split a list in chunks of a given size (a single chunk if None). """
+    if size is None or size >= len(items):
+        return([items])
+    else:
+        return([items[i:i + size] for i in range(0, len(items), size)])
+
+
+def _toNumeric(values: np.ndarray) -> np.ndarray:
+    """ Convert a column of strings to numbers in one pass, leaving the cells
+    that are not numeric untouched. """
+    strings = pd.Series(values, dtype=object)
+    numbers = pd.to_numeric(strings, errors='coerce')
+    failed = numbers.isna() & strings.notna()
+    if not failed.any():
+        return(numbers.to_numpy(dtype=float))
+    else:
+        return(strings.where(failed, numbers).to_numpy())
+
+
+def _toNumber(value: str) -> object:
+    """ Read a string as a number, leaving it untouched if it is not one. """
+    try:
+        return(float(value))
+    except (TypeError, ValueError):
+        return(value)
+
+
+def _getValue(element: blp.Element, dtype) -> object:
+    """ Read the value of an element with the accessor of its dtype, as a
+    string if the dtype is unknown. """
+    if dtype is float:
+        return(element.getValueAsFloat())
+    elif dtype is int:
+        return(element.getValueAsInteger())
+    elif dtype == 'datetime64[ns]':
+        return(element.getValueAsDatetime())
+    else:
+        return(element.getValueAsString())
+
+
+def _column(values: list, positions: list, n: int, dtype) -> np.ndarray:
+    """ Build a column of n cells of a dtype (guessed from strings if None);
+    integer columns with missing cells are stored as floats. """
+    if dtype is None:
+        cells = np.full(n, np.nan, dtype=object)
+        cells[positions] = values
+        return(_toNumeric(cells))
+    elif dtype == 'datetime64[ns]':
+        cells = np.full(n, np.datetime64('NaT'), dtype=dtype)
+        cells[positions] = pd.to_datetime(values).to_numpy(dtype=dtype)
+        return(cells)
+    elif dtype is int and len(positions) == n:
+        cells = np.empty(n, dtype=np.int64)
+    else:
+        cells = np.full(n, np.nan, dtype=float if dtype is int else dtype)
+    cells[positions] = values
+    return(cells)
+
+
+class _Table():
+    """ Accumulate cells column by column and build a DataFrame once. """
+
+    def __init__(self, types: dict=None) -> None:
+        """ Initialize an empty table; types maps the columns whose dtype is
+        known to it, the others are guessed from their strings. """
+        self.rows = {}
+        self.columns = {}
+        self.types = {} if types is None else types
+
+
+    def add(self, row: str, column: str, value: str) -> None:
+        """ Store a single cell. """
+        position = self.rows.setdefault(row, len(self.rows))
+        try:
+            cells = self.columns[column]
+        except KeyError:
+            cells = self.columns[column] = ([], [])
+        cells[0].append(position)
+        cells[1].append(value)
+
+
+    def frame(self) -> pd.DataFrame:
+        """ Build the DataFrame, converting each column at once. """
+        if len(self.columns) == 0:
+            return(pd.DataFrame())
+        data = {column: _column(values, positions, len(self.rows),
+                                self.types.get(column))
+                for column, (positions, values) in self.columns.items()}
+        return(pd.DataFrame(data, index=pd.Index(list(self.rows))))
+
+
+    def records(self) -> dict:
+        """ Return the cells as a dict of rows, each a dict of columns, with
+        neither NumPy nor pandas; strings of unknown dtype are read as
+        numbers where possible. """
+        rows = list(self.rows)
+        data = {row: {} for row in rows}
+        for column, (positions, values) in self.columns.items():
+            typed = column in self.types
+            for position, value in zip(positions, values):
+                data[rows[position]][column] = value if typed is True \
+                    else _toNumber(value)
+        return(data)
+
+
+    def extend(self, other: '_Table') -> None:
+        """ Append the cells of another table, overwriting common cells. """
+        rows = list(other.rows)
+        for column, (positions, values) in other.columns.items():
+            for position, value in zip(positions, values):
+                self.add(rows[position], column, value)
+
+
+def _addException(exceptions: dict, name: str, fieldId: Union[str, None],
+error: blp.Element) -> None:
+    """ Store a security or field exception, keyed by security and field. """
+    exceptions[(name, fieldId)] = [fieldId,
+                                   error.getElementAsString(CATEGORY),
+                                   error.getElementAsString(SUBCATEGORY),
+                                   error.getElementAsString(MESSAGE)]
+
+
+def _bySecurity(exceptions: dict) -> dict:
+    """ Keep the last exception of each security. """
+    rows = {}
+    for (name, _), row in exceptions.items():
+        rows[name] = row
+    return(rows)
+
+
+def _exceptionsFrame(exceptions: dict,
+errors: Union[bool, str]=True) -> pd.DataFrame:
+    """ Build the exceptions DataFrame, with a row per security (its last
+    exception), or with errors='fields' a row per security or field
+    exception, indexed by security. """
+    if len(exceptions) == 0:
+        return(pd.DataFrame())
+    if errors == 'fields':
+        return(pd.DataFrame(list(exceptions.values()),
+               index=[name for name, _ in exceptions],
+               columns=EXCEPTION_COLUMNS))
+    return(pd.DataFrame.from_dict(_bySecurity(exceptions), orient='index',
+           columns=EXCEPTION_COLUMNS))
+
+
+def _exceptionsDict(exceptions: dict, errors: Union[bool, str]=True) -> dict:
+    """ Build the exceptions as a dict of securities, each a dict of the
+    exception columns, or with errors='fields' a list of them. """
+    if errors == 'fields':
+        output = {}
+        for (name, _), row in exceptions.items():
+            output.setdefault(name, []).append(dict(zip(EXCEPTION_COLUMNS,
+                                                        row)))
+        return(output)
+    return({name: dict(zip(EXCEPTION_COLUMNS, row))
+            for name, row in _bySecurity(exceptions).items()})
+
+
+def _exceptionsRows(exceptions: pd.DataFrame) -> dict:
+    """ Convert an exceptions DataFrame of errors='fields' back to its rows,
+    keyed by security and field (None for a security error). """
+    if len(exceptions) == 0:
+        return({})
+    return({(security, row[0] if pd.notna(row[0]) else None): row
+            for security, row in zip(exceptions.index, exceptions.itertuples(
+            index=False, name=None))})
+
+
+def _parseExceptions(secData: blp.Element, name: str, exceptions: dict,
+log: list=None) -> None:
+    """ Parse the security and field exceptions of a securityData element; if
+    a log is given, every exception is also appended to it with its field. """
+    if secData.hasElement(SECURITY_ERROR):
+        _addException(exceptions, name, None,
+                      secData.getElement(SECURITY_ERROR))
+        if log is not None:
+            log.append((name, None, exceptions[(name, None)]))
+    fieldsException = secData.getElement(FIELD_EXCEPTIONS)
+    for fieldEx in fieldsException.values():
+        if fieldEx.hasElement(FIELD_ID):
+            fieldId = fieldEx.getElementAsString(FIELD_ID)
+            _addException(exceptions, name, fieldId,
+                          fieldEx.getElement(ERROR_INFO))
+            if log is not None:
+                log.append((name, fieldId, exceptions[(name, fieldId)]))
+
+
+def _parseReferenceData(secData: blp.Element, table: _Table,
+exceptions: dict, log: list=None) -> None:
+    """ Parse a securityData element of a reference response. """
+    name = secData.getElementAsString(SECURITY)
+    fieldsData = secData.getElement(FIELD_DATA)
+    for field in fieldsData.elements():
+        column = str(field.name())
+        table.add(name, column, _getValue(field, table.types.get(column)))
+    _parseExceptions(secData, name, exceptions, log)
+
+
+def _parseBulkData(secData: blp.Element, table: _Table, exceptions: dict,
+log: list=None) -> None:
+    """ Parse a securityData element of a bulk reference response, one table
+    row per security and row of the bulk field, each column typed from the
+    datatype of its first element. """
+    name = secData.getElementAsString(SECURITY)
+    fieldsData = secData.getElement(FIELD_DATA)
+    for field in fieldsData.elements():
+        if field.isArray() is False:
+            continue
+        for i, row in enumerate(field.values()):
+            for item in row.elements():
+                column = str(item.name())
+                if column not in table.types:
+                    table.types[column] = ELEMENT_TYPES.get(item.datatype(),
+                                                            object)
+                table.add((name, i), column, _getValue(item,
+                          table.types[column]))
+    _parseExceptions(secData, name, exceptions, log)
+
+
+def _parseHistoricalData(secData: blp.Element, tables: dict,
+exceptions: dict, types: dict=None) -> None:
+    """ Parse the securityData element of a historical response into a table
+    per security, keyed by date string. """
+    name = secData.getElementAsString(SECURITY)
+    _parseExceptions(secData, name, exceptions)
+    fieldsData = secData.getElement(FIELD_DATA)
+    if fieldsData.numValues() == 0:
+        return()
+    table = tables.setdefault(name, _Table(types))
+    for fData in fieldsData.values():
+        for field in fData.elements():
+            column = str(field.name())
+            if column == 'date':
+                date = field.getValueAsString()
+            else:
+                table.add(date, column, _getValue(field,
+                          table.types.get(column)))
+
+
+def _historicalFrame(table: _Table) -> pd.DataFrame:
+    """ Build a security block of a historical response, converting all the
+    dates at once. """
+    df = table.frame()
+    df.index = pd.to_datetime(df.index, format='%Y-%m-%d')
+    return(df.sort_index())
+
+
+def _addSecurities(request: blp.Request, securities: list) -> None:
+    """ Add a list of formatted securities to a request. """
+    for sec in securities:
+        request.append('securities', sec)
+
+
+def _addFields(request: blp.Request, fields: list) -> None:
+    """ Add a list of fields to a request. """
+    for fld in fields:
+        request.append('fields', fld)
+
+
+def _addDays(request: blp.Request, options: dict) -> None:
+    """ Add fill days options to a historical request. """
+    days = {'A': 'ALL_CALENDAR_DAYS',
+            'T': 'ACTIVE_DAYS_ONLY',
+            'W': 'NON_TRADING_WEEKDAYS'}
+    try:
+        request.set('nonTradingDayFillOption', days[options['days']])
+    except KeyError:
+        print('Options are A / T / W')
+
+
+def _addFill(request: blp.Request, options: dict) -> None:
+    """ Add fill method options to a historical request. """
+    fill = {'N': 'NIL_VALUE',
+            'P': 'PREVIOUS_VALUE'}
+    try:
+        request.set('nonTradingDayFillMethod', fill[options['fill']])
+    except KeyError:
+        print('Options are N / P')
+
+
+def _addPeriod(request: blp.Request, options: dict) -> None:
+    """ Add periodicity options to a historical request. """
+    optionsAdj = {'A': 'ACTUAL',
+                  'C': 'CALENDAR',
+                  'F': 'FISCAL'}
+    optionsSel = {'D': 'DAILY',
+                  'M': 'MONTHLY',
+                  'Q': 'QUARTERLY',
+                  'S': 'SEMI_ANNUALLY',
+                  'W': 'WEEKLY',
+                  'Y': 'YEARLY'}
+    try:
+        request.set('periodicityAdjustment', optionsAdj[options['per'][0]])
+        request.set('periodicitySelection', optionsSel[options['per'][1]])
+    except KeyError:
+        print('Options are A / C / F and D / M / Q / S / W / Y')
+
+
+def _addQuoteType(request: blp.Request, options: dict) -> None:
+    """ Add quote type options to a historical request. """
+    qtTyp = {'P': 'PRICING_OPTION_PRICE',
+             'Y': 'PRICING_OPTION_YIELD'}
+    try:
+        request.set('pricingOption', qtTyp[options['qtTyp']])
+    except KeyError:
+        print('Options are P / Y')
+
+
+def _addQuote(request: blp.Request, options: dict) -> None:
+    """ Add quote options to a historical request. """
+    quote = {'C': 'OVERRIDE_OPTION_CLOSE',
+             'G': 'OVERRIDE_OPTION_GPA'}
+    try:
+        request.set('overrideOption', quote[options['quote']])
+    except KeyError:
+        print('Options are C / G')
+
+
+def _addMandatoryOptions(request: blp.Request, options: dict) -> None:
+    """ Add mandatory options to a historical request. """
+    request.set('returnRelativeDate', options['dtFmt'])
+    _addDays(request, options)
+    _addFill(request, options)
+    _addPeriod(request, options)
+    _addQuoteType(request, options)
+    _addQuote(request, options)
+    request.set('adjustmentFollowDPDF', options['useDPDF'])
+
+
+def _addFacultativeOptions(request: blp.Request, options: dict) -> None:
+    """ Add facultative options to a historical request. """
+    facultative = {'cdr': 'calendarCodeOverride',
+                   'fx': 'currency',
+                   'points': 'maxDataPoints',
+                   'cshAdjAbnormal': 'adjustmentAbnormal',
+                   'capChg': 'adjustmentSplit',
+                   'cshAdjNormal': 'adjustmentNormal'}
+    for key, name in facultative.items():
+        if options[key] is None:
+            pass
+        else:
+            request.set(name, options[key])
+
+
+def _addOverrides(request: blp.Request, overrides: dict) -> None:
+    """ Manage request arguments. """
+    if overrides is None:
+        pass
+    elif isinstance(overrides, dict):
+        element = request.getElement(OVERRIDES)
+        oslist = []
+        for key, value in overrides.items():
+            oslist.append(element.appendElement())
+            oslist[-1].setElement(FIELD_ID, key)
+            oslist[-1].setElement('value', value)
+    else:
+        print('Overrides must be a dict') # Raise error
+
+
+def _addHistoricalOptions(request: blp.Request, options: dict) -> None:
+    """ Add dates and all the options to a historical request. """
+    request.set('startDate', options['startDate'])
+    request.set('endDate', options['endDate'])
+    _addMandatoryOptions(request, options)
+    _addFacultativeOptions(request, options)
+    _addOverrides(request, options['overrides'])
+
+
+def _hits(request: blp.Request) -> int:
+    """ Count the security x field hits of a request (1 if it has neither). """
+    element = request.asElement()
+    hits = 1
+    for name in (SECURITIES, FIELDS):
+        if element.hasElement(name):
+            hits *= max(1, element.getElement(name).numValues())
+    return(hits)
+
+
+def _createRequests(service: blp.Service, requestType: str,
+securities: Union[str, list], fields: Union[str, list],
+prefix: Union[str, list], addOptions: Callable, chunkSecs: int=None,
+chunkFlds: int=None) -> list:
+    """ Create a request for each chunk of securities and fields; addOptions is
+    called on every request to set its options. """
+    if isinstance(securities, basestring):
+        securities = [securities]
+    if isinstance(fields, basestring):
+        fields = [fields]
+    requests = []
+    for secs in _chunks(_formatSecsList(securities, prefix), chunkSecs):
+        for flds in _chunks(fields, chunkFlds):
+            request = service.createRequest(requestType)
+            _addSecurities(request, secs)
+            _addFields(request, flds)
+            addOptions(request)
+            requests.append(request)
+    return(requests)
+
+
+def _referenceState(types: dict=None) -> tuple:
+    """ Create the parsing state of a reference request. """
+    return((_Table(types), {}, []))
+
+
+def _parseReferenceMessage(msg: blp.Message, state: tuple) -> None:
+    """ Parse a message of a reference response. """
+    for secData in msg.getElement(SECURITY_DATA).values():
+        _parseReferenceData(secData, *state)
+
+
+def _parseBulkMessage(msg: blp.Message, state: tuple) -> None:
+    """ Parse a message of a bulk reference response. """
+    for secData in msg.getElement(SECURITY_DATA).values():
+        _parseBulkData(secData, *state)
+
+
+def _mergeReference(states: list) -> tuple:
+    """ Merge the states of the reference requests in chunk order. """
+    table, exceptions, _ = states[0]
+    for chunkTable, chunkExceptions, _ in states[1:]:
+        table.extend(chunkTable)
+        exceptions.update(chunkExceptions)
+    return((table, exceptions))
+
+
+def _referenceResult(states: list, swap: bool, errors: Union[bool, str]):
+    """ Merge the states of the reference requests in a DataFrame. """
+    table, exceptions = _mergeReference(states)
+    data = table.frame()
+    exceptions = _exceptionsFrame(exceptions, errors)
+    if swap is False:
+        if errors is False:
+            return(data)
+        else:
+            return(data, exceptions)
+    else:
+        if errors is False:
+            return(data.T)
+        else:
+            return(data.T, exceptions)
+
+
+def _referenceDict(states: list, swap: bool, errors: Union[bool, str]):
+    """ Merge the states of the reference requests in a dict of securities,
+    each a dict of fields (the other way round with swap). """
+    table, exceptions = _mergeReference(states)
+    data = table.records()
+    if swap is True:
+        data = {column: {row: cells[column] for row, cells in data.items()
+                         if column in cells} for column in table.columns}
+    if errors is False:
+        return(data)
+    else:
+        return(data, _exceptionsDict(exceptions, errors))
+
+
+def _historicalState(types: dict=None) -> tuple:
+    """ Create the parsing state of a historical request. """
+    return(({}, {}, types))
+
+
+def _parseHistoricalMessage(msg: blp.Message, state: tuple) -> None:
+    """ Parse a message of a historical response. """
+    _parseHistoricalData(msg.getElement(SECURITY_DATA), *state)
+
+
+def _mergeHistorical(states: list) -> tuple:
+    """ Merge the states of the historical requests in chunk order. """
+    tables, exceptions, types = states[0]
+    for chunkTables, chunkExceptions, _ in states[1:]:
+        for name, chunkTable in chunkTables.items():
+            tables.setdefault(name, _Table(types)).extend(chunkTable)
+        exceptions.update(chunkExceptions)
+    return((tables, exceptions))
+
+
+def _historicalResult(states: list, swap: bool, errors: Union[bool, str],
+long: bool=False):
+    """ Merge the states of the historical requests in a DataFrame, wide (a
+    column per security and field) or long (date, security, field and value
+    columns). """
+    tables, exceptions = _mergeHistorical(states)
+    exceptions = _exceptionsFrame(exceptions, errors)
+    if long is True:
+        frames = [_longFrame(_historicalFrame(table), name)
+                  for name, table in tables.items()]
+        if len(frames) > 0:
+            data = pd.concat(frames, ignore_index=True)
+        else:
+            data = pd.DataFrame(columns=['date', 'security', 'field', 'value'])
+        if errors is False:
+            return(data)
+        else:
+            return(data, exceptions)
+    datadict = {name: _historicalFrame(table)
+                for name, table in tables.items()}
+    if len(datadict) == 0:
+        data = pd.DataFrame()
+        if errors is False:
+            return(data)
+        else:
+            return(data, exceptions)
+    data = pd.concat(datadict.values(), keys=datadict.keys(), axis=1)
+    if swap is False:
+        if errors is False:
+            return(data)
+        else:
+            return(data, exceptions)
+    else:
+        if errors is False:
+            return(data.swaplevel(axis=1))
+        else:
+            return(data.swaplevel(axis=1), exceptions)
+
+
+def _historicalDict(states: list, errors: Union[bool, str],
+long: bool=False):
+    """ Merge the states of the historical requests in a dict of securities,
+    each a dict of lists (date and a list per field, None where a cell is
+    missing); with long=True a dict of date, security, field and value
+    lists. """
+    tables, exceptions = _mergeHistorical(states)
+    data = {}
+    for name, table in tables.items():
+        records = table.records()
+        dates = sorted(records)
+        data[name] = {'date': [datetime.date.fromisoformat(d) for d in dates]}
+        for column in table.columns:
+            data[name][column] = [records[d].get(column) for d in dates]
+    if long is True:
+        columns = {'date': [], 'security': [], 'field': [], 'value': []}
+        for name, block in data.items():
+            for column, values in list(block.items())[1:]:
+                for date, value in zip(block['date'], values):
+                    if value is not None:
+                        columns['date'].append(date)
+                        columns['security'].append(name)
+                        columns['field'].append(column)
+                        columns['value'].append(value)
+        data = columns
+    if errors is False:
+        return(data)
+    else:
+        return(data, _exceptionsDict(exceptions, errors))
+
+
+def _parseFieldInfoMessage(msg: blp.Message, state: dict) -> None:
+    """ Parse a message of a field info response in a dict of datatypes. """
+    for fieldData in msg.getElement(FIELD_DATA).values():
+        if fieldData.hasElement(FIELD_INFO):
+            fieldInfo = fieldData.getElement(FIELD_INFO)
+            state[fieldInfo.getElementAsString(MNEMONIC)] = \
+                fieldInfo.getElementAsString(DATATYPE)
+
+
+def _checkOutput(output: str, path: Union[str, None]) -> None:
+    """ Check the output asked for before any request is sent; the Arrow
+    outputs are only imported when one of them is asked for. """
+    if output in ('pandas', 'dict'):
+        return()
+    from blpd.arrow import OUTPUTS
+    if output not in OUTPUTS:
+        raise ValueError(f'Unknown output {output!r}, expected one of '
+                         f'{["pandas", "dict"] + OUTPUTS}')
+    if output == 'parquet' and path is None:
+        raise ValueError("output='parquet' needs a path")
+
+
+def _fieldTypes(datatypes: dict) -> dict:
+    """ Map fields to the dtypes of their datatypes, skipping the unknown. """
+    return({field: DATATYPES[datatype] for field, datatype in
+            datatypes.items() if datatype in DATATYPES})
+
+
+def _longFrame(data: pd.DataFrame, name: str) -> pd.DataFrame:
+    """ Convert the block of a security to date, security, field and value
+    columns. """
+    data = data.rename_axis('date').reset_index().melt(id_vars='date',
+           var_name='field', value_name='value').dropna(subset=['value'])
+    data.insert(1, 'security', name)
+    return(data.reset_index(drop=True))
+
+
+def _fitsFloat32(values: np.ndarray) -> bool:
+    """ Tell if float32 keeps some floats: exactly, or as the decimals of at
+    most 6 significant digits they were received as. Lossy: the float32
+    values only round back to those decimals. """
+    values = values[np.isfinite(values) & (values != 0)]
+    if len(values) == 0:
+        return(True)
+    magnitude = np.abs(values)
+    if magnitude.max() >= np.finfo(np.float32).max or \
+       magnitude.min() < np.finfo(np.float32).tiny:
+        return(False)
+    if (values.astype(np.float32).astype(float) == values).all():
+        return(True)
+    digits = 5 - np.floor(np.log10(magnitude))
+    scale = 10. ** np.abs(digits)
+    rounded = np.where(digits >= 0, np.rint(values * scale) / scale,
+                       np.rint(values / scale) * scale)
+    return(bool((rounded == values).all()))
+
+
+def _compactColumn(column: pd.Series, datatype: Union[str, None],
+sparse: bool=False, lossyFloats: bool=False) -> pd.Series:
+    """ Store a column in a smaller dtype keeping its values: integers
+    downcast, floats as float32 if the field is a Float32, repeated strings
+    as categoricals; with sparse, the numeric columns missing for more than
+    half of the rows become sparse. With lossyFloats, the other floats are
+    also stored as float32 when their values look short enough (see
+    _fitsFloat32), which loses precision. """
+    if pd.api.types.is_integer_dtype(column.dtype):
+        column = pd.to_numeric(column, downcast='integer')
+    elif pd.api.types.is_float_dtype(column.dtype):
+        if datatype == 'Float32' or (lossyFloats is True and
+                                     _fitsFloat32(column.to_numpy())):
+            column = column.astype(np.float32)
+    elif pd.api.types.infer_dtype(column, skipna=True) == 'string':
+        if column.nunique() <= len(column) / 2:
+            column = column.astype('category')
+        return(column)
+    else:
+        return(column)
+    if sparse is True and column.isna().mean() > 0.5:
+        column = column.astype(pd.SparseDtype(column.dtype, np.nan))
+    return(column)
+
+
+def _compactFrame(data: pd.DataFrame, datatypes: dict, sparse: bool=False,
+level: int=None, lossyFloats: bool=False) -> pd.DataFrame:
+    """ Compact each column of a wide frame; level is the column level of the
+    fields if the columns are a MultiIndex. """
+    compact = pd.DataFrame({i: _compactColumn(data[c], datatypes.get(
+                            c if level is None else c[level]), sparse,
+                            lossyFloats)
+                            for i, c in enumerate(data.columns)},
+                           index=data.index)
+    compact.columns = data.columns
+    return(compact)
+
+
+def _compactLong(data: pd.DataFrame, datatypes: dict,
+lossyFloats: bool=False) -> pd.DataFrame:
+    """ Compact a long frame, with categorical security and field columns. """
+    data = data.copy()
+    data['security'] = data['security'].astype('category')
+    data['field'] = data['field'].astype('category')
+    float32 = len(datatypes) > 0 and all(datatypes.get(f) == 'Float32'
+                                         for f in data['field'].cat.categories)
+    data['value'] = _compactColumn(data['value'],
+                                   'Float32' if float32 is True else None,
+                                   lossyFloats=lossyFloats)
+    return(data)
+
+
+def _timeChunks(start: pd.Timestamp, end: pd.Timestamp,
+chunk: pd.Timedelta) -> list:
+    """ Split a time range in consecutive [start, end) chunks. """
+    if chunk is None or start + chunk >= end:
+        return([(start, end)])
+    bounds = list(pd.date_range(start, end, freq=chunk))
+    if bounds[-1] < end:
+        bounds.append(end)
+    return(list(zip(bounds[:-1], bounds[1:])))
+
+
+def _decodeArray(array: blp.Element, columns: list) -> tuple:
+    """ Decode the bar or tick array of an intraday response into
+    preallocated NumPy columns. """
+    n = array.numValues()
+    times = np.empty(n, dtype=object)
+    data = {name: np.full(n, np.nan if dtype is float else 0, dtype=dtype)
+            if dtype is not object else np.full(n, None, dtype=object)
+            for name, dtype in columns}
+    names = [(name, blp.Name(name), dtype) for name, dtype in columns]
+    for i, item in enumerate(array.values()):
+        times[i] = item.getElementAsDatetime(TIME)
+        for name, element, dtype in names:
+            if item.hasElement(element):
+                if dtype is float:
+                    data[name][i] = item.getElementAsFloat(element)
+                elif dtype is object:
+                    data[name][i] = item.getElementAsString(element)
+                else:
+                    data[name][i] = item.getElementAsInteger(element)
+    return((times, data))
+
+
+def _parseBarMessage(msg: blp.Message, state: list) -> None:
+    """ Parse a message of an intraday bar response. """
+    bars = msg.getElement(BAR_DATA).getElement(BAR_TICK_DATA)
+    state.append(_decodeArray(bars, BAR_FIELDS))
+
+
+def _parseTickMessage(msg: blp.Message, state: list) -> None:
+    """ Parse a message of an intraday tick response. """
+    ticks = msg.getElement(TICK_DATA).getElement(TICK_DATA)
+    state.append(_decodeArray(ticks, TICK_FIELDS))
+
+
+def _intradayResult(states: list, columns: list) -> pd.DataFrame:
+    """ Concatenate the decoded blocks of the intraday requests in a frame
+    with a DatetimeIndex. """
+    blocks = [block for state in states for block in state]
+    times = np.concatenate([b[0] for b in blocks] + [np.empty(0, object)])
+    data = {name: np.concatenate([b[1][name] for b in blocks] +
+            [np.empty(0, dtype=dtype)]) for name, dtype in columns}
+    index = pd.DatetimeIndex(pd.to_datetime(list(times)), name='time')
+    if index.tz is not None:
+        index = index.tz_convert(None)
+    keep = [name for name, dtype in columns if dtype is not object or
+            pd.notna(data[name]).any()]
+    return(pd.DataFrame({name: data[name] for name in keep}, index=index))
+
+
 class BLP():
     """ Implementation of the Request/Response Paradigm to mimick Excel API. """
 
     def __init__(self, host: str='localhost', port: int=8194,
-    verbose: bool=False, start: bool=True) -> None:
-        """ Initialize a BLP session. """
+    verbose: bool=False, start: bool=True,
+    memo: 'ReferenceCache'=None, session: blp.Session=None,
+    typed: bool=True, fieldCache: 'FieldCache'=None,
+    metrics: Callable=None, scheduler: 'Scheduler'=None, priority: int=1,
+    caller: str=None, record: str=None, replay: str=None) -> None:
+        """ Initialize a BLP session; an optional ReferenceCache memoizes the
+        cells returned by bdp, and an optional session object (e.g. a
+        FakeSession) replaces the one connected to host:port. With typed=True
+        the datatypes of the fields are looked up in //blp/apiflds (once,
+        and kept in an optional FieldCache) to decode the values with typed
+        accessors. metrics(record) is called after every request with its
+        timings and counts (see blpd.metrics). A Scheduler, possibly shared
+        by several sessions, paces the requests sent, with the priority of
+        this session and fair shares by caller (see blpd.scheduler). With
+        record=path the responses are saved to path, with replay=path they
+        are read back from it without any connection (see blpd.replay). """
         self.active = False
         self.host = host
         self.port = port
         self.verbose = verbose
+        self.memo = memo
+        self.typed = typed
+        self.fieldCache = fieldCache
+        self.metrics = metrics
+        self.scheduler = scheduler
+        self.priority = priority
+        self.caller = caller
+        self.fieldService = None
+        self._fieldServiceFailed = False
+        self._datatypes = {}
+        self._session = session
+        self.record = record
+        self.replay = replay
         if start is True:
             self.open()
 
@@ -70,7 +864,16 @@ class BLP():
             sessionOptions.setServerPort(self.port)
             if self.verbose is True:
                 print(f'Connecting to {self.host}:{self.port}.')
-            self.session = blp.Session(sessionOptions)
+            if self.replay is not None:
+                from blpd.replay import ReplaySession
+                self.session = ReplaySession(self.replay)
+            elif self._session is None:
+                self.session = blp.Session(sessionOptions)
+            else:
+                self.session = self._session
+            if self.record is not None:
+                from blpd.replay import RecordingSession
+                self.session = RecordingSession(self.session, self.record)
             if self.session.start() is False:
                 print('Failed to start session.') # Raise error
                 return()
@@ -82,6 +885,8 @@ class BLP():
             if self.verbose is True:
                 print('Opening refdata service...')
             self.refDataService = self.session.getService('//blp/refdata')
+            self.fieldService = None
+            self._fieldServiceFailed = False
             self.active = True
 
 
@@ -94,206 +899,312 @@ class BLP():
             self.active = False
 
 
-    def _addSecurities(self) -> None:
-        """ Add a list of securities to a request. """
-        if isinstance(self.securities, basestring):
-            self.securities = [self.securities]
-        else:
-            pass
-        for sec in _formatSecsList(self.securities, self.prefix):
-            self.request.append('securities', sec)
+    def _iterRequests(self, requests: list, maxPending: int=None,
+    element: blp.Name=SECURITY_DATA, record: dict=None):
+        """ Send a list of requests, keeping up to maxPending of them in flight,
+        and yield each message with the data element along with the index of
+        its request (found by correlation ID). The requests still pending
+        when the generator is closed are cancelled. The network figures are
+        added to the metrics record, if any. """
+        queue = list(range(len(requests)))[::-1]
+        pending = {}
+        try:
+            while(len(queue) > 0 or len(pending) > 0):
+                while(len(queue) > 0 and
+                      (maxPending is None or len(pending) < maxPending)):
+                    if self.scheduler is not None and self._schedule(
+                       requests[queue[-1]], len(pending) == 0,
+                       record) is False:
+                        break
+                    i = queue.pop()
+                    if self.verbose is True:
+                        print(f'Sending request: {requests[i]}')
+                    if record is not None and record['requests'] == 0:
+                        record['build'] = time.perf_counter() - \
+                            record['start'] - record['fields']
+                    try:
+                        cid = self.session.sendRequest(requests[i])
+                    except Exception:
+                        if self.scheduler is not None:
+                            self.scheduler.release()
+                        raise
+                    if self.verbose is True:
+                        print(f'Correlation ID is: {cid}')
+                    pending[cid] = i
+                    if record is not None:
+                        record['requests'] += 1
+                if record is None:
+                    ev = self.session.nextEvent(500)
+                else:
+                    ev = self._timedEvent(record)
+                done = ev.eventType() in (blp.Event.RESPONSE,
+                                          blp.Event.REQUEST_STATUS)
+                if ev.eventType() == blp.Event.SESSION_STATUS:
+                    for msg in ev:
+                        if str(msg.messageType()) in SESSION_DOWN:
+                            raise ConnectionError(str(msg.messageType()))
+                for msg in ev:
+                    for cid in msg.correlationIds():
+                        if cid in pending:
+                            i = pending[cid]
+                            if done is True:
+                                del pending[cid]
+                                if self.scheduler is not None:
+                                    self.scheduler.release()
+                            if msg.hasElement(element):
+                                if self.verbose is True:
+                                    print(f'{element}: '
+                                          f'{msg.getElement(element)}')
+                                if record is not None:
+                                    record['messages'] += 1
+                                yield(i, msg)
+                            elif msg.hasElement(RESPONSE_ERROR):
+                                error = msg.getElement(RESPONSE_ERROR)
+                                print(error.getElementAsString(MESSAGE))
+        finally:
+            for cid in pending:
+                self.session.cancel(cid)
+                if self.scheduler is not None:
+                    self.scheduler.release()
+            if record is not None:
+                record['received'] = time.perf_counter()
 
 
-    def _addFields(self) -> None:
-        """ Add a list of fields to a request. """
-        if isinstance(self.fields, basestring):
-            self.fields = [self.fields]
-        else:
-            pass
-        for fld in self.fields:
-            self.request.append('fields', fld)
+    def _schedule(self, request: blp.Request, block: bool,
+    record: dict) -> bool:
+        """ Ask the scheduler to send a request; without block (when other
+        requests are pending, so that their events keep being drained) return
+        False if it has to wait. """
+        start = time.perf_counter()
+        sent = self.scheduler.acquire(_hits(request), self.priority,
+                                      self.caller, block)
+        if record is not None:
+            record['queued'] += time.perf_counter() - start
+        return(sent)
 
 
-    def _addDays(self) -> None:
-        """ Add fill days options to a historical request. """
-        options = {'A': 'ALL_CALENDAR_DAYS',
-                   'T': 'ACTIVE_DAYS_ONLY',
-                   'W': 'NON_TRADING_WEEKDAYS'}
-        try:
-            self.request.set('nonTradingDayFillOption', options[self.days])
-        except KeyError:
-            print('Options are A / T / W')
+    def _timedEvent(self, record: dict) -> blp.Event:
+        """ Wait for the next event, adding the wait to the metrics record. """
+        start = time.perf_counter()
+        ev = self.session.nextEvent(500)
+        now = time.perf_counter()
+        record['wait'] += now - start
+        if ev.eventType() != blp.Event.TIMEOUT:
+            record['events'] += 1
+            if record['firstEvent'] is None:
+                record['firstEvent'] = now - record['start'] - \
+                    record['fields']
+            if ev.eventType() == blp.Event.PARTIAL_RESPONSE:
+                record['partial'] += 1
+        return(ev)
 
 
-    def _addFill(self) -> None:
-        """ Add fill method options to a historical request. """
-        options = {'N': 'NIL_VALUE',
-                   'P': 'PREVIOUS_VALUE'}
-        try:
-            self.request.set('nonTradingDayFillMethod', options[self.fill])
-        except KeyError:
-            print('Options are N / P')
-
-
-    def _addPeriod(self) -> None:
-        """ Add periodicity options to a historical request. """
-        optionsAdj = {'A': 'ACTUAL',
-                      'C': 'CALENDAR',
-                      'F': 'FISCAL'}
-        optionsSel = {'D': 'DAILY',
-                      'M': 'MONTHLY',
-                      'Q': 'QUARTERLY',
-                      'S': 'SEMI_ANNUALLY',
-                      'W': 'WEEKLY',
-                      'Y': 'YEARLY'}
-        try:
-            self.request.set('periodicityAdjustment', optionsAdj[self.per[0]])
-            self.request.set('periodicitySelection', optionsSel[self.per[1]])
-        except KeyError:
-            print('Options are A / C / F and D / M / Q / S / W / Y')
-
-
-    def _addQuoteType(self) -> None:
-            """ Add quote type options to a historical request. """
-            options = {'P': 'PRICING_OPTION_PRICE',
-                       'Y': 'PRICING_OPTION_YIELD'}
-            try:
-                self.request.set('pricingOption', options[self.qtTyp])
-            except KeyError:
-                print('Options are P / Y')
-
-
-    def _addQuote(self) -> None:
-            """ Add quote options to a historical request. """
-            options = {'C': 'OVERRIDE_OPTION_CLOSE',
-                       'G': 'OVERRIDE_OPTION_GPA'}
-            try:
-                self.request.set('overrideOption', options[self.quote])
-            except KeyError:
-                print('Options are C / G')
-
-
-    def _addMandatoryOptions(self) -> None:
-        """ Add mandatory options to a historical request. """
-        self.request.set('returnRelativeDate', self.dtFmt)
-        self._addDays()
-        self._addFill()
-        self._addPeriod()
-        self._addQuoteType()
-        self._addQuote()
-        self.request.set('adjustmentFollowDPDF', self.useDPDF)
-
-
-    def _addFacultativeOptions(self) -> None:
-        """ Add facultative options to a historical request. """
-        if self.cdr is None:
-            pass
+    def _sendRequests(self, requests: list, parse: Callable,
+    newState: Callable, maxPending: int=None,
+    element: blp.Name=SECURITY_DATA, record: dict=None) -> list:
+        """ Send a list of requests and parse each message in the state of its
+        request. Return the states in the same order as the requests. """
+        states = [newState() for _ in requests]
+        if record is None:
+            for i, msg in self._iterRequests(requests, maxPending, element):
+                parse(msg, states[i])
         else:
-            self.request.set('calendarCodeOverride', self.cdr)
-        if self.fx is None:
-            pass
-        else:
-            self.request.set('currency', self.fx)
-        if self.points is None:
-            pass
-        else:
-            self.request.set('maxDataPoints', self.points)
-        if self.cshAdjAbnormal is None:
-            pass
-        else:
-            self.request.set('adjustmentAbnormal', self.cshAdjAbnormal)
-        if self.capChg is None:
-            pass
-        else:
-            self.request.set('adjustmentSplit', self.capChg)
-        if self.cshAdjNormal is None:
-            pass
-        else:
-            self.request.set('adjustmentNormal', self.cshAdjNormal)
+            for i, msg in self._iterRequests(requests, maxPending, element,
+                                             record):
+                start = time.perf_counter()
+                parse(msg, states[i])
+                record['parse'] += time.perf_counter() - start
+        return(states)
 
 
-    def _addOverrides(self) -> None:
-        """ Manage request arguments. """
-        if self.overrides is None:
-            pass
-        elif isinstance(self.overrides, dict):
-            overrides = self.request.getElement(OVERRIDES)
-            oslist = []
-            for key, value in self.overrides.items():
-                oslist.append(overrides.appendElement())
-                oslist[-1].setElement(FIELD_ID, key)
-                oslist[-1].setElement('value', value)
+    def _record(self, call: str) -> Union[dict, None]:
+        """ Start the metrics record of a call, None if metrics are off. """
+        if self.metrics is None:
+            return(None)
+        return({'call': call, 'start': time.perf_counter(), 'requests': 0,
+                'fields': 0., 'queued': 0., 'build': 0., 'firstEvent': None,
+                'wait': 0., 'events': 0,
+                'partial': 0, 'messages': 0, 'parse': 0., 'assembly': 0.,
+                'cells': 0, 'total': 0.})
+
+
+    def _report(self, record: Union[dict, None], result):
+        """ Complete a metrics record with the assembly time and the number
+        of cells of the result, pass it to the metrics hook and return the
+        result unchanged. """
+        if record is None:
+            return(result)
+        now = time.perf_counter()
+        data = result[0] if isinstance(result, tuple) else result
+        if hasattr(data, 'shape'):
+            record['cells'] += int(np.prod(data.shape))
+        record['assembly'] = now - record.pop('received', now)
+        record['total'] = now - record.pop('start')
+        self.metrics(record)
+        return(result)
+
+
+    def _missingFields(self, fields: Union['str', 'list']) -> tuple:
+        """ Return the fields and those whose datatype is still unknown,
+        looking them up in the field cache first. """
+        if isinstance(fields, basestring):
+            fields = [fields]
+        missing = [f for f in dict.fromkeys(fields) if f not in self._datatypes]
+        if self.fieldCache is not None and len(missing) > 0:
+            self._datatypes.update(self.fieldCache.lookup(missing))
+            missing = [f for f in missing if f not in self._datatypes]
+        return((fields, missing))
+
+
+    def _fieldRequest(self, fields: list) -> blp.Request:
+        """ Create a field info request, opening the apiflds service if
+        needed; return None if it cannot be opened, in which case the values
+        are decoded untyped and the service is not tried again until the
+        session is reopened. """
+        if self._fieldServiceFailed is True:
+            return(None)
+        if self.fieldService is None:
+            if self.session.openService('//blp/apiflds') is False:
+                print('Failed to open apiflds service.') # Raise error
+                self._fieldServiceFailed = True
+                return(None)
+            if self.verbose is True:
+                print('Opening apiflds service...')
+            self.fieldService = self.session.getService('//blp/apiflds')
+        request = self.fieldService.createRequest('FieldInfoRequest')
+        for f in fields:
+            request.append('id', f)
+        request.set('returnFieldDocumentation', False)
+        return(request)
+
+
+    def _storeFields(self, missing: list, datatypes: dict) -> None:
+        """ Keep the datatypes of a field info response; invalid fields are
+        remembered as None for the session only. """
+        if self.fieldCache is not None:
+            self.fieldCache.store(datatypes)
+        for f in missing:
+            self._datatypes[f] = datatypes.get(f)
+
+
+    def fieldInfo(self, fields: Union['str', 'list']) -> dict:
+        """ Return the datatype of each field (None if invalid), asking
+        //blp/apiflds only for the fields never seen before. """
+        fields, missing = self._missingFields(fields)
+        if len(missing) > 0:
+            request = self._fieldRequest(missing)
+            if request is not None:
+                states = self._sendRequests([request], _parseFieldInfoMessage,
+                                            dict, None, FIELD_DATA)
+                self._storeFields(missing, states[0])
+        return({f: self._datatypes.get(f) for f in fields})
+
+
+    def _types(self, fields: Union['str', 'list']) -> dict:
+        """ Return the dtypes of the fields, empty if typed is False. """
+        if self.typed is False:
+            return({})
+        return(_fieldTypes(self.fieldInfo(fields)))
+
+
+    def _timedTypes(self, fields: Union['str', 'list'],
+    record: Union[dict, None]) -> dict:
+        """ Return the dtypes of the fields, timing the lookup as the fields
+        phase of a metrics record. """
+        start = time.perf_counter()
+        types = self._types(fields)
+        if record is not None:
+            record['fields'] += time.perf_counter() - start
+        return(types)
+
+
+    def _compact(self, result, fields: Union['str', 'list'],
+    compact: Union[bool, str], level: int=None, long: bool=False,
+    lossyFloats: bool=False):
+        """ Store a pandas result (alone or with its exceptions) in the compact
+        layout asked for, using the datatypes of the fields if typed. """
+        if compact is False:
+            return(result)
+        datatypes = {} if self.typed is False else self.fieldInfo(fields)
+        data = result[0] if isinstance(result, tuple) else result
+        if long is True:
+            data = _compactLong(data, datatypes, lossyFloats)
         else:
-            print('Overrides must be a dict') # Raise error
+            data = _compactFrame(data, datatypes, compact == 'sparse', level,
+                                 lossyFloats)
+        return((data, result[1]) if isinstance(result, tuple) else data)
 
 
     def bdp(self, securities: Union['str', 'list'],
     fields: Union['str', 'list'], prefix: Union['str', 'list']='ticker',
-    overrides: dict=None, swap: bool=False, errors: bool=False) -> pd.DataFrame:
+    overrides: dict=None, swap: bool=False, errors: Union[bool, str]=False,
+    chunkSecs: int=None, chunkFlds: int=None, maxPending: int=4,
+    output: str='pandas', path: str=None, compact: Union[bool, str]=False,
+    lossyFloats: bool=False) -> pd.DataFrame:
         """ Send a reference request to Bloomberg (mimicking Excel function
-        BDP). """
-        self.request = self.refDataService.createRequest('ReferenceDataRequest')
-        self.securities = securities
-        self.fields = fields
-        self.prefix = prefix
-        self.overrides = overrides
-        self._addSecurities()
-        self._addFields()
-        self._addOverrides()
-        if self.verbose is True:
-            print(f'Sending request: {self.request}')
-        cid = self.session.sendRequest(self.request)
-        if self.verbose is True:
-            print(f'Correlation ID is: {cid}')
-        data = pd.DataFrame()
-        exceptions = pd.DataFrame()
-        while(True):
-            ev = self.session.nextEvent(500)
-            for msg in ev:
-                if cid in msg.correlationIds():
-                    securitiesData = msg.getElement(SECURITY_DATA)
-                    if self.verbose is True:
-                        print(f'Securities data: {securitiesData}')
-                    for secData in securitiesData.values():
-                        name = secData.getElementAsString(SECURITY)
-                        fieldsData = secData.getElement(FIELD_DATA)
-                        for field in fieldsData.elements():
-                            data.loc[name, str(field.name())] = \
-                            pd.to_numeric(field.getValueAsString(),
-                            errors='ignore')
-                        if secData.hasElement(SECURITY_ERROR):
-                            secError = secData.getElement(SECURITY_ERROR)
-                            exceptions.loc[name, 'Field'] = None
-                            exceptions.loc[name, 'Category'] = \
-                            secError.getElementAsString(CATEGORY)
-                            exceptions.loc[name, 'Subcategory'] = \
-                            secError.getElementAsString(SUBCATEGORY)
-                            exceptions.loc[name, 'Message'] = \
-                            secError.getElementAsString(MESSAGE)
-                        fieldsException = secData.getElement(FIELD_EXCEPTIONS)
-                        for fieldEx in fieldsException.values():
-                            if fieldEx.hasElement(FIELD_ID):
-                                fieldId = fieldEx.getElementAsString(FIELD_ID)
-                                errorInfo = fieldEx.getElement(ERROR_INFO)
-                                exceptions.loc[name, 'Field'] = fieldId
-                                exceptions.loc[name, 'Category'] = \
-                                errorInfo.getElementAsString(CATEGORY)
-                                exceptions.loc[name, 'Subcategory'] = \
-                                errorInfo.getElementAsString(SUBCATEGORY)
-                                exceptions.loc[name, 'Message'] = \
-                                errorInfo.getElementAsString(MESSAGE)
-            if ev.eventType() == blp.Event.RESPONSE:
-                break
-        if swap is False:
-            if errors is False:
-                return(data)
-            else:
-                return(data, exceptions)
-        else:
-            if errors is False:
-                return(data.T)
-            else:
-                return(data.T, exceptions)
+        BDP). Large requests can be split in chunks of chunkSecs securities
+        and chunkFlds fields, with up to maxPending chunks in flight. output
+        can be 'arrow', 'polars' or 'parquet' (written to path) to get a
+        security column and a column per field without a pandas step, or
+        'dict' to get plain dicts without importing pandas. With compact=True
+        the DataFrame is stored in smaller dtypes (see _compactColumn);
+        lossyFloats=True also stores the Double fields as float32 when their
+        values look short enough, which loses precision. errors=True also
+        returns the exceptions, one row (or dict) per security; with
+        errors='fields' every field exception of a security is kept, in a row
+        each (or a list of dicts). """
+        _checkOutput(output, path)
+        record = self._record('bdp')
+        types = self._timedTypes(fields, record)
+        if self.memo is None:
+            requests = _createRequests(self.refDataService,
+                                       'ReferenceDataRequest', securities,
+                                       fields, prefix,
+                                       lambda r: _addOverrides(r, overrides),
+                                       chunkSecs, chunkFlds)
+            states = self._sendRequests(requests, _parseReferenceMessage,
+                                        lambda: _referenceState(types),
+                                        maxPending, record=record)
+            return(self._report(record, self._reference(states, swap, errors,
+                                   output, path, fields, compact,
+                                   lossyFloats)))
+        if isinstance(securities, basestring):
+            securities = [securities]
+        if isinstance(fields, basestring):
+            fields = [fields]
+        securities = _formatSecsList(securities, prefix)
+        cells = self.memo.lookup(securities, fields, overrides)
+        secs = [s for s in securities if any((s, f) not in cells
+                                             for f in fields)]
+        flds = [f for f in fields if any((s, f) not in cells for s in secs)]
+        if len(secs) > 0:
+            requests = _createRequests(self.refDataService,
+                                       'ReferenceDataRequest', secs, flds,
+                                       'ticker',
+                                       lambda r: _addOverrides(r, overrides),
+                                       chunkSecs, chunkFlds)
+            states = self._sendRequests(requests, _parseReferenceMessage,
+                                        lambda: _referenceState(types),
+                                        maxPending, record=record)
+            cells.update(self.memo.store(states, secs, flds, overrides))
+        states = [self.memo.state(cells, securities, fields, types)]
+        return(self._report(record, self._reference(states, swap, errors,
+                                                    output, path, fields,
+                                                    compact, lossyFloats)))
+
+
+    def _reference(self, states: list, swap: bool, errors: bool,
+    output: str, path: str, fields: Union['str', 'list']=None,
+    compact: Union[bool, str]=False, lossyFloats: bool=False):
+        """ Build the output of the reference requests. """
+        if output == 'pandas':
+            return(self._compact(_referenceResult(states, swap, errors),
+                                 [] if swap is True else fields, compact,
+                                 lossyFloats=lossyFloats))
+        elif output == 'dict':
+            return(_referenceDict(states, swap, errors))
+        from blpd.arrow import referenceArrow
+        return(referenceArrow(*_mergeReference(states), output, path, errors))
 
 
     def bdh(self, securities: Union['str', 'list'],
@@ -302,94 +1213,194 @@ class BLP():
     dtFmt: bool=False, days: str='W', fill: str='P', per: str='CD',
     points: int=None, qtTyp: str='Y', quote: str='C', useDPDF: bool=True,
     cshAdjAbnormal: bool=None, capChg: bool=None, cshAdjNormal: bool=None,
-    overrides: dict=None, swap: bool=False, errors: bool=False) -> pd.DataFrame:
+    overrides: dict=None, swap: bool=False, errors: Union[bool, str]=False,
+    chunkSecs: int=None, chunkFlds: int=None, maxPending: int=4,
+    long: bool=False, output: str='pandas', path: str=None,
+    compact: Union[bool, str]=False,
+    lossyFloats: bool=False) -> pd.DataFrame:
         """ Send a historical request to Bloomberg (mimicking Excel function
-        BDH). """
-        self.request = self.refDataService.createRequest('HistoricalDataRequest')
-        self.securities = securities
-        self.fields = fields
-        self.startDate = startDate
-        self.endDate = endDate
-        self.prefix = prefix
-        self.cdr = cdr
-        self.fx = fx
-        self.dtFmt = dtFmt
-        self.days = days
-        self.fill = fill
-        self.per = per
-        self.points = points
-        self.qtTyp = qtTyp
-        self.quote = quote
-        self.useDPDF = useDPDF
-        self.cshAdjAbnormal = cshAdjAbnormal
-        self.capChg = capChg
-        self.cshAdjNormal = cshAdjNormal
-        self.overrides = overrides
-        self._addSecurities()
-        self._addFields()
-        self.request.set('startDate', self.startDate)
-        self.request.set('endDate', self.endDate)
-        self._addMandatoryOptions()
-        self._addFacultativeOptions()
-        self._addOverrides()
-        if self.verbose is True:
-            print(f'Sending request: {self.request}')
-        cid = self.session.sendRequest(self.request)
-        if self.verbose is True:
-            print(f'Correlation ID is: {cid}')
-        datadict = {}
-        exceptions = pd.DataFrame()
-        while(True):
-            ev = self.session.nextEvent(500)
-            for msg in ev:
-                if cid in msg.correlationIds():
-                    secData = msg.getElement(SECURITY_DATA)
-                    if self.verbose is True:
-                        print(f'Securities data: {secData}')
-                    name = secData.getElementAsString(SECURITY)
-                    if secData.hasElement(SECURITY_ERROR):
-                        secError = secData.getElement(SECURITY_ERROR)
-                        exceptions.loc[name, 'Field'] = None
-                        exceptions.loc[name, 'Category'] = \
-                        secError.getElementAsString(CATEGORY)
-                        exceptions.loc[name, 'Subcategory'] = \
-                        secError.getElementAsString(SUBCATEGORY)
-                        exceptions.loc[name, 'Message'] = \
-                        secError.getElementAsString(MESSAGE)
-                    df = pd.DataFrame()
-                    fieldsData = secData.getElement(FIELD_DATA)
-                    fieldsException = secData.getElement(FIELD_EXCEPTIONS)
-                    for fieldEx in fieldsException.values():
-                        if fieldEx.hasElement(FIELD_ID):
-                            fieldId = fieldEx.getElementAsString(FIELD_ID)
-                            errorInfo = fieldEx.getElement(ERROR_INFO)
-                            exceptions.loc[name, 'Field'] = fieldId
-                            exceptions.loc[name, 'Category'] = \
-                            errorInfo.getElementAsString(CATEGORY)
-                            exceptions.loc[name, 'Subcategory'] = \
-                            errorInfo.getElementAsString(SUBCATEGORY)
-                            exceptions.loc[name, 'Message'] = \
-                            errorInfo.getElementAsString(MESSAGE)
-                    for fData in fieldsData.values():
-                        for field in fData.elements():
-                            if str(field.name()) == 'date':
-                                date = pd.to_datetime(field.getValueAsString(),
-                                format='%Y-%m-%d')
-                            else:
-                                df.loc[date, str(field.name())] = \
-                                pd.to_numeric(field.getValueAsString(),
-                                errors='ignore')
-                            datadict[name] = df
-            if ev.eventType() == blp.Event.RESPONSE:
-                break
-        data = pd.concat(datadict.values(), keys=datadict.keys(), axis=1)
-        if swap is False:
-            if errors is False:
-                return(data)
-            else:
-                return(data, exceptions)
+        BDH). Large requests can be split in chunks of chunkSecs securities
+        and chunkFlds fields, with up to maxPending chunks in flight. With
+        long=True the result has date, security, field and value columns.
+        output can be 'arrow', 'polars' or 'parquet' (written to path) to get
+        the tidy (date, security and a column per field) or long layout
+        without a pandas step, or 'dict' to get plain dicts of lists (see
+        _historicalDict) without importing pandas. With compact=True the
+        DataFrame is stored in smaller dtypes (see _compactColumn), with
+        categorical security and field columns in the long layout; with
+        compact='sparse' the mostly missing columns of the wide layout are
+        also made sparse; lossyFloats=True also stores the Double fields as
+        float32 when their values look short enough, which loses precision.
+        errors=True also returns the exceptions, one row (or dict) per
+        security; with errors='fields' every field exception of a security is
+        kept, in a row each (or a list of dicts). """
+        _checkOutput(output, path)
+        record = self._record('bdh')
+        options = {'startDate': startDate, 'endDate': endDate, 'cdr': cdr,
+                   'fx': fx, 'dtFmt': dtFmt, 'days': days, 'fill': fill,
+                   'per': per, 'points': points, 'qtTyp': qtTyp,
+                   'quote': quote, 'useDPDF': useDPDF,
+                   'cshAdjAbnormal': cshAdjAbnormal, 'capChg': capChg,
+                   'cshAdjNormal': cshAdjNormal, 'overrides': overrides}
+        requests = _createRequests(self.refDataService, 'HistoricalDataRequest',
+                                   securities, fields, prefix,
+                                   lambda r: _addHistoricalOptions(r, options),
+                                   chunkSecs, chunkFlds)
+        types = self._timedTypes(fields, record)
+        states = self._sendRequests(requests, _parseHistoricalMessage,
+                                    lambda: _historicalState(types),
+                                    maxPending, record=record)
+        if output == 'pandas':
+            return(self._report(record, self._compact(_historicalResult(
+                                states, swap, errors, long), fields, compact,
+                                0 if swap is True else 1, long, lossyFloats)))
+        elif output == 'dict':
+            return(self._report(record, _historicalDict(states, errors, long)))
+        from blpd.arrow import historicalArrow
+        return(self._report(record, historicalArrow(*_mergeHistorical(states),
+                            output, path, errors, long)))
+
+
+    def bdhIter(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], startDate: str, endDate: str='',
+    prefix: Union['str', 'list']='ticker', cdr: str=None, fx: str=None,
+    dtFmt: bool=False, days: str='W', fill: str='P', per: str='CD',
+    points: int=None, qtTyp: str='Y', quote: str='C', useDPDF: bool=True,
+    cshAdjAbnormal: bool=None, capChg: bool=None, cshAdjNormal: bool=None,
+    overrides: dict=None, long: bool=False, errors: bool=False,
+    chunkSecs: int=None, maxPending: int=4):
+        """ Send a historical request to Bloomberg and yield (security,
+        DataFrame) as soon as each security is received, instead of waiting
+        for the whole response. With long=True each frame has date, security,
+        field and value columns; with errors=True the exceptions of the
+        security are yielded as a third item. """
+        record = self._record('bdhIter')
+        options = {'startDate': startDate, 'endDate': endDate, 'cdr': cdr,
+                   'fx': fx, 'dtFmt': dtFmt, 'days': days, 'fill': fill,
+                   'per': per, 'points': points, 'qtTyp': qtTyp,
+                   'quote': quote, 'useDPDF': useDPDF,
+                   'cshAdjAbnormal': cshAdjAbnormal, 'capChg': capChg,
+                   'cshAdjNormal': cshAdjNormal, 'overrides': overrides}
+        requests = _createRequests(self.refDataService, 'HistoricalDataRequest',
+                                   securities, fields, prefix,
+                                   lambda r: _addHistoricalOptions(r, options),
+                                   chunkSecs, None)
+        types = self._timedTypes(fields, record)
+        try:
+            for _, msg in self._iterRequests(requests, maxPending,
+                                             record=record):
+                tables, exceptions, _ = state = _historicalState(types)
+                _parseHistoricalMessage(msg, state)
+                name = msg.getElement(SECURITY_DATA).getElementAsString(
+                       SECURITY)
+                if name in tables:
+                    data = _historicalFrame(tables[name])
+                else:
+                    data = pd.DataFrame()
+                if long is True:
+                    data = _longFrame(data, name)
+                if record is not None:
+                    record['cells'] += data.size
+                if errors is False:
+                    yield(name, data)
+                else:
+                    yield(name, data, _exceptionsFrame(exceptions, errors))
+        finally:
+            self._report(record, None)
+
+
+    def bdib(self, security: str, startDateTime: str, endDateTime: str,
+    eventType: str='TRADE', interval: int=1, prefix: str='ticker',
+    gapFill: bool=False, adjust: bool=None, chunkDays: float=None,
+    maxPending: int=4) -> pd.DataFrame:
+        """ Send an intraday bar request to Bloomberg (mimicking Excel function
+        BDH with intraday bars). Long ranges can be split in sub-requests of
+        chunkDays days (rounded to whole bars) with up to maxPending in
+        flight. """
+        record = self._record('bdib')
+        start = pd.Timestamp(startDateTime)
+        end = pd.Timestamp(endDateTime)
+        chunk = None
+        if chunkDays is not None:
+            bars = max(1, int(chunkDays * 1440) // interval)
+            chunk = pd.Timedelta(minutes=bars * interval)
+        requests = []
+        for first, last in _timeChunks(start, end, chunk):
+            request = self.refDataService.createRequest('IntradayBarRequest')
+            request.set('security', _formatSecurity(security, prefix))
+            request.set('eventType', eventType)
+            request.set('interval', interval)
+            request.set('startDateTime', first.to_pydatetime())
+            request.set('endDateTime', last.to_pydatetime())
+            request.set('gapFillInitialBar', gapFill)
+            if adjust is not None:
+                request.set('adjustmentNormal', adjust)
+                request.set('adjustmentAbnormal', adjust)
+                request.set('adjustmentSplit', adjust)
+            requests.append(request)
+        states = self._sendRequests(requests, _parseBarMessage, list,
+                                    maxPending, BAR_DATA, record)
+        data = _intradayResult(states, BAR_FIELDS)
+        return(self._report(record, data[~data.index.duplicated(
+                            keep='first')]))
+
+
+    def bdit(self, security: str, startDateTime: str, endDateTime: str,
+    eventTypes: Union['str', 'list']='TRADE', prefix: str='ticker',
+    condCodes: bool=False, exchCodes: bool=False, chunkDays: float=None,
+    maxPending: int=4) -> pd.DataFrame:
+        """ Send an intraday tick request to Bloomberg. Long ranges can be
+        split in sub-requests of chunkDays days with up to maxPending in
+        flight. """
+        record = self._record('bdit')
+        if isinstance(eventTypes, basestring):
+            eventTypes = [eventTypes]
+        start = pd.Timestamp(startDateTime)
+        end = pd.Timestamp(endDateTime)
+        chunk = None if chunkDays is None else pd.Timedelta(days=chunkDays)
+        chunks = _timeChunks(start, end, chunk)
+        requests = []
+        for i, (first, last) in enumerate(chunks):
+            if i < len(chunks) - 1:
+                last = last - pd.Timedelta(milliseconds=1)
+            request = self.refDataService.createRequest('IntradayTickRequest')
+            request.set('security', _formatSecurity(security, prefix))
+            for eventType in eventTypes:
+                request.append('eventTypes', eventType)
+            request.set('startDateTime', first.to_pydatetime())
+            request.set('endDateTime', last.to_pydatetime())
+            request.set('includeConditionCodes', condCodes)
+            request.set('includeExchangeCodes', exchCodes)
+            requests.append(request)
+        states = self._sendRequests(requests, _parseTickMessage, list,
+                                    maxPending, TICK_DATA, record)
+        return(self._report(record, _intradayResult(states, TICK_FIELDS)))
+
+
+    def bds(self, securities: Union['str', 'list'], field: str,
+    prefix: Union['str', 'list']='ticker', overrides: dict=None,
+    errors: bool=False, chunkSecs: int=None,
+    maxPending: int=4) -> pd.DataFrame:
+        """ Send a reference request for a bulk field to Bloomberg (mimicking
+        Excel function BDS). The rows of every security are returned in one
+        long frame indexed by security and row, with a typed column for each
+        element of the bulk field. """
+        record = self._record('bds')
+        requests = _createRequests(self.refDataService, 'ReferenceDataRequest',
+                                   securities, field, prefix,
+                                   lambda r: _addOverrides(r, overrides),
+                                   chunkSecs, None)
+        types = {}
+        states = self._sendRequests(requests, _parseBulkMessage,
+                                    lambda: _referenceState(types), maxPending,
+                                    record=record)
+        table, exceptions = _mergeReference(states)
+        data = table.frame()
+        if len(data.columns) > 0:
+            data.index = pd.MultiIndex.from_tuples(data.index,
+                                                   names=['security', 'row'])
+        if errors is False:
+            return(self._report(record, data))
         else:
-            if errors is False:
-                return(data.swaplevel(axis=1))
-            else:
-                return(data.swaplevel(axis=1), exceptions)
+            return(self._report(record, (data, _exceptionsFrame(exceptions,
+                                                                errors))))
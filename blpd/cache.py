@@ -0,0 +1,428 @@
+import inspect
+import re
+import sqlite3
+import time
+from collections import OrderedDict
+import pandas as pd
+from typing import Union
+from blpd.blp import (BLP, basestring, _Table, _exceptionsFrame,
+                      _exceptionsRows,
+                      _formatSecsList, _historicalFrame)
+
+
+HISTORICAL_OPTIONS = ['cdr', 'fx', 'dtFmt', 'days', 'fill', 'per', 'points',
+                      'qtTyp', 'quote', 'useDPDF', 'cshAdjAbnormal', 'capChg',
+                      'cshAdjNormal', 'overrides']
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS series (
+    key TEXT, security TEXT, field TEXT, date TEXT, value TEXT,
+    PRIMARY KEY (key, security, field, date));
+CREATE TABLE IF NOT EXISTS coverage (
+    key TEXT, security TEXT, field TEXT, startDate TEXT, endDate TEXT,
+    lastAccess REAL,
+    PRIMARY KEY (key, security, field));
+CREATE TABLE IF NOT EXISTS fields (
+    field TEXT PRIMARY KEY, datatype TEXT, lastUpdate REAL);
+'''
+
+
+def _isoDate(date: str) -> Union[str, None]:
+    """ Convert a YYYYMMDD date (or '' for today) to YYYY-MM-DD, None if the
+    date is relative or otherwise not cacheable. """
+    if date == '':
+        return(pd.Timestamp.today().strftime('%Y-%m-%d'))
+    elif re.fullmatch(r'\d{8}', date) is not None:
+        return(f'{date[:4]}-{date[4:6]}-{date[6:]}')
+    else:
+        return(None)
+
+
+def _decode(value: str, dtype) -> object:
+    """ Convert a cached text value back to the dtype of its field. """
+    if dtype is float:
+        return(float(value))
+    elif dtype is int:
+        try:
+            return(int(value))
+        except ValueError:
+            return(int(float(value)))
+    else:
+        return(value)
+
+
+def _shift(date: str, days: int) -> str:
+    """ Shift a YYYY-MM-DD date by a number of days. """
+    return((pd.Timestamp(date) + pd.Timedelta(days=days)).strftime('%Y-%m-%d'))
+
+
+class HistoryCache():
+    """ Persistent SQLite cache in front of BLP.bdh: each series is stored by
+    security, field and request options, and later calls only request the
+    date ranges that are missing. """
+
+    def __init__(self, conn: BLP, path: str='blpd.sqlite',
+    maxRows: int=None) -> None:
+        """ Open (or create) a cache for a BLP session. """
+        self.conn = conn
+        self.path = path
+        self.maxRows = maxRows
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+        self.defaults = {k: v.default for k, v in
+                         inspect.signature(BLP.bdh).parameters.items()
+                         if k in HISTORICAL_OPTIONS}
+        self.stats = {'hits': 0, 'partial': 0, 'misses': 0, 'bypassed': 0,
+                      'servedPoints': 0, 'fetchedPoints': 0}
+
+
+    def close(self) -> None:
+        """ Close the cache database. """
+        self.db.close()
+
+
+    def hitRate(self) -> float:
+        """ Share of the requested series served without any request. """
+        total = self.stats['hits'] + self.stats['partial'] + \
+            self.stats['misses']
+        return(self.stats['hits'] / total if total > 0 else 0.)
+
+
+    def _key(self, options: dict) -> str:
+        """ Build the cache key of a set of request options. """
+        key = dict(self.defaults)
+        key.update(options)
+        if key['overrides'] is not None:
+            key['overrides'] = sorted(key['overrides'].items())
+        return(repr(sorted(key.items())))
+
+
+    def _coverage(self, key: str, security: str, field: str) -> tuple:
+        """ Return the cached date range of a series, (None, None) if none. """
+        row = self.db.execute('SELECT startDate, endDate FROM coverage '
+                              'WHERE key=? AND security=? AND field=?',
+                              (key, security, field)).fetchone()
+        return((None, None) if row is None else row)
+
+
+    def _missing(self, key: str, security: str, field: str, start: str,
+    end: str, daily: bool) -> list:
+        """ Return the date ranges of a series that must be requested. """
+        covStart, covEnd = self._coverage(key, security, field)
+        if covStart is None:
+            return([(start, end)])
+        if start >= covStart and end <= covEnd:
+            return([])
+        if daily is False:
+            return([(min(start, covStart), max(end, covEnd))])
+        missing = []
+        if start < covStart:
+            missing.append((start, _shift(covStart, -1)))
+        if end > covEnd:
+            missing.append((_shift(covEnd, 1), end))
+        return(missing)
+
+
+    def _store(self, key: str, data: pd.DataFrame, exceptions: pd.DataFrame,
+    pairs: list, start: str, end: str) -> None:
+        """ Store the fetched series and extend their coverage. """
+        rows = []
+        if len(data.columns) > 0:
+            dates = data.index.strftime('%Y-%m-%d')
+            for (security, field), column in data.items():
+                valid = column.notna().to_numpy()
+                rows.extend((key, security, field, d, str(v)) for d, v in
+                            zip(dates[valid], column.to_numpy()[valid]))
+        self.db.executemany('INSERT OR REPLACE INTO series VALUES '
+                            '(?, ?, ?, ?, ?)', rows)
+        self.stats['fetchedPoints'] += len(rows)
+        bad = set(_exceptionsRows(exceptions))
+        last = _shift(pd.Timestamp.today().strftime('%Y-%m-%d'), -1)
+        for security, field in pairs:
+            if (security, None) in bad or (security, field) in bad:
+                continue
+            covStart, covEnd = self._coverage(key, security, field)
+            newStart = start if covStart is None else min(start, covStart)
+            newEnd = min(end, last) if covEnd is None \
+                else max(min(end, last), covEnd)
+            if newStart > newEnd:
+                continue
+            self.db.execute('INSERT OR REPLACE INTO coverage VALUES '
+                            '(?, ?, ?, ?, ?, ?)', (key, security, field,
+                            newStart, newEnd, time.time()))
+
+
+    def _evict(self) -> None:
+        """ Drop the least recently used series beyond maxRows. """
+        if self.maxRows is None:
+            return()
+        total = self.db.execute('SELECT COUNT(*) FROM series').fetchone()[0]
+        while(total > self.maxRows):
+            row = self.db.execute('SELECT key, security, field FROM coverage '
+                                  'ORDER BY lastAccess LIMIT 1').fetchone()
+            if row is None:
+                self.db.execute('DELETE FROM series')
+                break
+            total -= self.db.execute('DELETE FROM series WHERE key=? AND '
+                                     'security=? AND field=?', row).rowcount
+            self.db.execute('DELETE FROM coverage WHERE key=? AND security=? '
+                            'AND field=?', row)
+
+
+    def invalidate(self, securities: Union[str, list]=None,
+    fields: Union[str, list]=None, prefix: Union[str, list]='ticker') -> None:
+        """ Remove the cached series of some securities and / or fields (all
+        of them if both are None). """
+        where = []
+        args = []
+        if securities is not None:
+            if isinstance(securities, basestring):
+                securities = [securities]
+            securities = _formatSecsList(securities, prefix)
+            where.append(f'security IN ({",".join("?" * len(securities))})')
+            args.extend(securities)
+        if fields is not None:
+            if isinstance(fields, basestring):
+                fields = [fields]
+            where.append(f'field IN ({",".join("?" * len(fields))})')
+            args.extend(fields)
+        clause = '' if len(where) == 0 else ' WHERE ' + ' AND '.join(where)
+        with self.db:
+            self.db.execute('DELETE FROM series' + clause, args)
+            self.db.execute('DELETE FROM coverage' + clause, args)
+
+
+    def bdh(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], startDate: str, endDate: str='',
+    prefix: Union['str', 'list']='ticker', swap: bool=False,
+    errors: Union[bool, str]=False, **options) -> pd.DataFrame:
+        """ Send a historical request through the cache (same arguments as
+        BLP.bdh). Relative dates and maxDataPoints bypass the cache. """
+        start = _isoDate(startDate)
+        end = _isoDate(endDate)
+        if start is None or end is None or options.get('points') is not None:
+            self.stats['bypassed'] += 1
+            return(self.conn.bdh(securities, fields, startDate, endDate,
+                                 prefix, swap=swap, errors=errors, **options))
+        if isinstance(securities, basestring):
+            securities = [securities]
+        if isinstance(fields, basestring):
+            fields = [fields]
+        securities = _formatSecsList(securities, prefix)
+        bdhOptions = {k: v for k, v in options.items()
+                      if k in HISTORICAL_OPTIONS}
+        key = self._key(bdhOptions)
+        daily = options.get('per', self.defaults['per'])[1] == 'D'
+        groups = {}
+        for security in securities:
+            for field in fields:
+                missing = self._missing(key, security, field, start, end,
+                                        daily)
+                if len(missing) == 0:
+                    self.stats['hits'] += 1
+                else:
+                    self.stats['partial' if self._coverage(key, security,
+                               field)[0] is not None else 'misses'] += 1
+                for dates in missing:
+                    groups.setdefault(dates, []).append((security, field))
+        exceptions = {}
+        with self.db:
+            for (first, last), pairs in groups.items():
+                secs = list(dict.fromkeys(p[0] for p in pairs))
+                flds = list(dict.fromkeys(p[1] for p in pairs))
+                data, exc = self.conn.bdh(secs, flds, first.replace('-', ''),
+                                          last.replace('-', ''),
+                                          errors='fields', **options)
+                exceptions.update(_exceptionsRows(exc))
+                self._store(key, data, exc, pairs, first, last)
+            self._evict()
+        return(self._load(key, securities, fields, start, end, swap, errors,
+                          exceptions))
+
+
+    def _load(self, key: str, securities: list, fields: list, start: str,
+    end: str, swap: bool, errors: Union[bool, str],
+    exceptions: dict) -> pd.DataFrame:
+        """ Read the requested series from the cache in the BLP.bdh layout. """
+        tables = {}
+        types = self.conn._types(fields)
+        with self.db:
+            for security in securities:
+                rows = self.db.execute(
+                    'SELECT field, date, value FROM series WHERE key=? AND '
+                    f'security=? AND field IN ({",".join("?" * len(fields))}) '
+                    'AND date BETWEEN ? AND ? ORDER BY date',
+                    [key, security, *fields, start, end]).fetchall()
+                if len(rows) == 0:
+                    continue
+                table = tables[security] = _Table(types)
+                for field, date, value in rows:
+                    table.add(date, field, _decode(value, types.get(field)))
+                self.db.execute(
+                    'UPDATE coverage SET lastAccess=? WHERE key=? AND '
+                    'security=?', (time.time(), key, security))
+        datadict = {}
+        for security, table in tables.items():
+            df = _historicalFrame(table)
+            datadict[security] = df[[f for f in fields if f in df.columns]]
+            self.stats['servedPoints'] += int(df.notna().sum().sum())
+        if len(datadict) == 0:
+            data = pd.DataFrame()
+        else:
+            data = pd.concat(datadict.values(), keys=datadict.keys(), axis=1)
+            if swap is True:
+                data = data.swaplevel(axis=1)
+        if errors is False:
+            return(data)
+        else:
+            return(data, _exceptionsFrame(exceptions, errors))
+
+
+class ReferenceCache():
+    """ In-memory memo of the cells returned by BLP.bdp, keyed by security,
+    field and overrides, with a time to live per field and LRU eviction.
+    Failed cells are cached as well, with their exceptions. """
+
+    def __init__(self, ttl: float=86400., fieldTtl: dict=None,
+    maxSize: int=100000) -> None:
+        """ Initialize an empty cache; fieldTtl maps fields to their own time
+        to live in seconds. """
+        self.ttl = ttl
+        self.fieldTtl = {} if fieldTtl is None else fieldTtl
+        self.maxSize = maxSize
+        self.cells = OrderedDict()
+        self.stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+
+    def clear(self) -> None:
+        """ Remove all the cached cells. """
+        self.cells.clear()
+
+
+    def hitRate(self) -> float:
+        """ Share of the requested cells served from the cache. """
+        total = self.stats['hits'] + self.stats['misses']
+        return(self.stats['hits'] / total if total > 0 else 0.)
+
+
+    def _key(self, security: str, field: str, overrides: dict) -> tuple:
+        """ Build the key of a cell. """
+        if overrides is None:
+            return((security, field, None))
+        else:
+            return((security, field, tuple(sorted(overrides.items()))))
+
+
+    def lookup(self, securities: list, fields: list, overrides: dict) -> dict:
+        """ Return the valid cached cells of a request, keyed by security and
+        field. """
+        now = time.monotonic()
+        cells = {}
+        for security in securities:
+            for field in fields:
+                key = self._key(security, field, overrides)
+                entry = self.cells.get(key)
+                if entry is None:
+                    self.stats['misses'] += 1
+                elif entry[3] < now:
+                    del self.cells[key]
+                    self.stats['misses'] += 1
+                else:
+                    self.cells.move_to_end(key)
+                    cells[(security, field)] = entry
+                    self.stats['hits'] += 1
+        return(cells)
+
+
+    def store(self, states: list, securities: list, fields: list,
+    overrides: dict) -> dict:
+        """ Cache all the cells of a reference response, including the empty
+        and failed ones, and return them keyed by security and field. """
+        values = {}
+        errors = {}
+        for table, _, log in states:
+            rows = list(table.rows)
+            for column, (positions, cellValues) in table.columns.items():
+                for position, value in zip(positions, cellValues):
+                    values[(rows[position], column)] = value
+            for name, fieldId, row in log:
+                errors[(name, fieldId)] = row
+        now = time.monotonic()
+        cells = {}
+        for security in securities:
+            for field in fields:
+                entry = (values.get((security, field)),
+                         errors.get((security, None)),
+                         errors.get((security, field)),
+                         now + self.fieldTtl.get(field, self.ttl))
+                key = self._key(security, field, overrides)
+                self.cells[key] = entry
+                self.cells.move_to_end(key)
+                cells[(security, field)] = entry
+        while(len(self.cells) > self.maxSize):
+            self.cells.popitem(last=False)
+            self.stats['evictions'] += 1
+        return(cells)
+
+
+    def state(self, cells: dict, securities: list, fields: list,
+    types: dict=None) -> tuple:
+        """ Build the parsing state of a reference request from its cells. """
+        table = _Table(types)
+        exceptions = {}
+        for security in securities:
+            for field in fields:
+                value, securityError, _, _ = cells[(security, field)]
+                if value is not None:
+                    table.add(security, field, value)
+                if securityError is not None:
+                    exceptions[(security, None)] = securityError
+            for field in fields:
+                fieldError = cells[(security, field)][2]
+                if fieldError is not None:
+                    exceptions[(security, field)] = fieldError
+        return((table, exceptions, []))
+
+
+class FieldCache():
+    """ Persistent SQLite store of the field datatypes returned by
+    //blp/apiflds, so that each field is looked up once and not once per
+    session. """
+
+    def __init__(self, path: str='blpd.sqlite', ttl: float=30 * 86400.) -> None:
+        """ Open (or create) a field cache; datatypes older than ttl seconds
+        are looked up again. """
+        self.path = path
+        self.ttl = ttl
+        self.db = sqlite3.connect(path)
+        self.db.executescript(_SCHEMA)
+
+
+    def close(self) -> None:
+        """ Close the cache database. """
+        self.db.close()
+
+
+    def lookup(self, fields: list) -> dict:
+        """ Return the cached datatypes of some fields. """
+        rows = self.db.execute(
+            'SELECT field, datatype FROM fields WHERE lastUpdate > ? AND '
+            f'field IN ({",".join("?" * len(fields))})',
+            [time.time() - self.ttl, *fields]).fetchall()
+        return(dict(rows))
+
+
+    def store(self, datatypes: dict) -> None:
+        """ Cache the datatypes of some fields. """
+        now = time.time()
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO fields VALUES '
+                                '(?, ?, ?)', [(f, d, now) for f, d in
+                                datatypes.items()])
+
+
+    def clear(self) -> None:
+        """ Remove all the cached datatypes. """
+        with self.db:
+            self.db.execute('DELETE FROM fields')
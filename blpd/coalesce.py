@@ -0,0 +1,164 @@
+import threading
+import time
+import pandas as pd
+from typing import Callable, Union
+from blpd.blp import (BLP, basestring, _exceptionsFrame, _exceptionsRows,
+                      _formatSecsList)
+
+
+def _freeze(options: Union[dict, None]) -> tuple:
+    """ Make a hashable key of request options. """
+    if options is None:
+        return(())
+    return(tuple(sorted((k, _freeze(v) if isinstance(v, dict) else v)
+                        for k, v in options.items())))
+
+
+def _exceptions(exceptions: pd.DataFrame, securities: list, fields: list,
+errors: Union[bool, str]) -> pd.DataFrame:
+    """ Keep the exceptions of some securities and fields out of the shared
+    exceptions of errors='fields', in the layout asked for by errors. """
+    securities = set(securities)
+    fields = set(fields)
+    return(_exceptionsFrame({(s, f): row for (s, f), row in
+                             _exceptionsRows(exceptions).items()
+                             if s in securities and (f is None or
+                                                     f in fields)}, errors))
+
+
+class _Batch():
+    """ Securities and fields of the calls merged in one request, and the
+    shared response. """
+
+    def __init__(self) -> None:
+        """ Initialize an empty batch. """
+        self.securities = {}
+        self.fields = {}
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+    def covers(self, securities: list, fields: list) -> bool:
+        """ Tell if the batch includes all the securities and fields. """
+        return(all(s in self.securities for s in securities) and
+               all(f in self.fields for f in fields))
+
+
+class Coalescer():
+    """ Layer in front of BLP.bdp / BLP.bdh for calls from many threads: the
+    calls with the same options arriving within window seconds are merged
+    in one request over the union of their securities and fields, calls
+    covered by a request already in flight join it, and each caller gets
+    back only its own securities and fields. """
+
+    def __init__(self, conn: BLP, window: float=0.01) -> None:
+        """ Initialize a coalescing layer on a BLP (or BLPPool) session. """
+        self.conn = conn
+        self.window = window
+        self.stats = {'calls': 0, 'requests': 0, 'merged': 0, 'joined': 0}
+        self._open = {}
+        self._inflight = {}
+        self._cond = threading.Lock()
+        self._send = threading.Lock() if isinstance(conn, BLP) else None
+
+
+    def _request(self, key: tuple, securities: list, fields: list,
+    send: Callable) -> tuple:
+        """ Add a call to the open batch of its key (opening one if needed),
+        or join a batch in flight that covers it; return the shared result. """
+        leader = False
+        with self._cond:
+            self.stats['calls'] += 1
+            for batch in self._inflight.get(key, []):
+                if batch.covers(securities, fields):
+                    self.stats['joined'] += 1
+                    break
+            else:
+                batch = self._open.get(key)
+                if batch is None:
+                    batch = self._open[key] = _Batch()
+                    leader = True
+                else:
+                    self.stats['merged'] += 1
+                batch.securities.update(dict.fromkeys(securities))
+                batch.fields.update(dict.fromkeys(fields))
+        if leader is True:
+            time.sleep(self.window)
+            with self._cond:
+                del self._open[key]
+                self._inflight.setdefault(key, []).append(batch)
+                self.stats['requests'] += 1
+            try:
+                if self._send is None:
+                    batch.result = send(list(batch.securities),
+                                        list(batch.fields))
+                else:
+                    with self._send:
+                        batch.result = send(list(batch.securities),
+                                            list(batch.fields))
+            except Exception as e:
+                batch.error = e
+            finally:
+                with self._cond:
+                    self._inflight[key].remove(batch)
+                batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return(batch.result)
+
+
+    def bdp(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], prefix: Union['str', 'list']='ticker',
+    overrides: dict=None, swap: bool=False,
+    errors: Union[bool, str]=False) -> pd.DataFrame:
+        """ Send a reference request through the coalescing layer (same
+        arguments as BLP.bdp). """
+        if isinstance(securities, basestring):
+            securities = [securities]
+        if isinstance(fields, basestring):
+            fields = [fields]
+        securities = _formatSecsList(securities, prefix)
+        data, exceptions = self._request(('bdp', _freeze(overrides)),
+                                         securities, fields,
+                                         lambda s, f: self.conn.bdp(s, f,
+                                         overrides=overrides,
+                                         errors='fields'))
+        data = data.loc[[s for s in securities if s in data.index],
+                        [f for f in fields if f in data.columns]]
+        if swap is True:
+            data = data.T
+        if errors is False:
+            return(data)
+        else:
+            return(data, _exceptions(exceptions, securities, fields, errors))
+
+
+    def bdh(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], startDate: str, endDate: str='',
+    prefix: Union['str', 'list']='ticker', swap: bool=False,
+    errors: Union[bool, str]=False, **options) -> pd.DataFrame:
+        """ Send a historical request through the coalescing layer (same
+        arguments as BLP.bdh). """
+        if isinstance(securities, basestring):
+            securities = [securities]
+        if isinstance(fields, basestring):
+            fields = [fields]
+        securities = _formatSecsList(securities, prefix)
+        data, exceptions = self._request(('bdh', startDate, endDate,
+                                          _freeze(options)),
+                                         securities, fields,
+                                         lambda s, f: self.conn.bdh(s, f,
+                                         startDate, endDate,
+                                         errors='fields', **options))
+        if len(data.columns) > 0:
+            data = data[[(s, f) for s in securities for f in fields
+                         if (s, f) in data.columns]].dropna(how='all')
+        if swap is True:
+            data = data.swaplevel(axis=1)
+        if errors is False:
+            return(data)
+        else:
+            return(data, _exceptions(exceptions, securities, fields, errors))
@@ -0,0 +1,257 @@
+""" Long-lived local daemon keeping a BLP session open and answering bdp and
+bdh calls from local clients over a Unix socket, so that short scripts do
+not pay the connection and service opening at every run. The client imports
+neither blpapi nor pandas: results come back as the plain dicts of
+output='dict'. Start it with python -m blpd.daemon. """
+import argparse
+import datetime
+import json
+import os
+import socket
+import socketserver
+import stat
+import tempfile
+import threading
+from typing import TYPE_CHECKING, Union
+if TYPE_CHECKING:
+    from blpd.blp import BLP
+
+
+CALLS = ('bdp', 'bdh')
+
+
+def socketPath() -> str:
+    """ Return the default socket path, in $XDG_RUNTIME_DIR or else in a
+    directory of the temporary folder private to the current user (created
+    with mode 0700 if needed, refused if anyone else can use it). """
+    folder = os.environ.get('XDG_RUNTIME_DIR')
+    if not folder:
+        folder = os.path.join(tempfile.gettempdir(), f'blpd-{os.getuid()}')
+        os.makedirs(folder, mode=0o700, exist_ok=True)
+        info = os.lstat(folder)
+        if stat.S_ISDIR(info.st_mode) is False or \
+           info.st_uid != os.getuid() or info.st_mode & 0o077 != 0:
+            raise PermissionError(f'{folder} is not a private directory of '
+                                  'the current user')
+    return(os.path.join(folder, 'blpd.sock'))
+
+
+def _removeStale(path: str) -> None:
+    """ Remove the socket left at path by a daemon that is gone; refuse to
+    remove anything else, or the socket of a daemon still listening. """
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return()
+    if stat.S_ISSOCK(info.st_mode) is False or info.st_uid != os.getuid():
+        raise FileExistsError(f'{path} exists and is not a socket of the '
+                              'current user')
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.remove(path)
+        return()
+    finally:
+        probe.close()
+    raise FileExistsError(f'A daemon is already listening at {path}')
+
+
+def _pack(value):
+    """ Convert dates and times to tagged JSON objects. """
+    if isinstance(value, datetime.datetime):
+        return({'$dt': value.isoformat()})
+    elif isinstance(value, datetime.date):
+        return({'$d': value.isoformat()})
+    elif isinstance(value, datetime.time):
+        return({'$t': value.isoformat()})
+    else:
+        return(str(value))
+
+
+def _unpack(obj: dict):
+    """ Convert the tagged JSON objects back to dates and times. """
+    if len(obj) == 1:
+        if '$dt' in obj:
+            return(datetime.datetime.fromisoformat(obj['$dt']))
+        elif '$d' in obj:
+            return(datetime.date.fromisoformat(obj['$d']))
+        elif '$t' in obj:
+            return(datetime.time.fromisoformat(obj['$t']))
+    return(obj)
+
+
+def _dumps(obj) -> bytes:
+    """ Encode a message on one line. """
+    return(json.dumps(obj, default=_pack, separators=(',', ':')).encode() +
+           b'\n')
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """ Answer the calls of a client connection, one per line. """
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            self.wfile.write(_dumps(self.server.daemon.answer(line)))
+            self.wfile.flush()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class Daemon():
+    """ Unix socket server sharing one BLP session among local clients; the
+    calls are served one at a time. """
+
+    def __init__(self, path: str=None, conn: 'BLP'=None, **options) -> None:
+        """ Bind the socket at path (socketPath() by default, usable by the
+        current user only) to a BLP session, opened with the BLP options
+        unless conn is given. """
+        if path is None:
+            path = socketPath()
+        _removeStale(path)
+        if conn is None:
+            from blpd.blp import BLP
+            conn = BLP(**options)
+        self.conn = conn
+        self.path = path
+        self.stats = {'calls': 0, 'errors': 0, 'reconnects': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+        umask = os.umask(0o177)
+        try:
+            self.server = _Server(path, _Handler)
+        finally:
+            os.umask(umask)
+        self.server.daemon = self
+
+
+    def answer(self, line: bytes) -> dict:
+        """ Run a call and return its result, or its error. """
+        try:
+            request = json.loads(line, object_hook=_unpack)
+            if request['call'] not in CALLS:
+                raise ValueError(f'Unknown call {request["call"]}')
+            method = getattr(self.conn, request['call'])
+            kwargs = dict(request['kwargs'], output='dict')
+            with self._lock:
+                self.stats['calls'] += 1
+                try:
+                    result = method(*request['args'], **kwargs)
+                except ConnectionError:
+                    self.stats['reconnects'] += 1
+                    self.conn.close()
+                    self.conn.open()
+                    result = method(*request['args'], **kwargs)
+            return({'result': result})
+        except Exception as e:
+            self.stats['errors'] += 1
+            return({'error': f'{type(e).__name__}: {e}'})
+
+
+    def serve(self) -> None:
+        """ Answer the clients until close is called. """
+        self.server.serve_forever()
+
+
+    def start(self) -> None:
+        """ Answer the clients from a background thread. """
+        self._thread = threading.Thread(target=self.serve, daemon=True)
+        self._thread.start()
+
+
+    def close(self) -> None:
+        """ Stop serving, remove the socket and close the BLP session. """
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server.server_close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.conn.close()
+
+
+class Client():
+    """ Connection to a Daemon, with the bdp and bdh calls of BLP returning
+    the dicts of output='dict'. """
+
+    def __init__(self, path: str=None, timeout: float=None) -> None:
+        """ Connect to the daemon listening at path (socketPath() by
+        default). """
+        if path is None:
+            path = socketPath()
+        self.path = path
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+        self.file = self.sock.makefile('rwb')
+        self._lock = threading.Lock()
+
+
+    def __enter__(self) -> 'Client':
+        return(self)
+
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+    def close(self) -> None:
+        """ Close the connection. """
+        self.file.close()
+        self.sock.close()
+
+
+    def _call(self, call: str, args: list, kwargs: dict):
+        """ Send a call to the daemon and wait for its result. """
+        with self._lock:
+            self.file.write(_dumps({'call': call, 'args': args,
+                                    'kwargs': kwargs}))
+            self.file.flush()
+            line = self.file.readline()
+        if not line:
+            raise ConnectionError('The daemon closed the connection.')
+        reply = json.loads(line, object_hook=_unpack)
+        if 'error' in reply:
+            raise RuntimeError(reply['error'])
+        if kwargs.get('errors') is True:
+            return(tuple(reply['result']))
+        return(reply['result'])
+
+
+    def bdp(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], **options) -> dict:
+        """ Send a reference request through the daemon (same arguments as
+        BLP.bdp). """
+        return(self._call('bdp', [securities, fields], options))
+
+
+    def bdh(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], startDate: str, endDate: str='',
+    **options) -> dict:
+        """ Send a historical request through the daemon (same arguments as
+        BLP.bdh). """
+        return(self._call('bdh', [securities, fields, startDate, endDate],
+                          options))
+
+
+def main() -> None:
+    """ Run a daemon from the command line. """
+    parser = argparse.ArgumentParser(description='blpd session daemon')
+    parser.add_argument('--path', default=None)
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8194)
+    args = parser.parse_args()
+    daemon = Daemon(args.path, host=args.host, port=args.port)
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.close()
+
+
+if __name__ == '__main__':
+    main()
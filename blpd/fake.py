@@ -0,0 +1,685 @@
+import datetime
+import itertools
+import json
+import threading
+import time
+import zlib
+import blpapi as blp
+import numpy as np
+import pandas as pd
+from collections import deque
+from typing import Union
+
+
+_DATATYPES = {bool: blp.DataType.BOOL, int: blp.DataType.INT64,
+              float: blp.DataType.FLOAT64, str: blp.DataType.STRING,
+              datetime.date: blp.DataType.DATE,
+              datetime.datetime: blp.DataType.DATETIME,
+              datetime.time: blp.DataType.TIME}
+
+
+class FakeElement():
+    """ Stand-in for a blpapi Element: a scalar value, a sequence of named
+    sub-elements or an array of values. """
+
+    def __init__(self, name: str, value=None, elements: list=None,
+    values: list=None) -> None:
+        """ Initialize an element. """
+        self._name = name
+        self._value = value
+        self._elements = [] if elements is None else elements
+        self._values = values
+
+
+    def __repr__(self) -> str:
+        if self._values is not None:
+            return(f'{self._name}[{len(self._values)}]')
+        elif len(self._elements) > 0:
+            return(f'{self._name} = {{{", ".join(map(repr, self._elements))}}}')
+        else:
+            return(f'{self._name} = {self._value!r}')
+
+
+    def name(self) -> str:
+        return(self._name)
+
+
+    def datatype(self) -> int:
+        if self.isComplexType():
+            return(blp.DataType.SEQUENCE)
+        return(_DATATYPES.get(type(self._value), blp.DataType.STRING))
+
+
+    def isArray(self) -> bool:
+        return(self._values is not None)
+
+
+    def isNull(self) -> bool:
+        return(self._values is None and self._value is None and
+               len(self._elements) == 0)
+
+
+    def isComplexType(self) -> bool:
+        return(self._values is None and (len(self._elements) > 0 or
+               self._value is None))
+
+
+    def numValues(self) -> int:
+        return(0 if self._values is None else len(self._values))
+
+
+    def numElements(self) -> int:
+        return(len(self._elements))
+
+
+    def values(self) -> list:
+        return([] if self._values is None else self._values)
+
+
+    def elements(self) -> list:
+        return(self._elements)
+
+
+    def hasElement(self, name: str, excludeNullElements: bool=False) -> bool:
+        return(any(e._name == str(name) and not (excludeNullElements and
+                   e.isNull()) for e in self._elements))
+
+
+    def getElement(self, name: str) -> 'FakeElement':
+        for e in self._elements:
+            if e._name == str(name):
+                return(e)
+        raise KeyError(str(name))
+
+
+    def getValue(self, index: int=0):
+        return(self._value if self._values is None else self._values[index])
+
+
+    def getValueAsString(self) -> str:
+        return(str(self._value))
+
+
+    def getValueAsFloat(self) -> float:
+        return(float(self._value))
+
+
+    def getValueAsInteger(self) -> int:
+        return(int(self._value))
+
+
+    def getValueAsDatetime(self):
+        return(self._value)
+
+
+    def getElementAsDatetime(self, name: str):
+        return(self.getElement(name).getValueAsDatetime())
+
+
+    def getElementAsString(self, name: str) -> str:
+        return(self.getElement(name).getValueAsString())
+
+
+    def getElementAsFloat(self, name: str) -> float:
+        return(self.getElement(name).getValueAsFloat())
+
+
+    def getElementAsInteger(self, name: str) -> int:
+        return(self.getElement(name).getValueAsInteger())
+
+
+class FakeMessage(FakeElement):
+    """ Stand-in for a blpapi Message. """
+
+    def __init__(self, messageType: str, cid: blp.CorrelationId,
+    elements: list) -> None:
+        """ Initialize a message for a correlation ID. """
+        super().__init__(messageType, elements=elements)
+        self._cid = cid
+
+
+    def messageType(self) -> str:
+        return(self._name)
+
+
+    def correlationIds(self) -> list:
+        return([] if self._cid is None else [self._cid])
+
+
+    def asElement(self) -> FakeElement:
+        return(self)
+
+
+class FakeEvent():
+    """ Stand-in for a blpapi Event. """
+
+    def __init__(self, eventType: int, messages: list) -> None:
+        """ Initialize an event with its messages. """
+        self._eventType = eventType
+        self._messages = messages
+
+
+    def eventType(self) -> int:
+        return(self._eventType)
+
+
+    def __iter__(self):
+        return(iter(self._messages))
+
+
+class _FakeOverride():
+    """ Stand-in for an element of the overrides array of a request. """
+
+    def __init__(self) -> None:
+        self.values = {}
+
+
+    def setElement(self, name: str, value) -> None:
+        self.values[str(name)] = value
+
+
+class _FakeOverrides():
+    """ Stand-in for the overrides array of a request. """
+
+    def __init__(self) -> None:
+        self.overrides = []
+
+
+    def appendElement(self) -> _FakeOverride:
+        self.overrides.append(_FakeOverride())
+        return(self.overrides[-1])
+
+
+class FakeRequest():
+    """ Stand-in for a blpapi Request, recording what is set on it. """
+
+    def __init__(self, requestType: str) -> None:
+        """ Initialize an empty request. """
+        self.requestType = requestType
+        self.lists = {}
+        self.options = {}
+        self.overrides = _FakeOverrides()
+
+
+    def __repr__(self) -> str:
+        return(f'{self.requestType} {self.lists} {self.options}')
+
+
+    def append(self, name: str, value) -> None:
+        self.lists.setdefault(str(name), []).append(value)
+
+
+    def set(self, name: str, value) -> None:
+        self.options[str(name)] = value
+
+
+    def getElement(self, name: str) -> _FakeOverrides:
+        if str(name) == 'overrides':
+            return(self.overrides)
+        raise KeyError(str(name))
+
+
+    def asElement(self) -> FakeElement:
+        elements = [FakeElement(k, values=v) for k, v in self.lists.items()]
+        elements.extend(FakeElement(k, v) for k, v in self.options.items())
+        if len(self.overrides.overrides) > 0:
+            elements.append(FakeElement('overrides', values=[
+                            FakeElement(None, elements=[FakeElement(k, v)
+                            for k, v in o.values.items()])
+                            for o in self.overrides.overrides]))
+        return(FakeElement(self.requestType, elements=elements))
+
+
+class FakeService():
+    """ Stand-in for a blpapi Service. """
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+
+
+    def name(self) -> str:
+        return(self._name)
+
+
+    def createRequest(self, requestType: str) -> FakeRequest:
+        return(FakeRequest(requestType))
+
+
+class FakeSession():
+    """ Local stand-in for a blpapi Session answering reference and
+    historical requests with synthetic data (seeded, so repeatable) or with
+    recorded fixtures, in PARTIAL_RESPONSE / RESPONSE events. """
+
+    def __init__(self, seed: int=0, fixtures: dict=None,
+    badSecurities: list=(), badFields: list=(), stringFields: list=('NAME',),
+    bulkFields: list=('INDX_MEMBERS', 'INDX_MWEIGHT'), bulkRows: int=50,
+    partialSize: int=10, latency: float=0., missing: float=0.) -> None:
+        """ Initialize a fake session. fixtures maps 'reference' to
+        {security: {field: value}} and 'historical' to {security: {field:
+        {date: value}}}, 'bulk' to {security: {field: [{column: value}]}} and
+        'fields' to {field: datatype} (otherwise guessed from the values);
+        bulkFields are answered with bulkRows synthetic members and weights;
+        partialSize is the number of securities per message, latency the
+        delay before each event and missing the share of synthetic historical
+        cells left empty (as with fill='N' on mixed trading calendars). """
+        if isinstance(fixtures, str):
+            with open(fixtures) as f:
+                fixtures = json.load(f)
+        self.seed = seed
+        self.fixtures = {} if fixtures is None else fixtures
+        self.badSecurities = set(badSecurities)
+        self.badFields = set(badFields)
+        self.stringFields = set(stringFields)
+        self.bulkFields = set(bulkFields)
+        self.bulkRows = bulkRows
+        self.partialSize = partialSize
+        self.latency = latency
+        self.missing = missing
+        self.connected = True
+        self.closedServices = set()
+        self.services = []
+        self.requests = []
+        self.topics = {}
+        self._events = deque()
+        self._lock = threading.Condition()
+        self._cids = itertools.count(1)
+
+
+    def start(self) -> bool:
+        with self._lock:
+            self._events.clear()
+        self.connected = True
+        return(True)
+
+
+    def stop(self) -> bool:
+        return(True)
+
+
+    def openService(self, name: str) -> bool:
+        self.services.append(name)
+        return(name not in self.closedServices)
+
+
+    def getService(self, name: str) -> FakeService:
+        return(FakeService(name))
+
+
+    def sendRequest(self, request: FakeRequest,
+    correlationId: blp.CorrelationId=None) -> blp.CorrelationId:
+        """ Queue the response events of a request. """
+        if self.connected is False:
+            raise ConnectionError('Session is not connected.')
+        if correlationId is None:
+            correlationId = blp.CorrelationId(next(self._cids))
+        self.requests.append(request)
+        events = self._respond(request, correlationId)
+        with self._lock:
+            self._events.extend(events)
+            self._lock.notify_all()
+        return(correlationId)
+
+
+    def _respond(self, request: FakeRequest, cid: blp.CorrelationId) -> list:
+        """ Build the response events of a request. """
+        if request.requestType == 'ReferenceDataRequest':
+            return(self._referenceEvents(request, cid))
+        elif request.requestType == 'HistoricalDataRequest':
+            return(self._historicalEvents(request, cid))
+        elif request.requestType in ('IntradayBarRequest',
+                                     'IntradayTickRequest'):
+            return(self._intradayEvents(request, cid))
+        elif request.requestType == 'FieldInfoRequest':
+            return(self._fieldInfoEvents(request, cid))
+        else:
+            return([FakeEvent(blp.Event.REQUEST_STATUS, [FakeMessage(
+                   'RequestFailure', cid, [])])])
+
+
+    def subscribe(self, subscriptions: blp.SubscriptionList) -> None:
+        """ Start the subscriptions of a list. """
+        events = []
+        for i in range(subscriptions.size()):
+            topic = subscriptions.topicStringAt(i)
+            cid = subscriptions.correlationIdAt(i)
+            security, _, query = topic.partition('?')
+            fields = []
+            for option in query.split('&'):
+                if option.startswith('fields='):
+                    fields = option[len('fields='):].split(',')
+            self.topics[cid] = (security, fields)
+            messageType = 'SubscriptionFailure' if security in \
+                self.badSecurities else 'SubscriptionStarted'
+            events.append(FakeEvent(blp.Event.SUBSCRIPTION_STATUS,
+                          [FakeMessage(messageType, cid, [])]))
+        with self._lock:
+            self._events.extend(events)
+            self._lock.notify_all()
+
+
+    def resubscribe(self, subscriptions: blp.SubscriptionList) -> None:
+        """ Change the fields of existing subscriptions. """
+        self.subscribe(subscriptions)
+
+
+    def unsubscribe(self, subscriptions: blp.SubscriptionList) -> None:
+        """ Stop the subscriptions of a list. """
+        for i in range(subscriptions.size()):
+            self.topics.pop(subscriptions.correlationIdAt(i), None)
+
+
+    def publish(self, ticks: int=1, nulls: list=()) -> None:
+        """ Queue ticks rounds of SUBSCRIPTION_DATA events, one message per
+        active subscription with a value for each of its fields (a null
+        element for the fields in nulls). """
+        events = []
+        for n in range(ticks):
+            messages = []
+            for cid, (security, fields) in self.topics.items():
+                if security in self.badSecurities:
+                    continue
+                elements = []
+                for field in fields:
+                    if field in nulls:
+                        elements.append(FakeElement(field))
+                        continue
+                    key = f'{self.seed} {security} {field} {n}'.encode()
+                    elements.append(FakeElement(field,
+                                    f'{zlib.crc32(key) % 100000 / 100:.2f}'))
+                messages.append(FakeMessage('MarketDataEvents', cid,
+                                            elements))
+            events.append(FakeEvent(blp.Event.SUBSCRIPTION_DATA, messages))
+        with self._lock:
+            self._events.extend(events)
+            self._lock.notify_all()
+
+
+    def disconnect(self) -> None:
+        """ Simulate a lost connection: queue a SessionConnectionDown status
+        and refuse the requests until the session is started again. """
+        self.connected = False
+        with self._lock:
+            self._events.append(FakeEvent(blp.Event.SESSION_STATUS, [
+                                FakeMessage('SessionConnectionDown', None,
+                                [])]))
+            self._lock.notify_all()
+
+
+    def cancel(self, correlationId: blp.CorrelationId) -> None:
+        """ Drop the queued events of a request. """
+        with self._lock:
+            self._events = deque(ev for ev in self._events if all(
+                correlationId not in m.correlationIds() for m in ev))
+
+
+    def nextEvent(self, timeout: int=0) -> FakeEvent:
+        """ Return the next queued event, or a TIMEOUT event. """
+        with self._lock:
+            if len(self._events) == 0:
+                self._lock.wait(timeout / 1000 if timeout > 0 else None)
+            if len(self._events) == 0:
+                return(FakeEvent(blp.Event.TIMEOUT, []))
+            ev = self._events.popleft()
+        if self.latency > 0:
+            time.sleep(self.latency)
+        return(ev)
+
+
+    def _value(self, security: str, field: str) -> str:
+        """ Return the reference value of a security field. """
+        reference = self.fixtures.get('reference', {})
+        if security in reference:
+            return(reference[security].get(field))
+        if field in self.stringFields:
+            return(f'{field} {security}')
+        key = f'{self.seed} {security} {field}'.encode()
+        return(f'{zlib.crc32(key) % 100000 / 100:.2f}')
+
+
+    def _bulk(self, security: str, field: str) -> FakeElement:
+        """ Return the bulk value of a security field, None if there is none. """
+        bulk = self.fixtures.get('bulk', {})
+        if security in bulk:
+            if field not in bulk[security]:
+                return(None)
+            rows = bulk[security][field]
+        else:
+            weights = [zlib.crc32(f'{self.seed} {security} {i}'.encode()) %
+                       1000 + 1 for i in range(self.bulkRows)]
+            rows = [{'Member Ticker and Exchange Code': f'M{i} {security}',
+                     'Percentage Weight': round(100 * w / sum(weights), 6)}
+                    for i, w in enumerate(weights)]
+        return(FakeElement(field, values=[FakeElement(field, elements=[
+               FakeElement(k, v) for k, v in row.items()]) for row in rows]))
+
+
+    def _datatype(self, field: str) -> Union[str, None]:
+        """ Return the datatype of a field, None if it is not valid. """
+        if field in self.badFields:
+            return(None)
+        if field in self.fixtures.get('fields', {}):
+            return(self.fixtures['fields'][field])
+        if field in self.bulkFields:
+            return('Sequence')
+        if field in self.stringFields:
+            return('String')
+        for values in self.fixtures.get('reference', {}).values():
+            try:
+                float(values.get(field) or 0)
+            except ValueError:
+                return('String')
+        return('Double')
+
+
+    def _fieldInfoEvents(self, request: FakeRequest,
+    cid: blp.CorrelationId) -> list:
+        """ Build the events of a field info response. """
+        fieldData = []
+        for field in request.lists.get('id', []):
+            fieldId = f'DS{zlib.crc32(field.encode()) % 1000:03d}'
+            datatype = self._datatype(field)
+            if datatype is None:
+                fieldData.append(FakeElement(None, elements=[
+                                 FakeElement('id', field),
+                                 self._errorInfo('fieldError', 'BAD_FLD',
+                                 'INVALID_FIELD', 'Unknown Field Id/Mnemonic')]))
+            else:
+                fieldData.append(FakeElement(None, elements=[
+                                 FakeElement('id', fieldId),
+                                 FakeElement('fieldInfo', elements=[
+                                 FakeElement('mnemonic', field),
+                                 FakeElement('datatype', datatype)])]))
+        return(self._wrap([FakeMessage('fieldResponse', cid, [
+               FakeElement('fieldData', values=fieldData)])]))
+
+
+    def _errorInfo(self, name: str, category: str, subcategory: str,
+    message: str) -> FakeElement:
+        """ Build a securityError or errorInfo element. """
+        return(FakeElement(name, elements=[
+               FakeElement('source', 'fake'), FakeElement('code', -1),
+               FakeElement('category', category),
+               FakeElement('message', message),
+               FakeElement('subcategory', subcategory)]))
+
+
+    def _exceptions(self, fields: list) -> FakeElement:
+        """ Build the fieldExceptions array of a security. """
+        return(FakeElement('fieldExceptions', values=[
+               FakeElement(None, elements=[FakeElement('fieldId', f),
+               self._errorInfo('errorInfo', 'BAD_FLD', 'INVALID_FIELD',
+               'Field not valid')]) for f in fields if f in self.badFields]))
+
+
+    def _securityData(self, security: str, fieldData: FakeElement,
+    fields: list, sequenceNumber: int) -> FakeElement:
+        """ Build the securityData element of a security. """
+        elements = [FakeElement('security', security),
+                    FakeElement('eidData', values=[]),
+                    FakeElement('sequenceNumber', sequenceNumber)]
+        if security in self.badSecurities:
+            elements.append(self._errorInfo('securityError', 'BAD_SEC',
+                            'INVALID_SECURITY', 'Unknown/Invalid Security'))
+            fields = []
+        elements.append(self._exceptions(fields))
+        elements.append(fieldData)
+        return(FakeElement(None, elements=elements))
+
+
+    def _referenceEvents(self, request: FakeRequest,
+    cid: blp.CorrelationId) -> list:
+        """ Build the events of a reference response. """
+        securities = request.lists.get('securities', [])
+        fields = request.lists.get('fields', [])
+        secsData = []
+        for i, security in enumerate(securities):
+            fieldData = []
+            if security not in self.badSecurities:
+                for field in fields:
+                    if field in self.badFields:
+                        continue
+                    if field in self.bulkFields or security in \
+                       self.fixtures.get('bulk', {}):
+                        rows = self._bulk(security, field)
+                        if rows is not None:
+                            fieldData.append(rows)
+                        continue
+                    value = self._value(security, field)
+                    if value is not None:
+                        fieldData.append(FakeElement(field, value))
+            secsData.append(self._securityData(security, FakeElement(
+                            'fieldData', elements=fieldData), fields, i))
+        messages = [FakeMessage('ReferenceDataResponse', cid,
+                    [FakeElement('securityData', values=secsData[i:i +
+                    self.partialSize])]) for i in range(0, max(len(secsData),
+                    1), self.partialSize)]
+        return(self._wrap(messages))
+
+
+    def _dates(self, request: FakeRequest) -> pd.DatetimeIndex:
+        """ Return the dates of a historical request. """
+        startDate = str(request.options.get('startDate', ''))
+        endDate = str(request.options.get('endDate', ''))
+        end = pd.Timestamp(endDate) if endDate.isdigit() else \
+            pd.Timestamp.today().normalize()
+        start = pd.Timestamp(startDate) if startDate.isdigit() else \
+            end - pd.Timedelta(days=30)
+        if request.options.get('nonTradingDayFillOption') == \
+           'ALL_CALENDAR_DAYS':
+            dates = pd.date_range(start, end)
+        else:
+            dates = pd.bdate_range(start, end)
+        periods = {'WEEKLY': 'W', 'MONTHLY': 'M', 'QUARTERLY': 'Q',
+                   'SEMI_ANNUALLY': 'Q', 'YEARLY': 'Y'}
+        selection = request.options.get('periodicitySelection', 'DAILY')
+        if selection in periods and len(dates) > 0:
+            last = pd.Series(dates, index=dates.to_period(periods[selection]))
+            dates = pd.DatetimeIndex(last.groupby(level=0).max().to_numpy())
+            if selection == 'SEMI_ANNUALLY':
+                dates = dates[dates.month.isin([6, 12])]
+        return(dates)
+
+
+    def _history(self, security: str, field: str,
+    dates: pd.DatetimeIndex) -> list:
+        """ Return the historical values of a security field. """
+        historical = self.fixtures.get('historical', {})
+        if security in historical:
+            series = historical[security].get(field, {})
+            return([series.get(d.strftime('%Y-%m-%d')) for d in dates])
+        if field in self.stringFields:
+            return([f'{field} {security}'] * len(dates))
+        phase = zlib.crc32(f'{self.seed} {security} {field}'.encode()) % 360
+        days = (dates - pd.Timestamp('2000-01-01')).days.to_numpy()
+        noise = np.sin(days * 12.9898 + phase) * 43758.5453
+        walk = 100 + 20 * np.sin(days / 60 + phase) + 2 * (noise % 1)
+        gaps = (noise * 97) % 1 < self.missing
+        return([None if g else f'{v:.4f}' for v, g in zip(walk, gaps)])
+
+
+    def _historicalEvents(self, request: FakeRequest,
+    cid: blp.CorrelationId) -> list:
+        """ Build the events of a historical response, one message per
+        security. """
+        securities = request.lists.get('securities', [])
+        fields = request.lists.get('fields', [])
+        dates = self._dates(request)
+        labels = dates.strftime('%Y-%m-%d')
+        messages = []
+        for i, security in enumerate(securities):
+            rows = []
+            if security not in self.badSecurities:
+                good = [f for f in fields if f not in self.badFields]
+                columns = [self._history(security, f, dates) for f in good]
+                for j, date in enumerate(labels):
+                    elements = [FakeElement(f, c[j]) for f, c in
+                                zip(good, columns) if c[j] is not None]
+                    if len(elements) > 0:
+                        rows.append(FakeElement(None, elements=[
+                                    FakeElement('date', date)] + elements))
+            secData = self._securityData(security, FakeElement('fieldData',
+                                         values=rows), fields, i)
+            messages.append(FakeMessage('HistoricalDataResponse', cid,
+                            [FakeElement('securityData',
+                             elements=secData.elements())]))
+        return(self._wrap(messages))
+
+
+    def _wrap(self, messages: list) -> list:
+        """ Wrap messages in PARTIAL_RESPONSE events and a final RESPONSE. """
+        events = [FakeEvent(blp.Event.PARTIAL_RESPONSE, [m])
+                  for m in messages[:-1]]
+        events.append(FakeEvent(blp.Event.RESPONSE, messages[-1:]))
+        return(events)
+
+
+    def _intradayEvents(self, request: FakeRequest,
+    cid: blp.CorrelationId) -> list:
+        """ Build the events of an intraday bar or tick response, with bars
+        every interval minutes or ticks every 15 seconds between 8:00 and
+        16:30 on weekdays, in messages of 1000 items. """
+        security = request.options['security']
+        start = pd.Timestamp(request.options['startDateTime'])
+        end = pd.Timestamp(request.options['endDateTime'])
+        bars = request.requestType == 'IntradayBarRequest'
+        if security in self.badSecurities:
+            return(self._wrap([FakeMessage('IntradayBarResponse', cid, [
+                   self._errorInfo('responseError', 'BAD_SEC',
+                   'INVALID_SECURITY', 'Unknown/Invalid Security')])]))
+        if bars is True:
+            step = pd.Timedelta(minutes=request.options.get('interval', 1))
+            times = pd.date_range(start, end, freq=step)
+            times = times[times < end]
+        else:
+            times = pd.date_range(start, end, freq='15s')
+        minutes = times.hour * 60 + times.minute
+        times = times[(times.dayofweek < 5) & (minutes >= 480) &
+                      (minutes < 990)]
+        phase = zlib.crc32(f'{self.seed} {security}'.encode()) % 360
+        seconds = (times - pd.Timestamp('2000-01-01')).total_seconds()
+        prices = 100 + 20 * np.sin(seconds.to_numpy() / 86400 + phase)
+        items = []
+        for t, price in zip(times.to_pydatetime(), prices):
+            size = int(price * 7) % 500 + 1
+            if bars is True:
+                items.append(FakeElement(None, elements=[
+                             FakeElement('time', t),
+                             FakeElement('open', round(price - .05, 4)),
+                             FakeElement('high', round(price + .1, 4)),
+                             FakeElement('low', round(price - .1, 4)),
+                             FakeElement('close', round(price, 4)),
+                             FakeElement('volume', size * 10),
+                             FakeElement('numEvents', 10),
+                             FakeElement('value', round(price * size, 4))]))
+            else:
+                items.append(FakeElement(None, elements=[
+                             FakeElement('time', t),
+                             FakeElement('type', 'TRADE'),
+                             FakeElement('value', round(price, 4)),
+                             FakeElement('size', size)]))
+        outer, inner = ('barData', 'barTickData') if bars is True else \
+            ('tickData', 'tickData')
+        messages = [FakeMessage('IntradayResponse', cid, [FakeElement(outer,
+                    elements=[FakeElement(inner, values=items[i:i + 1000])])])
+                    for i in range(0, max(len(items), 1), 1000)]
+        return(self._wrap(messages))
@@ -0,0 +1,65 @@
+""" Hooks for the metrics records of BLP(metrics=...). A record is a dict with
+the call name and, in seconds, the //blp/apiflds lookup of the field
+datatypes (fields), the time queued by the scheduler (queued), the request
+build time (build), the time to the first event (firstEvent), the
+wait inside nextEvent (wait), the parse time (parse), the DataFrame assembly
+time (assembly) and the total; and as counts the requests sent, the events
+and PARTIAL_RESPONSE events received, the messages parsed and the cells
+returned. Any callable taking a record can be used, e.g. a list's append. """
+import logging
+import threading
+
+
+TIMES = ['fields', 'queued', 'build', 'firstEvent', 'wait', 'parse', 'assembly', 'total']
+COUNTS = ['requests', 'events', 'partial', 'messages', 'cells']
+
+
+class LogMetrics():
+    """ Log every record on one line. """
+
+    def __init__(self, logger: logging.Logger=None,
+    level: int=logging.INFO) -> None:
+        """ Initialize the hook with a logger (blpd by default). """
+        self.logger = logging.getLogger('blpd') if logger is None else logger
+        self.level = level
+
+
+    def __call__(self, record: dict) -> None:
+        if self.logger.isEnabledFor(self.level):
+            self.logger.log(self.level, ' '.join(
+                [record['call']] + [f'{k}={record[k]:.4f}' for k in TIMES
+                if record[k] is not None] + [f'{k}={record[k]}' for k in
+                COUNTS]))
+
+
+class Counters():
+    """ Accumulate the records in Prometheus-style counters per call. """
+
+    def __init__(self, prefix: str='blpd') -> None:
+        """ Initialize empty counters, named prefix_metric. """
+        self.prefix = prefix
+        self.totals = {}
+        self._lock = threading.Lock()
+
+
+    def __call__(self, record: dict) -> None:
+        with self._lock:
+            totals = self.totals.setdefault(record['call'], dict.fromkeys(
+                                            ['calls'] + TIMES + COUNTS, 0))
+            totals['calls'] += 1
+            for k in TIMES + COUNTS:
+                if record[k] is not None:
+                    totals[k] += record[k]
+
+
+    def text(self) -> str:
+        """ Return the counters in the Prometheus text exposition format. """
+        lines = []
+        with self._lock:
+            for k in ['calls'] + TIMES + COUNTS:
+                name = f'{self.prefix}_{k}_seconds_total' if k in TIMES \
+                    else f'{self.prefix}_{k}_total'
+                lines.append(f'# TYPE {name} counter')
+                lines.extend(f'{name}{{call="{call}"}} {totals[k]}'
+                             for call, totals in self.totals.items())
+        return('\n'.join(lines) + '\n')
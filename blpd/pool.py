@@ -0,0 +1,177 @@
+import threading
+import blpapi as blp
+from concurrent.futures import Future, ThreadPoolExecutor
+from blpd.blp import BLP
+
+
+class BLPPool():
+    """ Pool of warm BLP sessions on one or more hosts: each call is routed to
+    the healthy session with the fewest outstanding calls, retried on another
+    session if its own fails, and the failed sessions are reconnected in the
+    background. """
+
+    def __init__(self, hosts: list=(('localhost', 8194),), size: int=2,
+    verbose: bool=False, start: bool=True, sessions: list=None,
+    retries: int=1, healthInterval: float=30., **options) -> None:
+        """ Initialize a pool of size sessions per (host, port), or one BLP per
+        session object in sessions (e.g. FakeSessions); options are passed to
+        each BLP (memo, typed, fieldCache). """
+        self.hosts = list(hosts)
+        self.size = size
+        self.verbose = verbose
+        self.retries = retries
+        self.healthInterval = healthInterval
+        if sessions is None:
+            self.members = [BLP(host, port, verbose, False, **options)
+                            for host, port in self.hosts for _ in range(size)]
+        else:
+            self.members = [BLP(verbose=verbose, start=False, session=s,
+                            **options) for s in sessions]
+        self.outstanding = [0] * len(self.members)
+        self.healthy = [False] * len(self.members)
+        self.stats = {'calls': [0] * len(self.members), 'failovers': 0,
+                      'reconnects': 0}
+        self._locks = [threading.Lock() for _ in self.members]
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        self._executor = None
+        self.active = False
+        if start is True:
+            self.open()
+
+
+    def open(self) -> None:
+        """ Start all the sessions and the health check thread. """
+        if self.active is False:
+            for i in range(len(self.members)):
+                self._connect(i)
+            self._executor = ThreadPoolExecutor(len(self.members),
+                                                thread_name_prefix='BLPPool')
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._monitor,
+                                            name='BLPPoolHealth', daemon=True)
+            self._thread.start()
+            self.active = True
+
+
+    def close(self) -> None:
+        """ End all the sessions and the health check thread. """
+        if self.active is True:
+            self.active = False
+            self._stop.set()
+            self._thread.join()
+            self._executor.shutdown()
+            for member in self.members:
+                member.close()
+            if self.verbose is True:
+                print('Closing the pool...')
+
+
+    def _connect(self, i: int) -> bool:
+        """ (Re)start the session of a member and mark it healthy if it
+        succeeds. """
+        member = self.members[i]
+        member.close()
+        member.open()
+        with self._cond:
+            self.healthy[i] = member.active
+            self._cond.notify_all()
+        if self.verbose is True and member.active is False:
+            print(f'Session {i} is down.')
+        return(member.active)
+
+
+    def _monitor(self) -> None:
+        """ Reconnect the failed sessions every healthInterval seconds. """
+        while(self._stop.wait(self.healthInterval) is False):
+            self.check()
+
+
+    def check(self) -> list:
+        """ Try to reconnect the idle sessions that are down; return the
+        health of every session. """
+        for i in range(len(self.members)):
+            if self.healthy[i] is False and self._locks[i].acquire(False):
+                try:
+                    if self._connect(i) is True:
+                        self.stats['reconnects'] += 1
+                finally:
+                    self._locks[i].release()
+        return(list(self.healthy))
+
+
+    def _acquire(self, exclude: set) -> int:
+        """ Pick the healthy session with the fewest outstanding calls. """
+        with self._cond:
+            candidates = [i for i in range(len(self.members))
+                          if self.healthy[i] is True and i not in exclude]
+            if len(candidates) == 0:
+                raise ConnectionError('No session available.')
+            i = min(candidates, key=lambda i: self.outstanding[i])
+            self.outstanding[i] += 1
+            return(i)
+
+
+    def _call(self, method: str, args: tuple, kwargs: dict):
+        """ Run a BLP method on a session, failing over to another session
+        (up to retries times) if the connection is lost. """
+        tried = set()
+        error = ConnectionError('No session available.')
+        for _ in range(self.retries + 1):
+            try:
+                i = self._acquire(tried)
+            except ConnectionError:
+                break
+            try:
+                with self._locks[i]:
+                    self.stats['calls'][i] += 1
+                    return(getattr(self.members[i], method)(*args, **kwargs))
+            except (ConnectionError, blp.Exception) as e:
+                error = e
+                tried.add(i)
+                with self._cond:
+                    self.healthy[i] = False
+                self.stats['failovers'] += 1
+                if self.verbose is True:
+                    print(f'Session {i} failed ({e}), retrying.')
+            finally:
+                with self._cond:
+                    self.outstanding[i] -= 1
+        raise error
+
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        """ Run a BLP method (e.g. 'bdp') on the pool in the background and
+        return its Future, so that many calls run on all the sessions. """
+        return(self._executor.submit(self._call, method, args, kwargs))
+
+
+    def bdp(self, *args, **kwargs):
+        """ Send a reference request on the pool (same arguments as
+        BLP.bdp). """
+        return(self._call('bdp', args, kwargs))
+
+
+    def bdh(self, *args, **kwargs):
+        """ Send a historical request on the pool (same arguments as
+        BLP.bdh). """
+        return(self._call('bdh', args, kwargs))
+
+
+    def bds(self, *args, **kwargs):
+        """ Send a bulk reference request on the pool (same arguments as
+        BLP.bds). """
+        return(self._call('bds', args, kwargs))
+
+
+    def bdib(self, *args, **kwargs):
+        """ Send an intraday bar request on the pool (same arguments as
+        BLP.bdib). """
+        return(self._call('bdib', args, kwargs))
+
+
+    def bdit(self, *args, **kwargs):
+        """ Send an intraday tick request on the pool (same arguments as
+        BLP.bdit). """
+        return(self._call('bdit', args, kwargs))
@@ -0,0 +1,256 @@
+""" Record and replay of blpapi response events: RecordingSession wraps a
+session and saves the messages of every request, ReplaySession answers the
+same requests from disk without any connection. Requests are keyed by a hash
+of their canonical content; responses are stored as compressed JSON in an
+append-only data file, indexed in SQLite and read through a memory map. """
+import datetime
+import hashlib
+import json
+import mmap
+import sqlite3
+import threading
+import time
+import zlib
+import blpapi as blp
+from blpd.fake import FakeElement, FakeEvent, FakeMessage, FakeSession
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY, request TEXT, offset INTEGER, length INTEGER,
+    created REAL);
+'''
+
+
+def _pack(value):
+    """ Convert a scalar value to JSON, tagging dates and times. """
+    if isinstance(value, datetime.datetime):
+        return({'dt': value.replace(tzinfo=None).isoformat()})
+    elif isinstance(value, datetime.date):
+        return({'d': value.isoformat()})
+    elif isinstance(value, datetime.time):
+        return({'t': value.replace(tzinfo=None).isoformat()})
+    elif value is None or isinstance(value, (bool, int, float, str)):
+        return(value)
+    else:
+        return(str(value))
+
+
+def _unpack(value):
+    """ Convert a JSON scalar back to a value. """
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return(datetime.datetime.fromisoformat(value['dt']))
+        elif 'd' in value:
+            return(datetime.date.fromisoformat(value['d']))
+        else:
+            return(datetime.time.fromisoformat(value['t']))
+    return(value)
+
+
+def _isElement(value) -> bool:
+    """ Tell if an array value is an element or a scalar. """
+    return(hasattr(value, 'isArray'))
+
+
+def _encode(element) -> list:
+    """ Convert an element to [name, kind, payload], kind being 0 for a
+    scalar, 1 for an array and 2 for a sequence. """
+    name = element.name()
+    name = None if name is None else str(name)
+    if element.isArray():
+        return([name, 1, [_encode(v) if _isElement(v) else _pack(v)
+                          for v in element.values()]])
+    elif element.isComplexType():
+        return([name, 2, [_encode(e) for e in element.elements()]])
+    else:
+        return([name, 0, _pack(element.getValue())])
+
+
+def _decode(tree: list) -> FakeElement:
+    """ Convert [name, kind, payload] back to an element. """
+    name, kind, payload = tree
+    if kind == 0:
+        return(FakeElement(name, _unpack(payload)))
+    elif kind == 1:
+        return(FakeElement(name, values=[_decode(v) if isinstance(v, list)
+                                         else _unpack(v) for v in payload]))
+    else:
+        return(FakeElement(name, elements=[_decode(e) for e in payload]))
+
+
+def _canonical(element):
+    """ Convert the content of a request to plain values, skipping the unset
+    elements and the names of the array items. """
+    if element.isArray():
+        return([_canonical(v) if _isElement(v) else _pack(v)
+                for v in element.values()])
+    elif element.isComplexType():
+        content = {}
+        for e in element.elements():
+            value = _canonical(e)
+            if value not in (None, [], {}):
+                content[str(e.name())] = value
+        return(content)
+    elif element.isNull():
+        return(None)
+    else:
+        return(_pack(element.getValue()))
+
+
+def requestKey(request: blp.Request) -> tuple:
+    """ Return the hash and the canonical text of a request. """
+    element = request.asElement()
+    text = json.dumps([str(element.name()), _canonical(element)],
+                      sort_keys=True, separators=(',', ':'))
+    return((hashlib.sha1(text.encode()).hexdigest(), text))
+
+
+class _Store():
+    """ Append-only data file of compressed responses with a SQLite index. """
+
+    def __init__(self, path: str) -> None:
+        """ Open (or create) a store. """
+        self.path = path
+        self.db = sqlite3.connect(path + '.index', check_same_thread=False)
+        self.db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+        self._map = None
+        open(path, 'ab').close()
+
+
+    def close(self) -> None:
+        """ Close the index and the memory map. """
+        if self._map is not None:
+            self._map.close()
+        self.db.close()
+
+
+    def put(self, key: str, request: str, events: list) -> None:
+        """ Append the events of a request, replacing an older recording. """
+        blob = zlib.compress(json.dumps(events, separators=(',', ':'))
+                             .encode())
+        with self._lock:
+            with open(self.path, 'ab') as f:
+                offset = f.tell()
+                f.write(blob)
+            with self.db:
+                self.db.execute('INSERT OR REPLACE INTO responses VALUES '
+                                '(?, ?, ?, ?, ?)', (key, request, offset,
+                                len(blob), time.time()))
+
+
+    def get(self, key: str) -> list:
+        """ Return the events of a request, None if it was not recorded. """
+        with self._lock:
+            row = self.db.execute('SELECT offset, length FROM responses '
+                                  'WHERE key=?', (key, )).fetchone()
+            if row is None:
+                return(None)
+            offset, length = row
+            if self._map is None or len(self._map) < offset + length:
+                if self._map is not None:
+                    self._map.close()
+                with open(self.path, 'rb') as f:
+                    self._map = mmap.mmap(f.fileno(), 0,
+                                          access=mmap.ACCESS_READ)
+            blob = self._map[offset:offset + length]
+        return(json.loads(zlib.decompress(blob)))
+
+
+    def keys(self) -> list:
+        """ Return the keys of the recorded requests. """
+        with self._lock:
+            return([k for k, in self.db.execute('SELECT key FROM responses')])
+
+
+class RecordingSession():
+    """ Wrapper of a session saving the response messages of each request
+    while passing the events through unchanged. """
+
+    def __init__(self, session: blp.Session, path: str) -> None:
+        """ Wrap a session, recording to the store at path. """
+        self.session = session
+        self.store = _Store(path)
+        self._open = {}
+        self._lock = threading.Lock()
+
+
+    def __getattr__(self, name: str):
+        return(getattr(self.session, name))
+
+
+    def stop(self) -> bool:
+        self.store.close()
+        return(self.session.stop())
+
+
+    def sendRequest(self, request: blp.Request,
+    correlationId: blp.CorrelationId=None, **kwargs) -> blp.CorrelationId:
+        """ Send a request and start recording its response. """
+        key = requestKey(request)
+        if correlationId is None:
+            correlationId = self.session.sendRequest(request, **kwargs)
+            with self._lock:
+                self._open[correlationId] = (key, [])
+        else:
+            with self._lock:
+                self._open[correlationId] = (key, [])
+            self.session.sendRequest(request, correlationId=correlationId,
+                                     **kwargs)
+        return(correlationId)
+
+
+    def cancel(self, correlationId: blp.CorrelationId) -> None:
+        with self._lock:
+            self._open.pop(correlationId, None)
+        return(self.session.cancel(correlationId))
+
+
+    def nextEvent(self, timeout: int=0) -> blp.Event:
+        """ Return the next event, recording the messages of the pending
+        requests and saving each response when it is complete. """
+        ev = self.session.nextEvent(timeout)
+        if len(self._open) == 0:
+            return(ev)
+        done = ev.eventType() in (blp.Event.RESPONSE, blp.Event.REQUEST_STATUS)
+        groups = {}
+        with self._lock:
+            for msg in ev:
+                for cid in msg.correlationIds():
+                    if cid in self._open:
+                        groups.setdefault(cid, []).append(
+                            [str(msg.messageType()),
+                             [_encode(e) for e in msg.asElement().elements()]])
+            finished = []
+            for cid, messages in groups.items():
+                self._open[cid][1].append([int(ev.eventType()), messages])
+                if done is True:
+                    finished.append(self._open.pop(cid))
+        for (key, text), events in finished:
+            self.store.put(key, text, events)
+        return(ev)
+
+
+class ReplaySession(FakeSession):
+    """ Stand-in for a session answering the recorded requests from disk;
+    the requests never recorded fail with a RequestFailure status. """
+
+    def __init__(self, path: str, latency: float=0.) -> None:
+        """ Open the store at path. """
+        super().__init__(latency=latency)
+        self.store = _Store(path)
+        self.stats = {'hits': 0, 'misses': 0}
+
+
+    def _respond(self, request: blp.Request, cid: blp.CorrelationId) -> list:
+        """ Rebuild the recorded events of a request for a correlation ID. """
+        events = self.store.get(requestKey(request)[0])
+        if events is None:
+            self.stats['misses'] += 1
+            return([FakeEvent(blp.Event.REQUEST_STATUS, [FakeMessage(
+                   'RequestFailure', cid, [])])])
+        self.stats['hits'] += 1
+        return([FakeEvent(eventType, [FakeMessage(messageType, cid,
+                [_decode(e) for e in elements]) for messageType, elements in
+                messages]) for eventType, messages in events])
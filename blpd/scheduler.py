@@ -0,0 +1,151 @@
+import itertools
+import threading
+import time
+
+
+INTERACTIVE = 0
+NORMAL = 1
+BACKFILL = 2
+
+
+class _Bucket():
+    """ Token bucket refilled at rate tokens per second up to capacity; the
+    balance goes negative when a cost larger than the capacity is charged,
+    and that debt is repaid before the next request. """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """ Initialize a full bucket. """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+
+
+    def refill(self, now: float) -> None:
+        """ Add the tokens accrued since the last refill. """
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) *
+                          self.rate)
+        self.last = now
+
+
+    def wait(self, tokens: float) -> float:
+        """ Seconds before a cost of tokens can be charged: once the tokens
+        are available, or the bucket is full if they exceed its capacity. """
+        return(max(0., (min(tokens, self.capacity) - self.tokens) / self.rate))
+
+
+    def take(self, tokens: float) -> None:
+        """ Charge the full cost, leaving a debt if it exceeds the balance. """
+        self.tokens -= tokens
+
+
+class Scheduler():
+    """ Client-side limiter shared by BLP sessions: token buckets on requests
+    per second and on security x field hits per second, a cap on the
+    outstanding requests, and a queue served by priority (INTERACTIVE before
+    NORMAL before BACKFILL) and, within a priority, to the caller that was
+    served the fewest hits. """
+
+    def __init__(self, requestRate: float=None, requestBurst: float=None,
+    hitRate: float=None, hitBurst: float=None,
+    maxOutstanding: int=None) -> None:
+        """ Initialize a scheduler; None means no limit. The bursts default to
+        one second of rate; a daily quota can be spread with e.g.
+        hitRate=quota / 86400 and a large hitBurst. """
+        self.buckets = []
+        self._requests = self._hits = None
+        if requestRate is not None:
+            self._requests = _Bucket(requestRate, requestBurst or
+                                     max(1., requestRate))
+            self.buckets.append(self._requests)
+        if hitRate is not None:
+            self._hits = _Bucket(hitRate, hitBurst or max(1., hitRate))
+            self.buckets.append(self._hits)
+        self.maxOutstanding = maxOutstanding
+        self.outstanding = 0
+        self.served = {}
+        self.stats = {'requests': 0, 'hits': 0, 'waits': 0, 'waited': 0.,
+                      'maxWait': 0., 'maxDepth': 0, 'waitedByPriority': {}}
+        self._waiting = {}
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+
+    @property
+    def depth(self) -> int:
+        """ Number of requests waiting in the queue. """
+        return(len(self._waiting))
+
+
+    def _first(self, ticket: tuple) -> bool:
+        """ Tell if a ticket comes before all the waiting ones. """
+        def rank(t):
+            return((t[0], self.served.get(t[1], 0), t[2]))
+        return(all(rank(ticket) <= rank(t) for t in self._waiting))
+
+
+    def _delay(self, hits: int) -> float:
+        """ Seconds before a request of hits can be sent, 0 if now; None if
+        it must wait for an outstanding request to end. """
+        if self.maxOutstanding is not None and \
+           self.outstanding >= self.maxOutstanding:
+            return(None)
+        now = time.monotonic()
+        delay = 0.
+        if self._requests is not None:
+            self._requests.refill(now)
+            delay = max(delay, self._requests.wait(1))
+        if self._hits is not None:
+            self._hits.refill(now)
+            delay = max(delay, self._hits.wait(hits))
+        return(delay)
+
+
+    def acquire(self, hits: int=1, priority: int=NORMAL, caller=None,
+    block: bool=True) -> bool:
+        """ Wait for the right to send a request of hits security x field
+        hits; caller defaults to the current thread. Without block, return
+        False at once if the request cannot be sent now. """
+        if caller is None:
+            caller = threading.current_thread().name
+        start = time.monotonic()
+        with self._cond:
+            ticket = (priority, caller, next(self._seq))
+            if block is False:
+                if self._first(ticket) is False or self._delay(hits) != 0.:
+                    return(False)
+            else:
+                self._waiting[ticket] = start
+                self.stats['maxDepth'] = max(self.stats['maxDepth'],
+                                             len(self._waiting))
+                while(True):
+                    delay = self._delay(hits)
+                    if self._first(ticket) is True and delay == 0.:
+                        break
+                    self._cond.wait(None if delay is None or
+                                    self._first(ticket) is False else delay)
+                del self._waiting[ticket]
+            if self._requests is not None:
+                self._requests.take(1)
+            if self._hits is not None:
+                self._hits.take(hits)
+            self.outstanding += 1
+            self.served[caller] = self.served.get(caller, 0) + hits
+            waited = time.monotonic() - start
+            self.stats['requests'] += 1
+            self.stats['hits'] += hits
+            if waited > 0.001:
+                self.stats['waits'] += 1
+            self.stats['waited'] += waited
+            self.stats['maxWait'] = max(self.stats['maxWait'], waited)
+            byPriority = self.stats['waitedByPriority']
+            byPriority[priority] = byPriority.get(priority, 0.) + waited
+            self._cond.notify_all()
+        return(True)
+
+
+    def release(self) -> None:
+        """ Mark an outstanding request as ended. """
+        with self._cond:
+            self.outstanding -= 1
+            self._cond.notify_all()
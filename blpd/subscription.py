@@ -0,0 +1,257 @@
+import logging
+import threading
+import time
+import blpapi as blp
+import numpy as np
+import pandas as pd
+from typing import Callable, Union
+from blpd.blp import basestring, _formatSecsList
+
+
+_logger = logging.getLogger('blpd')
+
+
+class Subscription():
+    """ Implementation of the Subscription Paradigm to mimick Excel live BDP:
+    a background thread handles the SUBSCRIPTION_DATA events and keeps the
+    latest values and a bounded tick history of each security in
+    preallocated NumPy ring buffers. """
+
+    def __init__(self, host: str='localhost', port: int=8194,
+    verbose: bool=False, start: bool=True, session: blp.Session=None,
+    depth: int=100, callback: Callable=None, throttle: float=None) -> None:
+        """ Initialize a subscription session. depth is the number of ticks
+        kept per security; callback(security, values) is called on every
+        update, at most every throttle seconds per security if given. """
+        self.active = False
+        self.host = host
+        self.port = port
+        self.verbose = verbose
+        self.depth = depth
+        self.callback = callback
+        self.throttle = throttle
+        self._session = session
+        self._thread = None
+        self._lock = threading.Lock()
+        self.securities = []
+        self.fields = []
+        self._rows = {}
+        self._active = {}
+        self._names = []
+        self._last = np.full((0, 0), np.nan)
+        self._ticks = np.full((0, depth, 0), np.nan)
+        self._times = np.zeros((0, depth))
+        self._counts = np.zeros(0, dtype=np.int64)
+        self.strings = {}
+        self.status = {}
+        self._called = np.zeros(0)
+        if start is True:
+            self.open()
+
+
+    def open(self) -> None:
+        """ Start a session, open the mktdata service and the event thread. """
+        if self.active is False:
+            sessionOptions = blp.SessionOptions()
+            sessionOptions.setServerHost(self.host)
+            sessionOptions.setServerPort(self.port)
+            if self.verbose is True:
+                print(f'Connecting to {self.host}:{self.port}.')
+            if self._session is None:
+                self.session = blp.Session(sessionOptions)
+            else:
+                self.session = self._session
+            if self.session.start() is False:
+                print('Failed to start session.') # Raise error
+                return()
+            if self.session.openService('//blp/mktdata') is False:
+                print('Failed to open mktdata service.') # Raise error
+                return()
+            if self.verbose is True:
+                print('Opening mktdata service...')
+            self.active = True
+            self._thread = threading.Thread(target=self._dispatch,
+                                            name='Subscription', daemon=True)
+            self._thread.start()
+
+
+    def close(self) -> None:
+        """ End the session and its event thread. """
+        if self.active is True:
+            self.active = False
+            self._thread.join()
+            self.session.stop()
+            if self.verbose is True:
+                print('Closing the session...')
+
+
+    def _grow(self, nSecs: int, nFlds: int) -> None:
+        """ Enlarge the buffers (by doubling) to hold nSecs securities and
+        nFlds fields. Only called when subscribing, never per tick. """
+        secs, flds = self._last.shape
+        if nSecs <= secs and nFlds <= flds:
+            return()
+        newSecs = max(nSecs, 2 * secs) if nSecs > secs else secs
+        newFlds = max(nFlds, flds)
+        last = np.full((newSecs, newFlds), np.nan)
+        last[:secs, :flds] = self._last
+        ticks = np.full((newSecs, self.depth, newFlds), np.nan)
+        ticks[:secs, :, :flds] = self._ticks
+        times = np.zeros((newSecs, self.depth))
+        times[:secs] = self._times
+        counts = np.zeros(newSecs, dtype=np.int64)
+        counts[:secs] = self._counts
+        called = np.zeros(newSecs)
+        called[:secs] = self._called
+        self._last, self._ticks, self._times = last, ticks, times
+        self._counts, self._called = counts, called
+
+
+    def subscribe(self, securities: Union['str', 'list'],
+    fields: Union['str', 'list'], prefix: Union['str', 'list']='ticker',
+    interval: float=None) -> None:
+        """ Subscribe to securities and fields; interval asks the server to
+        conflate the updates every interval seconds. """
+        if isinstance(securities, basestring):
+            securities = [securities]
+        if isinstance(fields, basestring):
+            fields = [fields]
+        securities = _formatSecsList(securities, prefix)
+        subscriptions = blp.SubscriptionList()
+        with self._lock:
+            old = list(self._active)
+            newFields = [f for f in dict.fromkeys(fields)
+                         if f not in self.fields]
+            for fld in newFields:
+                self.fields.append(fld)
+                self._names.append(blp.Name(fld))
+            new = [s for s in dict.fromkeys(securities) if s not in self._rows]
+            self._grow(len(self.securities) + len(new), len(self.fields))
+            for sec in new:
+                self._rows[sec] = len(self.securities)
+                self.securities.append(sec)
+            start = [s for s in dict.fromkeys(securities)
+                     if s not in self._active]
+            self._active.update(dict.fromkeys(start))
+        options = [] if interval is None else [f'interval={interval}']
+        for sec in start:
+            subscriptions.add(sec, self.fields, options,
+                              blp.CorrelationId(self._rows[sec]))
+        if self.verbose is True:
+            print(f'Subscribing to {len(start)} securities.')
+        if len(start) > 0:
+            self.session.subscribe(subscriptions)
+        if len(newFields) > 0 and len(old) > 0:
+            resubscriptions = blp.SubscriptionList()
+            for sec in old:
+                resubscriptions.add(sec, self.fields, options,
+                                    blp.CorrelationId(self._rows[sec]))
+            self.session.resubscribe(resubscriptions)
+
+
+    def unsubscribe(self, securities: Union['str', 'list']=None,
+    prefix: Union['str', 'list']='ticker') -> None:
+        """ Cancel the subscription of some securities (all if None); their
+        last values stay in the buffers and subscribe starts them again. """
+        if securities is None:
+            securities = list(self._active)
+        else:
+            if isinstance(securities, basestring):
+                securities = [securities]
+            securities = _formatSecsList(securities, prefix)
+        with self._lock:
+            securities = [s for s in dict.fromkeys(securities)
+                          if s in self._active]
+            for sec in securities:
+                del self._active[sec]
+        subscriptions = blp.SubscriptionList()
+        for sec in securities:
+            subscriptions.add(sec, correlationId=blp.CorrelationId(
+                              self._rows[sec]))
+        if len(securities) > 0:
+            self.session.unsubscribe(subscriptions)
+
+
+    def _dispatch(self) -> None:
+        """ Handle the session events until the session is closed. """
+        while(self.active is True):
+            ev = self.session.nextEvent(500)
+            if ev.eventType() == blp.Event.SUBSCRIPTION_DATA:
+                for msg in ev:
+                    try:
+                        for cid in msg.correlationIds():
+                            self._update(cid.value(), msg)
+                    except Exception:
+                        _logger.exception('Failed to handle a tick: %s', msg)
+            elif ev.eventType() == blp.Event.SUBSCRIPTION_STATUS:
+                for msg in ev:
+                    try:
+                        for cid in msg.correlationIds():
+                            self.status[self.securities[cid.value()]] = \
+                                str(msg.messageType())
+                    except Exception:
+                        _logger.exception('Failed to handle a status: %s',
+                                          msg)
+
+
+    def _update(self, row: int, msg: blp.Message) -> None:
+        """ Store the fields of a tick in the buffers of a security. """
+        names = list(self._names)
+        values = np.full(len(names), np.nan)
+        strings = {}
+        for j, name in enumerate(names):
+            if msg.hasElement(name, True):
+                try:
+                    values[j] = msg.getElementAsFloat(name)
+                except Exception:
+                    strings[(row, j)] = msg.getElementAsString(name)
+        updated = ~np.isnan(values)
+        now = time.time()
+        with self._lock:
+            for j in np.flatnonzero(updated):
+                self.strings.pop((row, j), None)
+            self.strings.update(strings)
+            last = self._last[row, :len(names)]
+            last[updated] = values[updated]
+            slot = self._counts[row] % self.depth
+            self._ticks[row, slot, :len(names)] = last
+            self._times[row, slot] = now
+            self._counts[row] += 1
+        if self.callback is not None:
+            if self.throttle is None or now - self._called[row] >= \
+               self.throttle:
+                self._called[row] = now
+                try:
+                    self.callback(self.securities[row], dict(zip(self.fields,
+                                  values.tolist())))
+                except Exception:
+                    _logger.exception('Subscription callback failed for %s',
+                                      self.securities[row])
+
+
+    def snapshot(self) -> pd.DataFrame:
+        """ Return the latest values of all the securities (one copy of the
+        buffer, not one per tick). """
+        with self._lock:
+            values = self._last[:len(self.securities), :len(self.fields)].copy()
+            strings = dict(self.strings)
+        data = pd.DataFrame(values, index=list(self.securities),
+                            columns=list(self.fields))
+        for (row, j), value in strings.items():
+            if data[self.fields[j]].dtype != object:
+                data[self.fields[j]] = data[self.fields[j]].astype(object)
+            data.iat[row, j] = value
+        return(data)
+
+
+    def ticks(self, security: str, prefix: str='ticker') -> pd.DataFrame:
+        """ Return the tick history of a security in time order. """
+        row = self._rows[_formatSecsList([security], prefix)[0]]
+        with self._lock:
+            count = self._counts[row]
+            order = np.arange(max(0, count - self.depth), count) % \
+                self.depth
+            values = self._ticks[row, order, :len(self.fields)]
+            times = self._times[row, order]
+        return(pd.DataFrame(values, columns=list(self.fields),
+               index=pd.to_datetime(times, unit='s')))
@@ -1,7 +1,8 @@
+import asyncio
 import unittest
 import numpy as np
 import pandas as pd
-from blpd import blp
+from blpd import aio, blp
 
 
 class TestBLP(unittest.TestCase):
@@ -75,6 +76,15 @@ class TestBLP(unittest.TestCase):
         pd.util.testing.assert_frame_equal(data, data_)
 
 
+    def test_bdp_two_secs_two_fields_chunked(self):
+        data = self.conn.bdp(['UCG IM Equity', 'ISP IM Equity'], ['NAME',
+        'COUNTRY_FULL_NAME'], chunkSecs=1, chunkFlds=1)
+        data_ = pd.DataFrame(columns=['NAME', 'COUNTRY_FULL_NAME'],
+        index=['UCG IM Equity', 'ISP IM Equity'], data=[['UNICREDIT SPA',
+        'ITALY'], ['INTESA SANPAOLO', 'ITALY']])
+        pd.util.testing.assert_frame_equal(data, data_)
+
+
     def test_bdp_two_secs_two_fields_one_missing(self):
         data, err = self.conn.bdp(['UCG IM Equity', 'EI643289@BGN Corp'],
         ['NAME', 'CPN'], errors=True)
@@ -119,5 +129,30 @@ class TestBLP(unittest.TestCase):
         pd.util.testing.assert_frame_equal(data, data_)
 
 
+class TestAsyncBLP(unittest.TestCase):
+
+
+    def setUp(self):
+        self.conn = aio.AsyncBLP()
+
+
+    def tearDown(self):
+        self.conn.close()
+
+
+    def test_bdp_concurrent_calls(self):
+        async def calls():
+            return(await asyncio.gather(
+            self.conn.bdp('UCG IM Equity', 'NAME'),
+            self.conn.bdp('ISP IM Equity', 'NAME')))
+        data, data2 = asyncio.run(calls())
+        data_ = pd.DataFrame(columns=['NAME'], index=['UCG IM Equity'],
+        data=['UNICREDIT SPA'])
+        data2_ = pd.DataFrame(columns=['NAME'], index=['ISP IM Equity'],
+        data=['INTESA SANPAOLO'])
+        pd.util.testing.assert_frame_equal(data, data_)
+        pd.util.testing.assert_frame_equal(data2, data2_)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,816 @@
+import asyncio
+import datetime
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import numpy as np
+import pandas as pd
+from blpd import (aio, backfill, blp, cache, coalesce, daemon, fake, metrics,
+                  pool, scheduler, subscription)
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+
+FIXTURES = {'reference': {'UCG IM Equity': {'NAME': 'UNICREDIT SPA',
+                                            'COUNTRY_FULL_NAME': 'ITALY'},
+                          'ISP IM Equity': {'NAME': 'INTESA SANPAOLO',
+                                            'COUNTRY_FULL_NAME': 'ITALY',
+                                            'CPN': None}}}
+
+
+class SilentSession(fake.FakeSession):
+    """ Fake session that never answers the reference requests. """
+
+    def _respond(self, request, cid):
+        if request.requestType == 'ReferenceDataRequest':
+            return([])
+        return(super()._respond(request, cid))
+
+
+class FailingSession(fake.FakeSession):
+    """ Fake session whose connection drops on the requests of SEC3. """
+
+    def sendRequest(self, request, correlationId=None):
+        if 'SEC3 Equity' in request.lists.get('securities', []):
+            raise ConnectionError('Session is not connected.')
+        return(super().sendRequest(request, correlationId))
+
+
+class TestFakeBLP(unittest.TestCase):
+
+
+    def setUp(self):
+        self.session = fake.FakeSession(fixtures=FIXTURES,
+        badSecurities=['UCT IM Equity'], badFields=['NAMT'], partialSize=1)
+        self.conn = blp.BLP(session=self.session)
+
+
+    def tearDown(self):
+        self.conn.close()
+
+
+    def test_bdp_two_secs_two_fields(self):
+        data = self.conn.bdp(['UCG IM Equity', 'ISP IM Equity'], ['NAME',
+        'COUNTRY_FULL_NAME'])
+        data_ = pd.DataFrame(columns=['NAME', 'COUNTRY_FULL_NAME'],
+        index=['UCG IM Equity', 'ISP IM Equity'], data=[['UNICREDIT SPA',
+        'ITALY'], ['INTESA SANPAOLO', 'ITALY']])
+        pd.testing.assert_frame_equal(data, data_)
+
+
+    def test_bdp_errors(self):
+        data, err = self.conn.bdp(['UCT IM Equity', 'UCG IM Equity'],
+        ['NAME', 'NAMT'], errors=True)
+        self.assertEqual(list(data.index), ['UCG IM Equity'])
+        self.assertEqual(list(err['Category']), ['BAD_SEC', 'BAD_FLD'])
+        self.assertEqual(err.loc['UCG IM Equity', 'Field'], 'NAMT')
+
+
+    def test_bdp_chunked(self):
+        securities = [f'SEC{i} Equity' for i in range(11)]
+        fields = ['NAME', 'PX_LAST', 'CRNCY', 'VOLUME']
+        data = self.conn.bdp(securities, fields)
+        data_ = self.conn.bdp(securities, fields, chunkSecs=3, chunkFlds=2,
+        maxPending=2)
+        pd.testing.assert_frame_equal(data, data_)
+        self.assertEqual(len([r for r in self.session.requests if
+        r.requestType == 'ReferenceDataRequest']), 1 + 4 * 2)
+
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_bdh_arrow(self):
+        securities = ['UCG IM Equity', 'ISP IM Equity']
+        fields = ['PX_LAST', 'PX_OPEN']
+        data = self.conn.bdh(securities, fields, '20200101', '20200131')
+        table = self.conn.bdh(securities, fields, '20200101', '20200131',
+        output='arrow')
+        self.assertEqual(table.column_names, ['date', 'security'] + fields)
+        self.assertEqual(table.num_rows, 2 * len(data))
+        np.testing.assert_array_equal(table['PX_LAST'].to_numpy()[:len(data)],
+        data['UCG IM Equity', 'PX_LAST'].to_numpy())
+        long = self.conn.bdh(securities, fields, '20200101', '20200131',
+        long=True)
+        table = self.conn.bdh(securities, fields, '20200101', '20200131',
+        long=True, output='arrow')
+        self.assertEqual(table.column_names, list(long.columns))
+        np.testing.assert_array_equal(table['value'].to_numpy(),
+        long['value'].to_numpy(dtype=float))
+        table = self.conn.bdp(securities, ['NAME', 'PX_LAST'], output='arrow')
+        self.assertEqual(table['NAME'].to_pylist(), ['UNICREDIT SPA',
+        'INTESA SANPAOLO'])
+
+
+    @unittest.skipIf(pyarrow is None, 'pyarrow is not installed')
+    def test_bad_output(self):
+        with self.assertRaises(ValueError):
+            self.conn.bdp('UCG IM Equity', 'NAME', output='csv')
+        with self.assertRaises(ValueError):
+            self.conn.bdh('UCG IM Equity', 'PX_LAST', '20200101',
+            output='parquet')
+        self.assertEqual(self.session.requests, [])
+
+
+    def test_coalesced_calls(self):
+        conn = coalesce.Coalescer(self.conn, window=0.05)
+        calls = [(['UCG IM Equity'], ['NAME']), (['ISP IM Equity'], ['NAME',
+        'COUNTRY_FULL_NAME']), (['UCG IM Equity', 'UCT IM Equity'], ['NAME'])]
+        results = [None] * len(calls)
+        def call(i):
+            results[i] = conn.bdp(*calls[i], errors=True)
+        threads = [threading.Thread(target=call, args=(i, )) for i in
+        range(len(calls))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len([r for r in self.session.requests if
+        r.requestType == 'ReferenceDataRequest']), 1)
+        self.assertEqual(conn.stats['merged'], 2)
+        for (securities, fields), (data, err) in zip(calls, results):
+            data_, err_ = self.conn.bdp(securities, fields, errors=True)
+            pd.testing.assert_frame_equal(data, data_)
+            self.assertEqual(list(err.index), list(err_.index))
+
+
+    def test_coalesced_field_exceptions(self):
+        conn = coalesce.Coalescer(self.conn, window=0.05)
+        self.session.badFields.update(['NAMT', 'NAMX'])
+        calls = [(['UCG IM Equity'], ['NAME', 'NAMT']), (['UCG IM Equity'],
+        ['NAME', 'NAMX'])]
+        results = [None] * len(calls)
+        def call(i):
+            results[i] = conn.bdp(*calls[i], errors=True)
+        threads = [threading.Thread(target=call, args=(i, )) for i in
+        range(len(calls))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(conn.stats['requests'], 1)
+        for (securities, fields), (data, err) in zip(calls, results):
+            _, err_ = self.conn.bdp(securities, fields, errors=True)
+            pd.testing.assert_frame_equal(err, err_)
+            self.assertEqual(list(err['Field']), fields[1:])
+
+
+    def test_record_replay(self):
+        securities = ['UCG IM Equity', 'UCT IM Equity']
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, 'test.rec')
+            conn = blp.BLP(session=self.session, record=path)
+            data = conn.bdp(securities, ['NAME', 'PX_LAST'], overrides={
+            'EQY_FUND_CRNCY': 'EUR'}, errors=True)
+            hist = conn.bdh(securities, 'PX_LAST', '20200101', '20200131')
+            bars = conn.bdib('UCG IM Equity', '2020-01-06 09:00',
+            '2020-01-06 12:00', interval=5)
+            conn.close()
+            conn = blp.BLP(replay=path)
+            data_ = conn.bdp(securities, ['NAME', 'PX_LAST'], overrides={
+            'EQY_FUND_CRNCY': 'EUR'}, errors=True)
+            pd.testing.assert_frame_equal(data[0], data_[0])
+            pd.testing.assert_frame_equal(data[1], data_[1])
+            pd.testing.assert_frame_equal(hist, conn.bdh(securities,
+            'PX_LAST', '20200101', '20200131'))
+            pd.testing.assert_frame_equal(bars, conn.bdib('UCG IM Equity',
+            '2020-01-06 09:00', '2020-01-06 12:00', interval=5))
+            self.assertTrue(conn.bdp(securities, 'NAME', overrides={
+            'EQY_FUND_CRNCY': 'USD'}).empty)
+            self.assertEqual(conn.session.stats, {'hits': 4, 'misses': 1})
+            conn.close()
+
+
+    def test_field_exceptions(self):
+        securities = ['UCG IM Equity', 'UCT IM Equity']
+        self.session.badFields.add('NAMX')
+        fields = ['NAME', 'NAMT', 'NAMX']
+        _, err = self.conn.bdp(securities, fields, errors=True)
+        self.assertEqual(list(err.index), securities)
+        self.assertEqual(err.loc['UCG IM Equity', 'Field'], 'NAMX')
+        self.assertTrue(pd.isna(err.loc['UCT IM Equity', 'Field']))
+        _, err = self.conn.bdp(securities, fields, errors='fields')
+        self.assertEqual(list(err.index), ['UCG IM Equity', 'UCG IM Equity',
+        'UCT IM Equity'])
+        self.assertEqual(list(err['Field'][:2]), ['NAMT', 'NAMX'])
+        _, err = self.conn.bdh(securities, fields, '20200101', '20200131',
+        errors='fields', output='dict')
+        self.assertEqual([e['Field'] for e in err['UCG IM Equity']],
+        ['NAMT', 'NAMX'])
+
+
+    def test_dict_output(self):
+        securities = ['UCG IM Equity', 'UCT IM Equity', 'SEC1 Equity']
+        data, exceptions = self.conn.bdp(securities, ['NAME', 'PX_LAST'],
+        errors=True, output='dict')
+        frame = self.conn.bdp(securities, ['NAME', 'PX_LAST'])
+        self.assertEqual(data, {s: row.dropna().to_dict() for s, row in
+        frame.iterrows()})
+        self.assertEqual(exceptions['UCT IM Equity']['Category'], 'BAD_SEC')
+        self.assertEqual(self.conn.bdp(securities, 'NAME', swap=True,
+        output='dict'), {'NAME': {s: data[s]['NAME'] for s in
+        ['UCG IM Equity', 'SEC1 Equity']}})
+        data = self.conn.bdh(securities[1:], ['PX_LAST', 'PX_OPEN'],
+        '20200101', '20200131', output='dict')
+        frame = self.conn.bdh(securities[1:], ['PX_LAST', 'PX_OPEN'],
+        '20200101', '20200131')
+        self.assertEqual(list(data), ['SEC1 Equity'])
+        self.assertEqual(data['SEC1 Equity']['PX_LAST'],
+        frame[('SEC1 Equity', 'PX_LAST')].tolist())
+        self.assertEqual(data['SEC1 Equity']['date'],
+        [d.date() for d in frame.index])
+        long = self.conn.bdh(securities[1:], ['PX_LAST', 'PX_OPEN'],
+        '20200101', '20200131', long=True, output='dict')
+        self.assertEqual(len(long['value']), frame.size)
+
+
+    def test_daemon(self):
+        path = os.path.join(tempfile.mkdtemp(), 'blpd.sock')
+        server = daemon.Daemon(path, conn=self.conn)
+        server.start()
+        try:
+            with daemon.Client(path) as client:
+                self.assertEqual(client.bdp(['UCG IM Equity', 'SEC1 Equity'],
+                'NAME'), self.conn.bdp(['UCG IM Equity', 'SEC1 Equity'],
+                'NAME', output='dict'))
+                data, exceptions = client.bdh('SEC1 Equity', 'PX_LAST',
+                '20200101', '20200131', errors=True)
+                self.assertEqual(data, self.conn.bdh('SEC1 Equity',
+                'PX_LAST', '20200101', '20200131', output='dict'))
+                self.assertEqual(exceptions, {})
+                with self.assertRaises(RuntimeError):
+                    client._call('close', [], {})
+        finally:
+            server.close()
+        self.assertEqual(server.stats['calls'], 2)
+
+
+    def test_daemon_socket(self):
+        folder = tempfile.mkdtemp()
+        path = os.path.join(folder, 'blpd.sock')
+        with open(path, 'w') as f:
+            f.write('not a socket')
+        with self.assertRaises(FileExistsError):
+            daemon.Daemon(path, conn=self.conn)
+        os.remove(path)
+        stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stale.bind(path)
+        stale.close()
+        server = daemon.Daemon(path, conn=self.conn)
+        self.assertEqual(os.stat(path).st_mode & 0o777, 0o600)
+        with self.assertRaises(FileExistsError):
+            daemon.Daemon(path, conn=self.conn)
+        server.close()
+        environ = dict(os.environ)
+        os.environ.pop('XDG_RUNTIME_DIR', None)
+        try:
+            path = daemon.socketPath()
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+        self.assertEqual(os.stat(os.path.dirname(path)).st_mode & 0o777,
+        0o700)
+
+
+    def test_lazy_imports(self):
+        code = ('import sys, blpd.daemon; print("blpapi" in sys.modules); '
+                'import blpd.blp; print("pandas.core" in sys.modules)')
+        output = subprocess.run([sys.executable, '-c', code],
+        capture_output=True, text=True, check=True).stdout.split()
+        self.assertEqual(output, ['False', 'False'])
+
+
+    def test_compact(self):
+        securities = [f'SEC{i} Equity' for i in range(20)]
+        conn = blp.BLP(session=fake.FakeSession(missing=0.7,
+        fixtures={'fields': {'PX_OPEN': 'Float32'}}))
+        data = conn.bdh(securities, ['PX_LAST', 'PX_OPEN'], '20190101',
+        '20191231')
+        data_ = conn.bdh(securities, ['PX_LAST', 'PX_OPEN'], '20190101',
+        '20191231', compact='sparse')
+        self.assertEqual(data_[('SEC1 Equity', 'PX_OPEN')].dtype,
+        pd.SparseDtype(np.float32, np.nan))
+        self.assertEqual(data_[('SEC1 Equity', 'PX_LAST')].dtype,
+        pd.SparseDtype(float, np.nan))
+        np.testing.assert_allclose(np.asarray(data_, dtype=float),
+        data.to_numpy(), rtol=1e-6)
+        self.assertLess(data_.memory_usage(deep=True).sum(),
+        data.memory_usage(deep=True).sum() / 2)
+        long = conn.bdh(securities, ['PX_LAST', 'PX_OPEN'], '20190101',
+        '20191231', long=True, compact=True)
+        self.assertIsInstance(long['security'].dtype, pd.CategoricalDtype)
+        self.assertEqual(len(long), data.notna().sum().sum())
+        conn.close()
+        conn = blp.BLP(session=fake.FakeSession(fixtures={'reference': {
+        s: {'NAME': f'NAME {s}', 'CRNCY': 'EUR', 'PX_LAST': '10.25'}
+        for s in securities}}))
+        data = conn.bdp(securities, ['NAME', 'CRNCY', 'PX_LAST'],
+        compact=True)
+        self.assertIsInstance(data['CRNCY'].dtype, pd.CategoricalDtype)
+        self.assertNotIsInstance(data['NAME'].dtype, pd.CategoricalDtype)
+        self.assertEqual(data['PX_LAST'].dtype, float)
+        data = conn.bdp(securities, ['NAME', 'CRNCY', 'PX_LAST'],
+        compact=True, lossyFloats=True)
+        self.assertEqual(data['PX_LAST'].dtype, np.float32)
+        conn.close()
+
+
+    def test_metrics(self):
+        records = []
+        counters = metrics.Counters()
+        self.conn.metrics = lambda r: (records.append(r), counters(r))
+        securities = [f'SEC{i} Equity' for i in range(5)]
+        self.conn.bdp(securities, ['PX_LAST', 'PX_OPEN'], chunkSecs=2)
+        self.conn.bdh(securities, 'PX_LAST', '20200101', '20200131')
+        self.assertEqual([r['call'] for r in records], ['bdp', 'bdh'])
+        self.assertEqual([r['requests'] for r in records], [3, 1])
+        self.assertEqual([r['messages'] for r in records], [5, 5])
+        self.assertEqual(records[0]['partial'], 2)
+        self.assertEqual(records[0]['cells'], 10)
+        self.assertTrue(all(r['total'] >= r['wait'] + r['parse'] for r in
+        records))
+        self.assertIn('blpd_requests_total{call="bdp"} 3', counters.text())
+
+
+    def test_metrics_field_lookup(self):
+        records = []
+        conn = blp.BLP(session=fake.FakeSession(latency=0.05),
+                       metrics=records.append)
+        conn.bdp('SEC1 Equity', 'PX_LAST')
+        conn.bdp('SEC1 Equity', 'PX_LAST')
+        self.assertGreaterEqual(records[0]['fields'], 0.05)
+        self.assertLess(records[1]['fields'], 0.05)
+        self.assertLessEqual(records[0]['firstEvent'] + records[0]['fields'],
+        records[0]['total'])
+        conn.close()
+
+
+    def test_bdp_typed(self):
+        session = fake.FakeSession(fixtures={'fields': {'VOLUME': 'Int64',
+        'MATURITY': 'Date'}, 'reference': {'A Corp': {'NAME': 'A',
+        'VOLUME': '10', 'MATURITY': '2030-01-15', 'CPN': '1.5'}, 'B Corp':
+        {'NAME': 'B', 'VOLUME': '20', 'CPN': '2'}}})
+        with tempfile.TemporaryDirectory() as folder:
+            fieldCache = cache.FieldCache(os.path.join(folder, 'test.sqlite'))
+            conn = blp.BLP(session=session, fieldCache=fieldCache)
+            fields = ['NAME', 'VOLUME', 'MATURITY', 'CPN']
+            data = conn.bdp(['A Corp', 'B Corp'], fields)
+            conn.bdp(['A Corp'], fields)
+            self.assertEqual(list(data.dtypes[1:]), [np.int64,
+            np.dtype('datetime64[ns]'), float])
+            self.assertEqual(data.loc['A Corp', 'NAME'], 'A')
+            self.assertTrue(pd.isna(data.loc['B Corp', 'MATURITY']))
+            conn = blp.BLP(session=session, fieldCache=fieldCache)
+            self.assertEqual(conn.fieldInfo(fields + ['NAMT'])['VOLUME'],
+            'Int64')
+            fieldCache.close()
+        self.assertEqual([r.lists['id'] for r in session.requests if
+        r.requestType == 'FieldInfoRequest'], [fields, ['NAMT']])
+
+
+    def test_field_service_unavailable(self):
+        session = fake.FakeSession()
+        session.closedServices.add('//blp/apiflds')
+        conn = blp.BLP(session=session)
+        data = conn.bdp('SEC1 Equity', ['NAME', 'PX_LAST'])
+        conn.bdp('SEC1 Equity', ['NAME', 'PX_LAST'])
+        self.assertEqual(data['PX_LAST'].dtype, float)
+        self.assertEqual(session.services.count('//blp/apiflds'), 1)
+        self.assertEqual(conn.fieldInfo('PX_LAST'), {'PX_LAST': None})
+        conn.close()
+
+
+    def test_bds_chunked(self):
+        securities = [f'IDX{i} Index' for i in range(5)]
+        data = self.conn.bds(securities, 'INDX_MWEIGHT')
+        data_ = self.conn.bds(securities, 'INDX_MWEIGHT', chunkSecs=2)
+        pd.testing.assert_frame_equal(data, data_)
+        self.assertEqual(data.shape, (5 * 50, 2))
+        self.assertEqual(data.index.names, ['security', 'row'])
+        self.assertEqual(data['Percentage Weight'].dtype, float)
+        self.assertAlmostEqual(data.loc['IDX0 Index', 'Percentage Weight']
+        .sum(), 100., places=3)
+
+
+    def test_bds_element_types(self):
+        rows = [{'Code': '0005', 'Weight': 1.5, 'Shares': 10,
+                 'Date': datetime.date(2020, 1, 2)},
+                {'Code': '0700', 'Weight': 2.5, 'Shares': 20,
+                 'Date': datetime.date(2020, 1, 3)}]
+        conn = blp.BLP(session=fake.FakeSession(fixtures={'bulk': {
+                       'IDX Index': {'INDX_MEMBERS': rows}}}))
+        data = conn.bds('IDX Index', 'INDX_MEMBERS')
+        self.assertEqual(list(data['Code']), ['0005', '0700'])
+        self.assertEqual(data['Weight'].dtype, float)
+        self.assertEqual(data['Shares'].dtype, np.int64)
+        self.assertEqual(data['Date'].dtype, 'datetime64[ns]')
+        conn.close()
+
+
+    def test_bdh_chunked_swapped(self):
+        securities = [f'SEC{i} Equity' for i in range(5)]
+        data = self.conn.bdh(securities, ['PX_LAST', 'PX_OPEN'], '20200101',
+        '20200630', swap=True)
+        data_ = self.conn.bdh(securities, ['PX_LAST', 'PX_OPEN'], '20200101',
+        '20200630', swap=True, chunkSecs=2, chunkFlds=1)
+        pd.testing.assert_frame_equal(data, data_)
+        self.assertEqual(data.shape, (130, 10))
+        self.assertIsInstance(data.index, pd.DatetimeIndex)
+
+
+    def test_bdh_long(self):
+        data = self.conn.bdh(['SEC1 Equity', 'SEC2 Equity'], 'PX_LAST',
+        '20200101', '20200131', long=True)
+        self.assertTrue(pd.api.types.is_datetime64_any_dtype(data['date']))
+        self.assertEqual(len(data), 46)
+        data = self.conn.bdh('UCT IM Equity', 'PX_LAST', '20200101',
+        '20200131', long=True)
+        self.assertEqual(list(data.columns), ['date', 'security', 'field',
+        'value'])
+        self.assertEqual(len(data), 0)
+
+
+    def test_backfill(self):
+        securities = [f'SEC{i} Equity' for i in range(5)]
+        with tempfile.TemporaryDirectory() as folder:
+            job = backfill.Backfill(securities, ['PX_LAST', 'PX_OPEN'],
+            '20180101', '20191231', folder, chunkSecs=2, chunkYears=1,
+            processes=2, session=fake.FakeSession, fmt='pickle')
+            stats = job.run()
+            self.assertEqual((stats['total'], stats['done']), (6, 6))
+            data = self.conn.bdh(securities, ['PX_LAST', 'PX_OPEN'],
+            '20180101', '20191231', long=True)
+            pd.testing.assert_frame_equal(job.read(), data.sort_values(
+            ['security', 'field', 'date'], ignore_index=True),
+            check_dtype=False)
+            job = backfill.Backfill(securities, ['PX_LAST', 'PX_OPEN'],
+            '20180101', '20191231', folder, chunkSecs=2, chunkYears=1,
+            processes=2, session=fake.FakeSession, fmt='pickle')
+            stats = job.run()
+            self.assertEqual((stats['skipped'], stats['done']), (6, 0))
+
+
+    def test_backfill_failed_unit(self):
+        securities = [f'SEC{i} Equity' for i in range(8)]
+        with tempfile.TemporaryDirectory() as folder:
+            job = backfill.Backfill(securities, 'PX_LAST', '20190101',
+            '20191231', folder, chunkSecs=1, processes=2,
+            session=FailingSession, fmt='pickle', options={'typed': False})
+            stats = job.run()
+            self.assertEqual((stats['done'], stats['failed']), (7, 1))
+            self.assertEqual(list(job.manifest['failed']), ['00003'])
+            self.assertIn('ConnectionError', job.manifest['failed']['00003'])
+            job = backfill.Backfill(securities, 'PX_LAST', '20190101',
+            '20191231', folder, chunkSecs=1, processes=2,
+            session=fake.FakeSession, fmt='pickle', options={'typed': False})
+            self.assertEqual([u['id'] for u in job.pending()], ['00003'])
+            stats = job.run()
+            self.assertEqual((stats['skipped'], stats['done']), (7, 1))
+            self.assertEqual(job.manifest['failed'], {})
+
+
+    def test_bdh_iter(self):
+        securities = ['SEC1 Equity', 'UCT IM Equity', 'SEC2 Equity']
+        data = self.conn.bdh(securities, 'PX_LAST', '20200101', '20200131')
+        names = []
+        for name, block, err in self.conn.bdhIter(securities, 'PX_LAST',
+        '20200101', '20200131', errors=True, chunkSecs=2):
+            names.append(name)
+            if name == 'UCT IM Equity':
+                self.assertEqual(list(err['Category']), ['BAD_SEC'])
+            else:
+                pd.testing.assert_frame_equal(block, data[name])
+        self.assertEqual(names, securities)
+        name, block = next(self.conn.bdhIter(securities, 'PX_LAST',
+        '20200101', '20200131', long=True))
+        self.assertEqual(list(block.columns), ['date', 'security', 'field',
+        'value'])
+        self.assertEqual(len(block), len(data))
+
+
+    def test_bdib_chunked(self):
+        data = self.conn.bdib('UCG IM Equity', '2020-01-06 08:00',
+        '2020-01-08 17:00', interval=5)
+        data_ = self.conn.bdib('UCG IM Equity', '2020-01-06 08:00',
+        '2020-01-08 17:00', interval=5, chunkDays=0.5)
+        pd.testing.assert_frame_equal(data, data_)
+        self.assertEqual(len(data), 3 * 102)
+        self.assertEqual(data['volume'].dtype, np.int64)
+
+
+    def test_bdit_chunked(self):
+        data = self.conn.bdit('UCG IM Equity', '2020-01-06', '2020-01-08')
+        data_ = self.conn.bdit('UCG IM Equity', '2020-01-06', '2020-01-08',
+        chunkDays=0.25)
+        pd.testing.assert_frame_equal(data, data_)
+        self.assertEqual(list(data.columns), ['type', 'value', 'size'])
+        self.assertTrue(data.index.is_monotonic_increasing)
+
+
+    def test_async_bdp_concurrent_calls(self):
+        conn = aio.AsyncBLP(session=fake.FakeSession(fixtures=FIXTURES))
+        async def calls():
+            return(await asyncio.gather(*[conn.bdp(['UCG IM Equity',
+            'ISP IM Equity'], 'NAME', chunkSecs=1) for _ in range(10)]))
+        results = asyncio.run(calls())
+        conn.close()
+        for data in results:
+            pd.testing.assert_frame_equal(data, self.conn.bdp(
+            ['UCG IM Equity', 'ISP IM Equity'], 'NAME'))
+
+
+    def test_async_cancel_and_session_down(self):
+        session = SilentSession()
+        conn = aio.AsyncBLP(session=session, typed=False)
+        async def calls():
+            task = asyncio.ensure_future(conn.bdp('SEC1 Equity', 'PX_LAST'))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            self.assertEqual(conn._pending, {})
+            task = asyncio.ensure_future(conn.bdp('SEC1 Equity', 'PX_LAST'))
+            await asyncio.sleep(0.05)
+            session.disconnect()
+            with self.assertRaises(ConnectionError):
+                await asyncio.wait_for(task, 5)
+        asyncio.run(calls())
+        with self.assertRaises(NotImplementedError):
+            conn.bds('SEC1 Equity', 'INDX_MEMBERS')
+        conn.close()
+
+
+    def test_history_cache_top_up(self):
+        path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+        history = cache.HistoryCache(self.conn, path)
+        history.bdh('SEC1 Equity', 'PX_LAST', '20200101', '20200331')
+        history.bdh('SEC1 Equity', 'PX_LAST', '20200101', '20200630')
+        self.assertEqual(self.session.requests[-1].options['startDate'],
+        '20200401')
+        data = history.bdh('SEC1 Equity', 'PX_LAST', '20200201', '20200531')
+        data_ = self.conn.bdh('SEC1 Equity', 'PX_LAST', '20200201', '20200531')
+        pd.testing.assert_frame_equal(data, data_)
+        self.assertEqual(history.stats['hits'], 1)
+        history.close()
+
+
+    def test_history_cache_empty(self):
+        path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+        history = cache.HistoryCache(self.conn, path)
+        data, err = history.bdh('UCT IM Equity', 'PX_LAST', '20200101',
+        '20200110', errors=True)
+        self.assertEqual(data.shape, (0, 0))
+        self.assertEqual(err.loc['UCT IM Equity', 'Category'], 'BAD_SEC')
+        history.bdh('SEC1 Equity', 'PX_LAST', '20200101', '20200110')
+        requests = len(self.session.requests)
+        data = history.bdh('SEC1 Equity', 'PX_LAST', '20200104', '20200105')
+        self.assertEqual(len(self.session.requests), requests)
+        self.assertEqual(data.shape, (0, 0))
+        pd.testing.assert_frame_equal(data, self.conn.bdh('SEC1 Equity',
+        'PX_LAST', '20200104', '20200105'))
+        history.close()
+
+
+    def test_history_cache_typed_and_errors(self):
+        path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+        fixtures = {'fields': {'VOLUME': 'Int64'}, 'historical': {
+                    'SEC1 Equity': {'VOLUME': {'2020-01-02': '10',
+                                               '2020-01-03': '12'}}}}
+        conn = blp.BLP(session=fake.FakeSession(fixtures=fixtures),
+        typed=False)
+        history = cache.HistoryCache(conn, path)
+        history.bdh('SEC1 Equity', 'VOLUME', '20200101', '20200131')
+        history.close()
+        conn.close()
+        history = cache.HistoryCache(blp.BLP(session=fake.FakeSession(
+        fixtures=fixtures)), path)
+        data = history.bdh('SEC1 Equity', 'VOLUME', '20200102', '20200103')
+        self.assertEqual(data[('SEC1 Equity', 'VOLUME')].tolist(), [10, 12])
+        self.assertEqual(data[('SEC1 Equity', 'VOLUME')].dtype, np.int64)
+        history.close()
+        history = cache.HistoryCache(self.conn, path)
+        fields = ['PX_LAST', 'NAMT', 'NAMX']
+        self.session.badFields.add('NAMX')
+        _, err = history.bdh('SEC1 Equity', fields, '20200101', '20200131',
+        errors='fields')
+        self.assertEqual(list(err['Field']), ['NAMT', 'NAMX'])
+        _, err = history.bdh('SEC1 Equity', fields, '20200101', '20200131',
+        errors=True)
+        self.assertEqual(self.session.requests[-1].lists['fields'],
+        ['NAMT', 'NAMX'])
+        self.assertEqual(list(err['Field']), ['NAMX'])
+        history.close()
+
+
+    def test_reference_cache_negative_results(self):
+        self.conn.memo = cache.ReferenceCache()
+        data, err = self.conn.bdp(['UCT IM Equity', 'UCG IM Equity'],
+        ['NAME', 'NAMT'], errors=True)
+        requests = len(self.session.requests)
+        data_, err_ = self.conn.bdp(['UCT IM Equity', 'UCG IM Equity'],
+        ['NAME', 'NAMT'], errors=True)
+        self.assertEqual(len(self.session.requests), requests)
+        pd.testing.assert_frame_equal(data, data_)
+        pd.testing.assert_frame_equal(err, err_)
+        self.assertEqual(self.conn.memo.hitRate(), 0.5)
+
+
+
+class TestFakeBLPPool(unittest.TestCase):
+
+
+    def setUp(self):
+        self.sessions = [fake.FakeSession(latency=0.01) for _ in range(3)]
+        self.conn = pool.BLPPool(sessions=self.sessions, retries=2,
+        healthInterval=60.)
+
+
+    def tearDown(self):
+        self.conn.close()
+
+
+    def test_submit_spreads_calls(self):
+        securities = [f'SEC{i} Equity' for i in range(6)]
+        futures = [self.conn.submit('bdp', s, 'PX_LAST') for s in securities]
+        data = pd.concat([f.result() for f in futures])
+        self.assertEqual(list(data.index), securities)
+        self.assertTrue(all(len(s.requests) > 0 for s in self.sessions))
+
+
+    def test_failover_and_reconnect(self):
+        data = self.conn.bdp('UCG IM Equity', 'PX_LAST')
+        self.sessions[0].disconnect()
+        self.sessions[1].disconnect()
+        for _ in range(3):
+            pd.testing.assert_frame_equal(self.conn.bdp('UCG IM Equity',
+            'PX_LAST'), data)
+        self.assertEqual(self.conn.healthy, [False, False, True])
+        self.assertEqual(self.conn.stats['failovers'], 2)
+        self.assertEqual(self.conn.check(), [True, True, True])
+
+
+class TestScheduler(unittest.TestCase):
+
+
+    def test_rate_limit(self):
+        limiter = scheduler.Scheduler(requestRate=50., requestBurst=1.,
+        hitRate=1000.)
+        conn = blp.BLP(session=fake.FakeSession(), scheduler=limiter,
+        typed=False)
+        start = time.perf_counter()
+        conn.bdp([f'SEC{i} Equity' for i in range(6)], ['PX_LAST', 'PX_OPEN'],
+        chunkSecs=1)
+        self.assertGreater(time.perf_counter() - start, 5 / 50. * 0.9)
+        self.assertEqual(limiter.stats['requests'], 6)
+        self.assertEqual(limiter.stats['hits'], 12)
+        self.assertEqual(limiter.outstanding, 0)
+
+
+    def test_release_on_failed_send(self):
+        limiter = scheduler.Scheduler(maxOutstanding=1)
+        session = fake.FakeSession()
+        conn = blp.BLP(session=session, scheduler=limiter, typed=False)
+        session.disconnect()
+        with self.assertRaises(ConnectionError):
+            conn.bdp('SEC1 Equity', 'PX_LAST')
+        self.assertEqual(limiter.outstanding, 0)
+
+
+    def test_async_release_on_cancelled_acquire(self):
+        limiter = scheduler.Scheduler(requestRate=5., requestBurst=1.)
+        conn = aio.AsyncBLP(session=fake.FakeSession(), scheduler=limiter,
+        typed=False)
+        limiter.acquire()
+        limiter.release()
+        async def calls():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(conn.bdp('SEC1 Equity', 'PX_LAST'),
+                0.05)
+            await asyncio.sleep(0.3)
+        asyncio.run(calls())
+        self.assertEqual(limiter.stats['requests'], 2)
+        self.assertEqual(limiter.outstanding, 0)
+        self.assertEqual(conn._pending, {})
+        conn.close()
+
+
+    def test_hit_debt(self):
+        limiter = scheduler.Scheduler(hitRate=100., hitBurst=10.)
+        limiter.acquire(50)
+        limiter.release()
+        start = time.perf_counter()
+        limiter.acquire(1)
+        self.assertGreater(time.perf_counter() - start, 41 / 100. * 0.9)
+        self.assertEqual(limiter.stats['hits'], 51)
+
+
+    def test_priority(self):
+        limiter = scheduler.Scheduler(maxOutstanding=1)
+        limiter.acquire()
+        order = []
+        def call(priority):
+            limiter.acquire(priority=priority, caller=priority)
+            order.append(priority)
+            limiter.release()
+        threads = []
+        for priority in (scheduler.BACKFILL, scheduler.INTERACTIVE):
+            threads.append(threading.Thread(target=call, args=(priority, )))
+            threads[-1].start()
+            while(limiter.depth < len(threads)):
+                time.sleep(0.001)
+        limiter.release()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(order, [scheduler.INTERACTIVE, scheduler.BACKFILL])
+        self.assertEqual(limiter.stats['maxDepth'], 2)
+
+
+class TestFakeSubscription(unittest.TestCase):
+
+
+    def setUp(self):
+        self.session = fake.FakeSession(badSecurities=['UCT IM Equity'])
+        self.updates = []
+        self.conn = subscription.Subscription(session=self.session, depth=3,
+        callback=lambda sec, values: self.updates.append(sec))
+
+
+    def tearDown(self):
+        self.conn.close()
+
+
+    def _wait(self, ticks):
+        for _ in range(100):
+            if len(self.updates) >= ticks:
+                break
+            time.sleep(0.01)
+
+
+    def test_snapshot_and_ticks(self):
+        self.conn.subscribe(['UCG IM Equity', 'UCT IM Equity'], ['LAST_PRICE',
+        'BID'])
+        self.session.publish(5)
+        self._wait(5)
+        data = self.conn.snapshot()
+        self.assertEqual(list(data.columns), ['LAST_PRICE', 'BID'])
+        self.assertTrue(data.loc['UCG IM Equity'].notna().all())
+        self.assertTrue(data.loc['UCT IM Equity'].isna().all())
+        self.assertEqual(self.conn.status['UCT IM Equity'],
+        'SubscriptionFailure')
+        ticks = self.conn.ticks('UCG IM Equity')
+        self.assertEqual(len(ticks), 3)
+        self.assertEqual(list(ticks.iloc[-1]), list(data.loc['UCG IM Equity']))
+
+
+    def test_unsubscribe_and_subscribe_again(self):
+        self.conn.subscribe(['UCG IM Equity', 'ISP IM Equity'], 'LAST_PRICE')
+        self.conn.unsubscribe('ISP IM Equity')
+        self.conn.subscribe('UCG IM Equity', ['LAST_PRICE', 'BID'])
+        self.assertEqual([t[0] for t in self.session.topics.values()],
+        ['UCG IM Equity'])
+        self.conn.unsubscribe()
+        self.assertEqual(self.session.topics, {})
+        self.conn.subscribe('ISP IM Equity', 'LAST_PRICE')
+        self.assertEqual(list(self.session.topics.values()),
+        [('ISP IM Equity', ['LAST_PRICE', 'BID'])])
+
+
+    def test_string_then_numeric_value(self):
+        self.conn.subscribe('UCG IM Equity', 'LAST_PRICE')
+        for value in ['N.A.', '1.50']:
+            self.conn._update(0, fake.FakeMessage('MarketDataEvents',
+            None, [fake.FakeElement('LAST_PRICE', value)]))
+            if value == 'N.A.':
+                self.assertEqual(self.conn.snapshot().iat[0, 0], 'N.A.')
+        self.assertEqual(self.conn.strings, {})
+        self.assertEqual(self.conn.snapshot().iat[0, 0], 1.5)
+
+
+    def test_null_elements_and_failing_callback(self):
+        self.conn.subscribe('UCG IM Equity', ['LAST_PRICE', 'BID'])
+        self.session.publish(1)
+        self._wait(1)
+        last = list(self.conn.snapshot().loc['UCG IM Equity'])
+        def fail(sec, values):
+            self.updates.append(values)
+            raise RuntimeError('callback failure')
+        self.conn.callback = fail
+        with self.assertLogs('blpd', 'ERROR'):
+            self.session.publish(2, nulls=['LAST_PRICE'])
+            self._wait(3)
+        self.assertTrue(self.conn._thread.is_alive())
+        self.assertTrue(all(np.isnan(v['LAST_PRICE']) for v in
+                        self.updates[1:]))
+        data = self.conn.snapshot().loc['UCG IM Equity']
+        self.assertEqual(data['LAST_PRICE'], last[0])
+        self.assertNotEqual(data['BID'], last[1])
+        self.assertEqual(self.conn.strings, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -10,10 +10,16 @@ setup(name='blpd',
       author_email='bonifacio.marco@gmail.com',
       license='MIT',
       packages=['blpd'],
+      python_requires='>=3.7',
       install_requires=[
       'blpapi',
+      'numpy',
       'pandas',
       ],
+      extras_require={
+      'arrow': ['pyarrow'],
+      'polars': ['pyarrow', 'polars'],
+      },
       test_suite='nose.collector',
       tests_require=['nose'],
       include_package_data=True,